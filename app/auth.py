@@ -1,23 +1,162 @@
+import functools
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple, Union
+
 import bcrypt
 
+# Стоимость bcrypt (log2 раундов). Хэши с меньшей стоимостью перехэшируются при входе.
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "10"))
+
+# Локальные ссылки на функции bcrypt: без поиска атрибута модуля на каждом вызове
+_checkpw = bcrypt.checkpw
+_hashpw = bcrypt.hashpw
+_gensalt = bcrypt.gensalt
+_GENSALT = functools.partial(_gensalt, rounds=BCRYPT_ROUNDS)
+
+# Кэш успешных проверок пароля: повторный вход с тем же паролем не гоняет bcrypt.
+# Ключ — sha256(пароль) + sha256(хэш), открытый пароль в кэше не хранится.
+_VERIFY_CACHE_SIZE = 256
+_VERIFY_CACHE_TTL = 15 * 60  # секунд, после этого кэш сбрасывается целиком
+
+_verify_cache: "OrderedDict[bytes, None]" = OrderedDict()
+_verify_cache_started = time.monotonic()
+_verify_cache_lock = threading.Lock()
+
+
+def _verify_cache_key(pw: bytes, hashed: bytes) -> bytes:
+    return hashlib.sha256(pw).digest() + hashlib.sha256(hashed).digest()
+
+
+def _verify_cache_rotate() -> None:
+    global _verify_cache_started
+    now = time.monotonic()
+    if now - _verify_cache_started > _VERIFY_CACHE_TTL:
+        _verify_cache.clear()
+        _verify_cache_started = now
+
+
+def _verify_cache_hit(key: bytes) -> bool:
+    with _verify_cache_lock:
+        _verify_cache_rotate()
+        if key in _verify_cache:
+            _verify_cache.move_to_end(key)
+            return True
+        return False
+
+
+def _verify_cache_put(key: bytes) -> None:
+    with _verify_cache_lock:
+        _verify_cache[key] = None
+        _verify_cache.move_to_end(key)
+        while len(_verify_cache) > _VERIFY_CACHE_SIZE:
+            _verify_cache.popitem(last=False)
+
+
+def _password_bytes(password: str) -> bytes:
+    # bcrypt ограничивает вход 72 байтами; сначала режем по символам,
+    # чтобы не кодировать целиком очень длинную строку
+    pw = password[:72]
+    if pw.isascii():
+        # ASCII: символ = байт, 72 символа уже укладываются в лимит
+        return pw.encode("ascii")
+    return pw.encode("utf-8")[:72]
+
+
+def hash_password_bytes(password: str, rounds: int = BCRYPT_ROUNDS) -> bytes:
+    pw = _password_bytes(password)
+
+    salt = _GENSALT() if rounds == BCRYPT_ROUNDS else _gensalt(rounds=rounds)
+    return _hashpw(pw, salt)
+
 
-def hash_password(password: str) -> str:
-    pw = password.encode("utf-8")
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    # алфавит bcrypt — ./A-Za-z0-9 и $, так что ASCII-декодирования достаточно
+    return hash_password_bytes(password, rounds).decode("ascii")
 
-    # bcrypt ограничивает вход 72 байтами
-    if len(pw) > 72:
-        pw = pw[:72]
 
-    salt = bcrypt.gensalt(rounds=12)
-    hashed = bcrypt.hashpw(pw, salt)
-    return hashed.decode("utf-8")
+# Хэш bcrypt: $2b$NN$ + 22 символа соли + 31 символ хэша = 60 символов
+_BCRYPT_PREFIXES = (b"$2a$", b"$2b$", b"$2y$")
+_BCRYPT_HASH_LEN = 60
 
 
-def verify_password(password: str, password_hash: str) -> bool:
+def _hash_as_bytes(password_hash: Union[str, bytes]) -> Optional[bytes]:
+    if isinstance(password_hash, (bytes, bytearray)):
+        return bytes(password_hash)
+    if not password_hash or not password_hash.isascii():
+        return None
+    return password_hash.encode("ascii")
+
+
+def _is_bcrypt_hash(hashed: bytes) -> bool:
+    return (
+        len(hashed) == _BCRYPT_HASH_LEN
+        and hashed[:4] in _BCRYPT_PREFIXES
+        and hashed[6:7] == b"$"
+    )
+
+
+def verify_password(password: str, password_hash: Union[str, bytes]) -> bool:
+    # битый хэш в БД отсекаем до входа в bcrypt
+    hashed = _hash_as_bytes(password_hash)
+    if hashed is None or not _is_bcrypt_hash(hashed):
+        return False
+
+    pw = _password_bytes(password)
+
+    key = _verify_cache_key(pw, hashed)
+    if _verify_cache_hit(key):
+        return True
+
+    # в кэш попадают только успешные проверки
     try:
-        pw = password.encode("utf-8")
-        if len(pw) > 72:
-            pw = pw[:72]
-        return bcrypt.checkpw(pw, password_hash.encode("utf-8"))
-    except Exception:
+        ok = _checkpw(pw, hashed)
+    except ValueError:
+        # некорректная соль при правильном формате
         return False
+    if ok:
+        _verify_cache_put(key)
+    return ok
+
+
+def _hash_rounds(password_hash: Union[str, bytes]) -> Optional[int]:
+    # формат: $2b$NN$<salt+hash>
+    hashed = _hash_as_bytes(password_hash)
+    if hashed is None or not _is_bcrypt_hash(hashed):
+        return None
+    try:
+        return int(hashed[4:6])
+    except ValueError:
+        return None
+
+
+def verify_and_maybe_rehash(password: str, password_hash: Union[str, bytes]) -> Tuple[bool, Optional[str]]:
+    """Проверяет пароль; если стоимость хэша ниже BCRYPT_ROUNDS — возвращает новый хэш для сохранения."""
+    if not verify_password(password, password_hash):
+        return False, None
+
+    rounds = _hash_rounds(password_hash)
+    if rounds is not None and rounds < BCRYPT_ROUNDS:
+        return True, hash_password(password)
+    return True, None
+
+
+def hash_passwords_bulk(passwords: List[str]) -> List[str]:
+    """Хэширует пачку паролей параллельно (bcrypt отпускает GIL, потоков хватает)."""
+    if len(passwords) < 2:
+        return [hash_password(p) for p in passwords]
+    # потоков не больше, чем паролей: для сида из трёх пользователей — три
+    with ThreadPoolExecutor(max_workers=min(len(passwords), os.cpu_count() or 1)) as ex:
+        return list(ex.map(hash_password, passwords))
+
+
+def verify_passwords_bulk(password: str, password_hashes: List[str]) -> List[bool]:
+    """Проверяет один пароль против множества хэшей параллельно."""
+    if len(password_hashes) < 2:
+        return [verify_password(password, h) for h in password_hashes]
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+        return list(ex.map(functools.partial(verify_password, password), password_hashes))
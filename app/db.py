@@ -1,4 +1,4 @@
-from peewee import PostgresqlDatabase
+from playhouse.pool import PooledPostgresqlExtDatabase
 
 # === НАСТРОЙКИ БД: правь тут ===
 DB_NAME = "library_db"
@@ -7,11 +7,17 @@ DB_PASSWORD = "1234"
 DB_HOST = "localhost"
 DB_PORT = 5432
 
-db = PostgresqlDatabase(
+# Пул: повторный вход и фоновые потоки берут готовое соединение вместо нового TCP+auth
+DB_MAX_CONNECTIONS = 8
+DB_STALE_TIMEOUT = 300
+
+db = PooledPostgresqlExtDatabase(
     DB_NAME,
     user=DB_USER,
     password=DB_PASSWORD,
     host=DB_HOST,
     port=DB_PORT,
     autorollback=True,
+    max_connections=DB_MAX_CONNECTIONS,
+    stale_timeout=DB_STALE_TIMEOUT,
 )
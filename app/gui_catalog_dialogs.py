@@ -1,34 +1,51 @@
+import re
 import tkinter as tk
 from tkinter import ttk, messagebox
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Callable
+
+from app.services_catalog import PublisherRow, AuthorRow, LocationRow
+
+
+# Проверяем формат заранее, чтобы не ловить ValueError на каждом пустом/кривом поле
+# как у int()/float(): знак + или -, для цены ещё и показатель степени (1e3); inf/nan не принимаем
+_INT_RE = re.compile(r"[+-]?[0-9]+")
+_FLOAT_RE = re.compile(r"[+-]?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][+-]?[0-9]+)?")
 
 
 def _to_int_or_none(s: str) -> Optional[int]:
     s = (s or "").strip()
     if not s:
         return None
-    try:
+    if _INT_RE.fullmatch(s):
         return int(s)
-    except ValueError:
-        return None
+    return None
 
 
 def _to_float_or_none(s: str) -> Optional[float]:
     s = (s or "").strip()
     if not s:
         return None
-    try:
+    if _FLOAT_RE.fullmatch(s):
         return float(s)
-    except ValueError:
-        return None
+    return None
+
+
+def _iget(d: Optional[Dict[str, Any]], key: str, default: Any = "", cast: Callable[[Any], Any] = lambda x: x) -> Any:
+    """Значение поля из initial-словаря диалога; None/нет ключа -> default"""
+    v = d.get(key) if d else None
+    return default if v is None else cast(v)
+
+
+# Сколько авторов максимум держим в дереве одновременно
+_AUTHORS_SHOWN_MAX = 200
 
 
 class BookDialog(tk.Toplevel):
     def __init__(
         self,
         parent,
-        publishers: List[Dict[str, Any]],
-        authors: List[Dict[str, Any]],
+        publishers: List[PublisherRow],
+        authors: List[AuthorRow],
         initial: Optional[Dict[str, Any]] = None
     ):
         super().__init__(parent)
@@ -39,54 +56,58 @@ class BookDialog(tk.Toplevel):
         frm = ttk.Frame(self, padding=12)
         frm.pack(fill="both", expand=True)
 
-        ttk.Label(frm, text="Название:").grid(row=0, column=0, sticky="w")
-        ttk.Label(frm, text="Язык:").grid(row=1, column=0, sticky="w", pady=(8, 0))
-        ttk.Label(frm, text="Год:").grid(row=2, column=0, sticky="w", pady=(8, 0))
-        ttk.Label(frm, text="Страниц:").grid(row=3, column=0, sticky="w", pady=(8, 0))
-        ttk.Label(frm, text="Издательство:").grid(row=4, column=0, sticky="w", pady=(8, 0))
-        ttk.Label(frm, text="Авторы:").grid(row=5, column=0, sticky="nw", pady=(8, 0))
-        ttk.Label(frm, text="(можно выбрать несколько)").grid(row=6, column=1, sticky="w", padx=(8, 0), pady=(2, 0))
+        labels = ("Название:", "Язык:", "Год:", "Страниц:", "Издательство:", "Авторы:")
+        for i, text in enumerate(labels):
+            ttk.Label(frm, text=text).grid(row=i, column=0, sticky="nw" if i == 5 else "w", pady=(8 if i else 0, 0))
+        ttk.Label(frm, text="(поиск по имени, можно выбрать несколько)").grid(row=6, column=1, sticky="w", padx=(8, 0), pady=(2, 0))
 
-        self.title_var = tk.StringVar(value=(initial.get("title") if initial else ""))
-        self.lang_var = tk.StringVar(value=(initial.get("language") if initial else "ru"))
-        self.year_var = tk.StringVar(value=str(initial.get("publish_year") or "") if initial else "")
-        self.pages_var = tk.StringVar(value=str(initial.get("pages_count") or "") if initial else "")
+        self.publisher_map = {"—": None, **{p.name: p.id for p in publishers}}
 
-        self.publisher_map = {"—": None}
-        for p in publishers:
-            self.publisher_map[p["name"]] = p["id"]
+        initial_pub = _iget(initial, "publisher", None)
+        initial_pub = initial_pub if initial_pub in self.publisher_map else "—"
 
-        initial_pub = (initial.get("publisher") if initial else None) or "—"
-        if initial_pub not in self.publisher_map:
-            initial_pub = "—"
-        self.pub_var = tk.StringVar(value=initial_pub)
+        # Без StringVar: значения читаются напрямую из виджетов в _ok
+        self.title_entry = ttk.Entry(frm, width=50)
+        self.lang_entry = ttk.Entry(frm, width=10)
+        self.year_entry = ttk.Entry(frm, width=10)
+        self.pages_entry = ttk.Entry(frm, width=10)
 
-        ttk.Entry(frm, textvariable=self.title_var, width=50).grid(row=0, column=1, sticky="w", padx=(8, 0))
-        ttk.Entry(frm, textvariable=self.lang_var, width=10).grid(row=1, column=1, sticky="w", padx=(8, 0), pady=(8, 0))
-        ttk.Entry(frm, textvariable=self.year_var, width=10).grid(row=2, column=1, sticky="w", padx=(8, 0), pady=(8, 0))
-        ttk.Entry(frm, textvariable=self.pages_var, width=10).grid(row=3, column=1, sticky="w", padx=(8, 0), pady=(8, 0))
+        self.title_entry.insert(0, _iget(initial, "title"))
+        self.lang_entry.insert(0, _iget(initial, "language", "ru"))
+        self.year_entry.insert(0, _iget(initial, "publish_year", cast=str))
+        self.pages_entry.insert(0, _iget(initial, "pages_count", cast=str))
 
-        cb = ttk.Combobox(frm, textvariable=self.pub_var, values=list(self.publisher_map.keys()),
-                          state="readonly", width=30)
-        cb.grid(row=4, column=1, sticky="w", padx=(8, 0), pady=(8, 0))
+        for i, w in enumerate((self.title_entry, self.lang_entry, self.year_entry, self.pages_entry)):
+            w.grid(row=i, column=1, sticky="w", padx=(8, 0), pady=(8 if i else 0, 0))
 
-        self._author_items: List[tuple[int, str]] = [(a["id"], a["full_name"]) for a in authors]
-        initial_author_ids = set(initial.get("author_ids") or []) if initial else set()
+        self.pub_cb = ttk.Combobox(frm, values=tuple(self.publisher_map), state="readonly", width=30)
+        self.pub_cb.set(initial_pub)
+        self.pub_cb.grid(row=4, column=1, sticky="w", padx=(8, 0), pady=(8, 0))
+
+        # id и имена авторов параллельными списками; в дереве показываем только
+        # совпадения с поиском (не больше _AUTHORS_SHOWN_MAX), iid строки = id автора
+        self._author_ids: List[int] = [a.id for a in authors]
+        self._author_names: List[str] = [a.full_name for a in authors]
+        self._author_names_lower: List[str] = [n.lower() for n in self._author_names]
+        self._selected_author_ids = set(_iget(initial, "author_ids", ()))
 
         lb_frame = ttk.Frame(frm)
         lb_frame.grid(row=5, column=1, sticky="w", padx=(8, 0), pady=(8, 0))
 
-        self.authors_list = tk.Listbox(lb_frame, height=6, width=44, selectmode="extended", exportselection=False)
-        sb = ttk.Scrollbar(lb_frame, orient="vertical", command=self.authors_list.yview)
-        self.authors_list.configure(yscrollcommand=sb.set)
+        self.author_search = ttk.Entry(lb_frame, width=44)
+        self.author_search.grid(row=0, column=0, columnspan=2, sticky="ew", pady=(0, 4))
+        self.author_search.bind("<KeyRelease>", lambda e: self._filter_authors())
+
+        self.authors_tree = ttk.Treeview(lb_frame, show="tree", selectmode="extended", height=6)
+        self.authors_tree.column("#0", width=300, stretch=True)
+        sb = ttk.Scrollbar(lb_frame, orient="vertical", command=self.authors_tree.yview)
+        self.authors_tree.configure(yscrollcommand=sb.set)
 
-        self.authors_list.grid(row=0, column=0, sticky="nsw")
-        sb.grid(row=0, column=1, sticky="ns")
+        self.authors_tree.grid(row=1, column=0, sticky="nsw")
+        sb.grid(row=1, column=1, sticky="ns")
+        self.authors_tree.bind("<<TreeviewSelect>>", lambda e: self._sync_author_selection())
 
-        for i, (aid, name) in enumerate(self._author_items):
-            self.authors_list.insert("end", name)
-            if aid in initial_author_ids:
-                self.authors_list.selection_set(i)
+        self._filter_authors()
 
         btns = ttk.Frame(frm)
         btns.grid(row=7, column=0, columnspan=2, sticky="e", pady=(12, 0))
@@ -98,21 +119,48 @@ class BookDialog(tk.Toplevel):
         self.wait_visibility()
         self.focus_set()
 
+    def _filter_authors(self):
+        q = self.author_search.get().strip().lower()
+        shown: List[int] = []
+        for i, name in enumerate(self._author_names_lower):
+            if q in name:
+                shown.append(i)
+                if len(shown) >= _AUTHORS_SHOWN_MAX:
+                    break
+
+        tree = self.authors_tree
+        tree.delete(*tree.get_children())
+        # прямой вызов Tcl-команды виджета, как в TreeviewGridController
+        call, w = tree.tk.call, tree._w
+        for i in shown:
+            call(w, "insert", "", "end", "-id", self._author_ids[i], "-text", self._author_names[i])
+
+        keep = [str(aid) for aid in (self._author_ids[i] for i in shown) if aid in self._selected_author_ids]
+        if keep:
+            tree.selection_set(keep)
+
+    def _sync_author_selection(self):
+        # выбор среди скрытых фильтром авторов сохраняется
+        visible = {int(i) for i in self.authors_tree.get_children()}
+        selected = {int(i) for i in self.authors_tree.selection()}
+        self._selected_author_ids -= visible - selected
+        self._selected_author_ids |= selected
+
     def _ok(self):
-        title = self.title_var.get().strip()
+        title = self.title_entry.get().strip()
         if not title:
             messagebox.showwarning("Ошибка", "Название пустое.")
             return
 
-        selected = list(self.authors_list.curselection())
-        author_ids = [self._author_items[i][0] for i in selected]
+        self._sync_author_selection()
+        author_ids = [aid for aid in self._author_ids if aid in self._selected_author_ids]
 
         self.result = {
             "title": title,
-            "language": self.lang_var.get().strip() or "ru",
-            "publish_year": _to_int_or_none(self.year_var.get()),
-            "pages_count": _to_int_or_none(self.pages_var.get()),
-            "publisher_id": self.publisher_map.get(self.pub_var.get(), None),
+            "language": self.lang_entry.get().strip() or "ru",
+            "publish_year": _to_int_or_none(self.year_entry.get()),
+            "pages_count": _to_int_or_none(self.pages_entry.get()),
+            "publisher_id": self.publisher_map.get(self.pub_cb.get(), None),
             "author_ids": author_ids
         }
         self.destroy()
@@ -123,7 +171,7 @@ class BookDialog(tk.Toplevel):
 
 
 class CopyDialog(tk.Toplevel):
-    def __init__(self, parent, locations: List[Dict[str, Any]], initial: Optional[Dict[str, Any]] = None):
+    def __init__(self, parent, locations: List[LocationRow], initial: Optional[Dict[str, Any]] = None):
         super().__init__(parent)
         self.title("Экземпляр")
         self.resizable(False, False)
@@ -132,40 +180,37 @@ class CopyDialog(tk.Toplevel):
         frm = ttk.Frame(self, padding=12)
         frm.pack(fill="both", expand=True)
 
-        ttk.Label(frm, text="Инв. код:").grid(row=0, column=0, sticky="w")
-        ttk.Label(frm, text="Статус:").grid(row=1, column=0, sticky="w", pady=(8, 0))
-        ttk.Label(frm, text="Цена:").grid(row=2, column=0, sticky="w", pady=(8, 0))
-        ttk.Label(frm, text="Локация:").grid(row=3, column=0, sticky="w", pady=(8, 0))
-        ttk.Label(frm, text="Примечание:").grid(row=4, column=0, sticky="w", pady=(8, 0))
-
-        self.inv_var = tk.StringVar(value=(initial.get("inventory_code") if initial else ""))
-        self.status_var = tk.StringVar(value=(initial.get("status") if initial else "available"))
-        self.price_var = tk.StringVar(value=str(initial.get("price") or "") if initial else "")
-        self.note_var = tk.StringVar(value=(initial.get("condition_note") if initial else ""))
-
-        self.loc_map = {"—": None}
-        loc_labels = ["—"]
-        for l in locations:
-            label = f'{l["branch_name"]} / {l["code"]}'
-            self.loc_map[label] = l["id"]
-            loc_labels.append(label)
-
-        initial_loc_label = "—"
-        if initial and initial.get("branch_name") and initial.get("location_code"):
-            initial_loc_label = f'{initial["branch_name"]} / {initial["location_code"]}'
-            if initial_loc_label not in self.loc_map:
-                initial_loc_label = "—"
-
-        self.loc_var = tk.StringVar(value=initial_loc_label)
-
-        ttk.Entry(frm, textvariable=self.inv_var, width=30).grid(row=0, column=1, sticky="w", padx=(8, 0))
-        ttk.Combobox(frm, textvariable=self.status_var,
-                     values=["available", "loaned", "reserved", "lost", "damaged"],
-                     state="readonly", width=15).grid(row=1, column=1, sticky="w", padx=(8, 0), pady=(8, 0))
-        ttk.Entry(frm, textvariable=self.price_var, width=15).grid(row=2, column=1, sticky="w", padx=(8, 0), pady=(8, 0))
-        ttk.Combobox(frm, textvariable=self.loc_var, values=loc_labels,
-                     state="readonly", width=35).grid(row=3, column=1, sticky="w", padx=(8, 0), pady=(8, 0))
-        ttk.Entry(frm, textvariable=self.note_var, width=50).grid(row=4, column=1, sticky="w", padx=(8, 0), pady=(8, 0))
+        labels = ("Инв. код:", "Статус:", "Цена:", "Локация:", "Примечание:")
+        for i, text in enumerate(labels):
+            ttk.Label(frm, text=text).grid(row=i, column=0, sticky="w", pady=(8 if i else 0, 0))
+
+        loc_items = [(f"{l.branch_name} / {l.code}", l.id) for l in locations]
+        self.loc_map = {"—": None, **dict(loc_items)}
+        loc_labels = ("—", *(label for label, _ in loc_items))
+
+        initial_loc_label = None
+        branch_name, location_code = _iget(initial, "branch_name"), _iget(initial, "location_code")
+        if branch_name and location_code:
+            initial_loc_label = f"{branch_name} / {location_code}"
+        initial_loc_label = initial_loc_label if initial_loc_label in self.loc_map else "—"
+
+        # Без StringVar: значения читаются напрямую из виджетов в _ok
+        self.inv_entry = ttk.Entry(frm, width=30)
+        self.status_cb = ttk.Combobox(frm, values=["available", "loaned", "reserved", "lost", "damaged"],
+                                      state="readonly", width=15)
+        self.price_entry = ttk.Entry(frm, width=15)
+        self.loc_cb = ttk.Combobox(frm, values=loc_labels, state="readonly", width=35)
+        self.note_entry = ttk.Entry(frm, width=50)
+
+        self.inv_entry.insert(0, _iget(initial, "inventory_code"))
+        self.status_cb.set(_iget(initial, "status", "available"))
+        self.price_entry.insert(0, _iget(initial, "price", cast=str))
+        self.loc_cb.set(initial_loc_label)
+        self.note_entry.insert(0, _iget(initial, "condition_note"))
+
+        fields = (self.inv_entry, self.status_cb, self.price_entry, self.loc_cb, self.note_entry)
+        for i, w in enumerate(fields):
+            w.grid(row=i, column=1, sticky="w", padx=(8, 0), pady=(8 if i else 0, 0))
 
         btns = ttk.Frame(frm)
         btns.grid(row=5, column=0, columnspan=2, sticky="e", pady=(12, 0))
@@ -178,16 +223,16 @@ class CopyDialog(tk.Toplevel):
         self.focus_set()
 
     def _ok(self):
-        inv = self.inv_var.get().strip()
+        inv = self.inv_entry.get().strip()
         if not inv:
             messagebox.showwarning("Ошибка", "Инвентарный код пустой.")
             return
         self.result = {
             "inventory_code": inv,
-            "status": self.status_var.get(),
-            "price": _to_float_or_none(self.price_var.get()),
-            "location_id": self.loc_map.get(self.loc_var.get(), None),
-            "condition_note": self.note_var.get().strip() or None
+            "status": self.status_cb.get(),
+            "price": _to_float_or_none(self.price_entry.get()),
+            "location_id": self.loc_map.get(self.loc_cb.get(), None),
+            "condition_note": self.note_entry.get().strip() or None
         }
         self.destroy()
 
@@ -1,17 +1,31 @@
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import ttk, messagebox
 
+from app.db import db
 from app.services import authenticate
 from app.gui_register import RegisterWindow
 
 
-class LoginWindow(tk.Tk):
-    def __init__(self, on_success):
-        super().__init__()
+def _authenticate_in_worker(login: str, password: str):
+    # bcrypt отпускает GIL, поэтому проверка идёт параллельно с mainloop.
+    # Соединение peewee у потока своё — закрываем его, чтобы не висело в пуле.
+    try:
+        return authenticate(login, password)
+    finally:
+        if not db.is_closed():
+            db.close()
+
+
+class LoginWindow(tk.Toplevel):
+    def __init__(self, master, on_success):
+        super().__init__(master)
         self.title("Библиотека — вход")
         self.geometry("390x240")
         self.resizable(False, False)
         self.on_success = on_success
+        self._pool = ThreadPoolExecutor(max_workers=2)
+        self._auth_future = None
 
         frm = ttk.Frame(self, padding=16)
         frm.pack(fill="both", expand=True)
@@ -33,7 +47,8 @@ class LoginWindow(tk.Tk):
         btnrow.columnconfigure(0, weight=1)
         btnrow.columnconfigure(1, weight=1)
 
-        ttk.Button(btnrow, text="Войти", command=self._do_login).grid(row=0, column=0, sticky="ew", padx=(0, 6))
+        self.btn_login = ttk.Button(btnrow, text="Войти", command=self._do_login)
+        self.btn_login.grid(row=0, column=0, sticky="ew", padx=(0, 6))
         ttk.Button(btnrow, text="Регистрация читателя", command=self._open_register).grid(row=0, column=1, sticky="ew", padx=(6, 0))
 
         self.bind("<Return>", lambda e: self._do_login())
@@ -48,9 +63,34 @@ class LoginWindow(tk.Tk):
             messagebox.showinfo("Ок", "Читатель создан.")
 
     def _do_login(self):
-        ok, msg, session = authenticate(self.login_var.get(), self.pass_var.get())
+        if self._auth_future is not None:
+            return
+        self.btn_login.state(["disabled"])
+        self._auth_future = self._pool.submit(_authenticate_in_worker, self.login_var.get(), self.pass_var.get())
+        self.after(30, self._poll_auth)
+
+    def _poll_auth(self):
+        fut = self._auth_future
+        if fut is None:
+            return
+        if not fut.done():
+            self.after(30, self._poll_auth)
+            return
+
+        self._auth_future = None
+        self.btn_login.state(["!disabled"])
+        try:
+            ok, msg, session = fut.result()
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Ошибка входа: {e}")
+            return
+
         if not ok or session is None:
             messagebox.showerror("Ошибка", msg)
             return
         self.destroy()
         self.on_success(session)
+
+    def destroy(self):
+        self._pool.shutdown(wait=False)
+        super().destroy()
@@ -1,32 +1,39 @@
 from __future__ import annotations
 
+import time
 import tkinter as tk
+from collections import OrderedDict
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
 from tkinter import ttk, messagebox, filedialog
 
+from app.db import db
 from app.gui_treeview_filters import TreeviewGridController
 
 from app.services import (
     Session,
-    get_reports_for_role, export_csv, export_json,
-    issue_loan, return_loan, update_overdue_statuses,
-    make_backup, restore_backup,
+    get_reports_for_role, iter_report_rows,
+    export_csv, export_csv_by_copy, can_export_csv_by_copy, export_json, export_arrow, ARROW_EXPORT_SUFFIXES,
+    issue_loan, return_loan, update_overdue_statuses, list_loans_view,
+    make_backup, restore_backup, BACKUP_JOBS_DEFAULT,
     list_users_filtered, admin_register_librarian, set_user_active,
     reset_user_password, update_user_profile, delete_user,
-    ru_header, format_cell,
+    ru_header, format_cell, format_cell_cached, ROW_AWARE_COLUMNS,
     role_label, roles_label_list,
 )
 
 from app.services_catalog import (
     list_books, list_copies_for_book,
-    list_books_reader_view,
+    list_books_reader_view, get_book_availability,
     list_publishers, list_locations,
-    list_authors, get_book_author_ids,
+    list_authors,
     create_book, update_book, delete_book,
     create_copy, update_copy, delete_copy
 )
 
 from app.gui_catalog_dialogs import BookDialog, CopyDialog
-from app.gui_users_dialogs import RegisterLibrarianDialog, ResetPasswordDialog, EditUserDialog
 
 from app.gui_reserve import ReserveDialog
 from app.services_reservations import (
@@ -43,7 +50,6 @@ COPY_STATUS_RU = {
     "lost": "Утерян",
     "damaged": "Повреждён",
 }
-COPY_STATUS_EN = {v: k for k, v in COPY_STATUS_RU.items()}
 
 LOAN_STATUS_RU = {
     "open": "Выдана",
@@ -59,16 +65,92 @@ RES_STATUS_RU = {
     "cancelled": "Отменён",
 }
 
+# Заранее связанные .get для построчных циклов: перевод статуса без поиска атрибута
+COPY_STATUS_GET = COPY_STATUS_RU.get
+LOAN_STATUS_GET = LOAN_STATUS_RU.get
+RES_STATUS_GET = RES_STATUS_RU.get
+
+# Поиск по вкладкам уходит в БД: пауза после ввода и потолок строк на одну выборку
+_SEARCH_DEBOUNCE_MS = 300
+_ROWS_LIMIT = 1000
+
+# Экземпляры грузим после паузы в навигации по книгам; последние книги держим в кэше
+_COPIES_DEBOUNCE_MS = 120
+_COPIES_CACHE_SIZE = 16
+
+_EXPIRE_INTERVAL_MS = 60_000
+
+# Отчёты и список пользователей: повторный выбор того же отчёта/фильтра в течение TTL не ходит в БД
+_RESULTS_TTL = 8.0
+
+_USER_MAIN_COLS = itemgetter("id", "login", "full_name")
+_YES_NO = ("Нет", "Да")
+
+
+class _TTLCache:
+    """Результаты загрузчиков по ключу, живут ttl секунд; clear() — после записи в БД."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._items = {}
+
+    def get(self, key, loader):
+        now = time.monotonic()
+        hit = self._items.get(key)
+        if hit is not None and now - hit[0] < self.ttl:
+            return hit[1]
+        value = loader()
+        self._items[key] = (now, value)
+        return value
+
+    def peek(self, key):
+        """Значение без загрузки; None, если его нет или оно устарело."""
+        hit = self._items.get(key)
+        if hit is not None and time.monotonic() - hit[0] < self.ttl:
+            return hit[1]
+        return None
+
+    def clear(self):
+        self._items.clear()
+
+
+_AVAIL_TEXT = "В наличии"
+_NOT_AVAIL_TEXT = "Нет в наличии"
+
+
+def _availability_text(avail: int, next_due) -> str:
+    if avail > 0:
+        return _AVAIL_TEXT
+    if next_due:
+        return f"{_NOT_AVAIL_TEXT} (ожидается после {next_due})"
+    return _NOT_AVAIL_TEXT
+
+
+def _run_in_worker(fn, *args):
+    # pg_dump/pg_restore и запись файлов идут вне mainloop.
+    # Соединение peewee у потока своё — закрываем его, чтобы не висело.
+    try:
+        return fn(*args)
+    finally:
+        if not db.is_closed():
+            db.close()
+
 
 def _yes_no(v) -> str:
     return "Да" if bool(v) else "Нет"
 
 
-class MainWindow(tk.Tk):
-    def __init__(self, session: Session):
-        super().__init__()
+def _default_backup_path() -> str:
+    # каталог -Fd должен быть новым или пустым: своё имя с отметкой времени на каждый бэкап
+    return f"backup/library_{datetime.now():%Y%m%d_%H%M%S}"
+
+
+class MainWindow(tk.Toplevel):
+    def __init__(self, master, session: Session):
+        super().__init__(master)
         self.session = session
         self.logged_out = False
+        self._caps = session.granted()
 
         role_ru = role_label(session.primary_role)
         self.title(f"Библиотека — {session.user.full_name} ({role_ru})")
@@ -82,22 +164,97 @@ class MainWindow(tk.Tk):
         ).pack(side="left")
         ttk.Button(topbar, text="Выйти", command=self._logout).pack(side="right")
 
+        # индикатор фоновых операций (бэкап, восстановление, экспорт)
+        self._bg_pool = ThreadPoolExecutor(max_workers=1)
+        self._bg_running = 0
+        self.bg_progress = ttk.Progressbar(topbar, mode="indeterminate", length=140)
+
         self.notebook = ttk.Notebook(self)
         self.notebook.pack(fill="both", expand=True)
 
         self.tabs = {}
         self._tv = {}
+        self._search_vars = {}
+        self._after_ids = {}
+        self._copies_after = None
+        # книга, для которой последний раз запрошены экземпляры
+        self._copies_book_id = None
+        self._copies_cache = OrderedDict()
+        # справочники для диалогов каталога; сбрасываются кнопкой "Обновить"
+        self._ref_cache = {}
+        self._results_cache = _TTLCache(_RESULTS_TTL)
+        # последний набор колонок таблиц отчётов: при той же схеме заголовки не перенастраиваем
+        self._tree_cols = {}
+
+        # Вкладки создаются пустыми, содержимое строится при первом открытии;
+        # каталог — стартовая вкладка, его строим сразу
+        self._tab_builders = {
+            "Каталог": self._build_catalog_tab,
+            "Выдачи": self._build_loans_tab,
+            "Резервы": self._build_reservations_tab,
+            "Отчёты": self._build_reports_tab,
+            "Бэкап": self._build_backup_tab,
+            "Пользователи": self._build_users_tab,
+        }
+        # полная перезагрузка данных вкладки; скрытые вкладки только помечаются
+        self._tab_loaders = {
+            "Каталог": self._load_books,
+            "Выдачи": self._load_loans,
+            "Резервы": self._load_reservations,
+        }
+        self._dirty = set()
+
+        # индексы вкладок стабильны: скрываем через hide(), а не forget()
+        self._tab_idx = {}
+        self._tab_titles = []
+        for title in self._tab_builders:
+            tab = ttk.Frame(self.notebook, padding=10)
+            self.notebook.add(tab, text=title)
+            self.tabs[title] = tab
+            self._tab_idx[title] = self.notebook.index(tab)
+            self._tab_titles.append(title)
+
+        self._ensure_tab_built("Каталог")
+        self._apply_rights_rules()
+        self.notebook.bind("<<NotebookTabChanged>>", self._on_tab_changed)
 
-        expire_old_reservations()
+        self.after(200, self._expire_tick)
 
-        self._build_catalog_tab()
-        self._build_loans_tab()
-        self._build_reservations_tab()
-        self._build_reports_tab()
-        self._build_backup_tab()
-        self._build_users_tab()
+    def _expire_tick(self):
+        """Снятие истёкших резервов раз в минуту, а не на каждое обновление таблиц."""
+        if self.logged_out:
+            return
+        if expire_old_reservations():
+            self._request_reload("Резервы")
+            # снятый резерв вернул экземпляр в наличие
+            self._request_reload("Каталог")
+        self.after(_EXPIRE_INTERVAL_MS, self._expire_tick)
+
+    def _ensure_tab_built(self, title: str):
+        builder = self._tab_builders.pop(title, None)
+        if builder is None:
+            return
+        builder()
+        self._apply_widget_rights()
+
+    def _tab_built(self, title: str) -> bool:
+        return title not in self._tab_builders
+
+    def _request_reload(self, title: str):
+        """Перезагружает вкладку сразу, если она на экране; иначе — при переключении на неё."""
+        if not self._tab_built(title):
+            return  # при первой сборке загрузится сама
+        if self.notebook.index("current") == self._tab_idx[title]:
+            self._tab_loaders[title]()
+        else:
+            self._dirty.add(title)
 
-        self._apply_rights_rules()
+    def _on_tab_changed(self, _event=None):
+        title = self._tab_titles[self.notebook.index("current")]
+        self._ensure_tab_built(title)
+        if title in self._dirty:
+            self._dirty.discard(title)
+            self._tab_loaders[title]()
 
     def _enable_grid(self, tree: ttk.Treeview) -> TreeviewGridController:
         if tree in self._tv:
@@ -106,11 +263,27 @@ class MainWindow(tk.Tk):
         self._tv[tree] = ctl
         return ctl
 
-    def _set_tree_data(self, tree: ttk.Treeview, rows_as_tuples):
+    def _pack_tree(self, tree: ttk.Treeview, **pack_opts):
+        """Пакует дерево с вертикальным скроллбаром; в виртуальном режиме ползунок ведёт контроллер."""
+        box = ttk.Frame(tree.master)
+        box.pack(**pack_opts)
         ctl = self._enable_grid(tree)
-        ctl.set_data(rows_as_tuples)
+        sb = ttk.Scrollbar(box, orient="vertical", command=ctl.yview)
+        sb.pack(side="right", fill="y")
+        # дерево создано раньше рамки — поднимаем, иначе рамка его перекроет
+        tree.pack(in_=box, side="left", fill="both", expand=True)
+        tree.lift(box)
+        ctl.attach_scrollbar(sb.set)
+
+    def _set_tree_data(self, tree: ttk.Treeview, rows_as_tuples, records=None):
+        ctl = self._enable_grid(tree)
+        ctl.set_data(rows_as_tuples, records)
 
-    def _add_search_box(self, parent: ttk.Frame, tree: ttk.Treeview, label: str = "Поиск:"):
+    def _add_search_box(self, parent: ttk.Frame, tree: ttk.Treeview, label: str = "Поиск:", on_search=None):
+        """
+        on_search — перезагрузка вкладки: фильтр уходит в SQL, ввод дебаунсится.
+        Без него фильтруем уже загруженные строки на клиенте.
+        """
         var = tk.StringVar(value="")
         ttk.Label(parent, text=label).pack(side="left", padx=(12, 4))
         ent = ttk.Entry(parent, textvariable=var, width=28)
@@ -118,16 +291,52 @@ class MainWindow(tk.Tk):
 
         ctl = self._enable_grid(tree)
 
-        var.trace_add("write", lambda *_: ctl.set_search(var.get()))
-        ent.bind("<Escape>", lambda e: (var.set(""), ctl.clear_search(), "break"))
+        if on_search is None:
+            # паузу в наборе выдерживает сам контроллер
+            var.trace_add("write", lambda *_: ctl.set_search(var.get()))
+            ent.bind("<Escape>", lambda e: (var.set(""), ctl.clear_search(), "break"))
+            return var, ent
+
+        self._search_vars[tree] = var
+        var.trace_add("write", lambda *_: self._debounce(tree, _SEARCH_DEBOUNCE_MS, on_search))
+        ent.bind("<Escape>", lambda e: (var.set(""), "break"))
 
         return var, ent
 
+    def _debounce(self, key, delay_ms: int, fn):
+        """Откладывает fn на delay_ms; повторный вызов с тем же key переносит срок."""
+        self._cancel_debounce(key)
+        self._after_ids[key] = self.after(delay_ms, lambda: (self._after_ids.pop(key, None), fn()))
+
+    def _cancel_debounce(self, key):
+        after_id = self._after_ids.pop(key, None)
+        if after_id is not None:
+            self.after_cancel(after_id)
+
+    def _search_text(self, tree: ttk.Treeview) -> str:
+        var = self._search_vars.get(tree)
+        return var.get().strip() if var is not None else ""
+
+    @staticmethod
+    def _count_text(prefix: str, n: int) -> str:
+        if n >= _ROWS_LIMIT:
+            return f"{prefix}: показаны первые {n}, уточните поиск"
+        return f"{prefix}: {n}"
+
+    def _notify(self, ok: bool, msg: str, ok_title: str = "Ок", err_title: str = "Ошибка"):
+        """Итог операции сервиса: (ok, msg) -> информационное окно или окно ошибки."""
+        if ok:
+            # успешная операция могла изменить данные — кэш отчётов/пользователей устарел
+            self._results_cache.clear()
+            messagebox.showinfo(ok_title, msg)
+        else:
+            messagebox.showerror(err_title, msg)
+
     # Спрятать заголовки и вкладки
     def _hide_tab(self, title: str):
-        tab = self.tabs.get(title)
-        if tab:
-            self.notebook.forget(tab)
+        idx = self._tab_idx.get(title)
+        if idx is not None:
+            self.notebook.hide(idx)
 
     def _hide_widget(self, w):
         if not w:
@@ -141,22 +350,40 @@ class MainWindow(tk.Tk):
             w.place_forget()
 
     def _apply_rights_rules(self):
-        s = self.session
+        caps = self._caps
 
         # --- вкладка Пользователи
-        if not s.can("manage_users"):
+        if "manage_users" not in caps:
             self._hide_tab("Пользователи")
 
         # --- вкладка Бэкап
-        if not s.can("backup"):
+        if "backup" not in caps:
             self._hide_tab("Бэкап")
 
         # --- вкладка Отчёты
-        if not s.can("view_reports"):
+        if "view_reports" not in caps:
             self._hide_tab("Отчёты")
 
+        # --- Выдачи: без manage_loans вкладка переименовывается
+        if "manage_loans" not in caps:
+            self.notebook.tab(self._tab_idx["Выдачи"], text="Ваши выдачи")
+
+        # --- Резервы
+        can_own = "manage_own_reservations" in caps
+        can_staff = "manage_reservations" in caps
+        if not can_own and not can_staff:
+            self._hide_tab("Резервы")
+        elif can_own and not can_staff:
+            self.notebook.tab(self._tab_idx["Резервы"], text="Ваши резервы")
+
+        self._apply_widget_rights()
+
+    def _apply_widget_rights(self):
+        """Прячет кнопки/панели без прав; вызывается и после ленивой сборки вкладки."""
+        caps = self._caps
+
         # --- Каталог: если нет manage_catalog -> прячем
-        if not s.can("manage_catalog"):
+        if "manage_catalog" not in caps:
             self._hide_widget(self.copies_frame)
             self._hide_widget(self.btn_book_add)
             self._hide_widget(self.btn_book_edit)
@@ -166,38 +393,28 @@ class MainWindow(tk.Tk):
             self._hide_widget(self.btn_copy_del)
 
         # --- Кнопка "Резерв" показывается только если есть create_reservation
-        if not s.can("create_reservation"):
+        if "create_reservation" not in caps:
             self._hide_widget(self.btn_reserve)
 
-        # --- Выдачи: если нет manage_loans -> прячем оформление/возврат и переименуем вкладку
-        if not s.can("manage_loans"):
-            self._hide_widget(self.controls_loans_frame)
-            self.notebook.tab(self.tabs["Выдачи"], text="Ваши выдачи")
+        # --- Выдачи: если нет manage_loans -> прячем оформление/возврат
+        if "manage_loans" not in caps:
+            self._hide_widget(getattr(self, "controls_loans_frame", None))
 
         # --- Резервы:
         # если может управлять своими резервами -> reader-кнопки
         # если может управлять резервами (выдать) -> staff-кнопка
-        can_own = s.can("manage_own_reservations")
-        can_staff = s.can("manage_reservations")
-
-        if not can_own and not can_staff:
-            self._hide_tab("Резервы")
-        else:
-            if can_own and not can_staff:
-                self.notebook.tab(self.tabs["Резервы"], text="Ваши резервы")
+        can_own = "manage_own_reservations" in caps
+        can_staff = "manage_reservations" in caps
 
-            if hasattr(self, "btn_res_cancel") and not can_own:
-                self._hide_widget(self.btn_res_cancel)
-            if hasattr(self, "btn_res_extend") and not can_own:
-                self._hide_widget(self.btn_res_extend)
-            if hasattr(self, "btn_res_fulfill") and not can_staff:
-                self._hide_widget(self.btn_res_fulfill)
+        if not can_own:
+            self._hide_widget(getattr(self, "btn_res_cancel", None))
+            self._hide_widget(getattr(self, "btn_res_extend", None))
+        if not can_staff:
+            self._hide_widget(getattr(self, "btn_res_fulfill", None))
 
     # Вкладка каталог
     def _build_catalog_tab(self):
-        tab = ttk.Frame(self.notebook, padding=10)
-        self.notebook.add(tab, text="Каталог")
-        self.tabs["Каталог"] = tab
+        tab = self.tabs["Каталог"]
 
         self.books_tree = ttk.Treeview(tab, show="headings", height=14)
         self._enable_grid(self.books_tree)
@@ -205,12 +422,12 @@ class MainWindow(tk.Tk):
         top = ttk.Frame(tab)
         top.pack(fill="x")
 
-        ttk.Button(top, text="Обновить", command=self._load_books).pack(side="left")
+        ttk.Button(top, text="Обновить", command=self._reload_catalog).pack(side="left")
 
         self.btn_reserve = ttk.Button(top, text="Зарезервировать выбранную книгу", command=self._ui_reserve_book)
         self.btn_reserve.pack(side="left", padx=8)
 
-        self._add_search_box(top, self.books_tree, "Поиск книг:")
+        self._add_search_box(top, self.books_tree, "Поиск книг:", on_search=self._load_books)
 
         self.catalog_info = ttk.Label(top, text="")
         self.catalog_info.pack(side="left", padx=12)
@@ -223,8 +440,10 @@ class MainWindow(tk.Tk):
         self.btn_book_edit.pack(side="right", padx=8)
         self.btn_book_del.pack(side="right", padx=8)
 
-        self.books_tree.pack(fill="x", pady=(10, 0))
-        self.books_tree.bind("<<TreeviewSelect>>", lambda e: self._load_copies_for_selected_book())
+        self._pack_tree(self.books_tree, fill="x", pady=(10, 0))
+        # add=True: обработчик контроллера (учёт выделения) должен остаться и сработать первым
+        self._enable_grid(self.books_tree)
+        self.books_tree.bind("<<TreeviewSelect>>", self._schedule_copies_reload, add=True)
 
         mid = ttk.LabelFrame(tab, text="Экземпляры выбранной книги", padding=8)
         self.copies_frame = mid
@@ -271,9 +490,10 @@ class MainWindow(tk.Tk):
         self.btn_copy_edit.pack(side="right", padx=8)
         self.btn_copy_del.pack(side="right", padx=8)
 
-        self.copies_tree.pack(fill="both", expand=True, pady=(8, 0))
+        self._pack_tree(self.copies_tree, fill="both", expand=True, pady=(8, 0))
 
-        self._load_books()
+        # окно сначала отрисовывается, книги подгружаются следом
+        self.after_idle(self._load_books)
 
     def _configure_books_tree_reader(self):
         cols = ("id", "title", "authors", "publisher", "year", "available", "status")
@@ -323,77 +543,125 @@ class MainWindow(tk.Tk):
             self.books_tree.heading(c, text=headers.get(c, c))
             self.books_tree.column(c, width=w, anchor="w")
 
-    def _get_selected_book_id(self):
-        sel = self.books_tree.selection()
-        if not sel:
+    def _reload_catalog(self):
+        self._ref_cache.clear()
+        self._load_books()
+
+    def _ref(self, key: str, loader):
+        cache = self._ref_cache
+        if key not in cache:
+            cache[key] = loader()
+        return cache[key]
+
+    def _publishers(self):
+        return self._ref("publishers", list_publishers)
+
+    def _authors(self):
+        return self._ref("authors", list_authors)
+
+    def _locations(self):
+        return self._ref("locations", list_locations)
+
+    def _selected_row(self, tree: ttk.Treeview):
+        # выделение хранит контроллер: в виртуальном режиме строка вне окна уже удалена из дерева
+        return self._enable_grid(tree).selected_row()
+
+    def _selected_id(self, tree: ttk.Treeview):
+        vals = self._selected_row(tree)
+        if not vals:
             return None
-        vals = self.books_tree.item(sel[0], "values")
         return int(vals[0])
 
+    def _get_selected_book_id(self):
+        return self._selected_id(self.books_tree)
+
     def _get_selected_book_title(self):
-        sel = self.books_tree.selection()
-        if not sel:
+        vals = self._selected_row(self.books_tree)
+        if not vals:
             return None
-        vals = self.books_tree.item(sel[0], "values")
         return str(vals[1])
 
     def _get_selected_copy_id(self):
-        sel = self.copies_tree.selection()
-        if not sel:
-            return None
-        return int(self.copies_tree.item(sel[0], "values")[0])
+        return self._selected_id(self.copies_tree)
 
     def _load_books(self):
+        search = self._search_text(self.books_tree)
+        self._copies_cache.clear()
+        self._copies_book_id = None
+
         # Если нет прав manage_catalog -> показываем читательский вид
-        if not self.session.can("manage_catalog"):
+        if "manage_catalog" not in self._caps:
             self._configure_books_tree_reader()
-            rows = list_books_reader_view()
-
-            data = []
-            for r in rows:
-                avail = int(r.get("available_count") or 0)
-                next_due = r.get("next_due")
-                if avail > 0:
-                    status = "В наличии"
-                else:
-                    status = "Нет в наличии"
-                    if next_due:
-                        status += f" (ожидается после {next_due})"
-
-                data.append((
-                    r["id"],
-                    r["title"],
-                    r.get("authors") or "—",
-                    r.get("publisher") or "—",
-                    r.get("publish_year") or "",
-                    avail,
-                    status
-                ))
-
-            self._set_tree_data(self.books_tree, data)
-            self.catalog_info.config(text=f"Книг: {len(rows)}")
+            rows = list_books_reader_view(search=search, limit=_ROWS_LIMIT)
+            row_of = self._book_row_reader
+            data = [row_of(r) for r in rows]
+            self._set_tree_data(self.books_tree, data, rows)
+            self.catalog_info.config(text=self._count_text("Книг", len(rows)))
             self._set_tree_data(self.copies_tree, [])
             return
 
         self._configure_books_tree_staff()
-        rows = list_books()
-        data = []
-        for r in rows:
-            data.append((
-                r["id"],
-                r["title"],
-                r.get("authors") or "—",
-                r.get("publisher") or "—",
-                r.get("publish_year") or "",
-                r.get("language") or "",
-                r.get("pages_count") or "",
-            ))
-        self._set_tree_data(self.books_tree, data)
-        self.catalog_info.config(text=f"Книг: {len(rows)}")
+        rows = list_books(search=search, limit=_ROWS_LIMIT)
+        data = [
+            (r["id"], r["title"], r["authors"] or "—", r["publisher"] or "—",
+             r["publish_year"] or "", r["language"] or "", r["pages_count"] or "")
+            for r in rows
+        ]
+        self._set_tree_data(self.books_tree, data, rows)
+        self.catalog_info.config(text=self._count_text("Книг", len(rows)))
         self._set_tree_data(self.copies_tree, [])
 
-    def _load_copies_for_selected_book(self):
-        if not self.session.can("manage_catalog"):
+    @staticmethod
+    def _book_row_reader(r):
+        avail = int(r["available_count"] or 0)
+        return (
+            r["id"],
+            r["title"],
+            r["authors"] or "—",
+            r["publisher"] or "—",
+            r["publish_year"] or "",
+            avail,
+            _availability_text(avail, r["next_due"])
+        )
+
+    def _invalidate_book(self, book_id):
+        """После выдачи/возврата/резерва обновляет только затронутую книгу."""
+        if not book_id:
+            return
+        if "manage_catalog" in self._caps:
+            # в staff-виде наличие видно только в таблице экземпляров выбранной книги
+            self._copies_cache.pop(book_id, None)
+            if self._get_selected_book_id() == book_id:
+                self._load_copies_for_selected_book()
+            return
+        # меняется только наличие — берём загруженную запись книги и пересчитываем его
+        ctl = self._enable_grid(self.books_tree)
+        rec = ctl.get_row(book_id)
+        if rec is None:
+            return  # книги нет в текущей выборке (поиск/лимит)
+        avail, next_due = get_book_availability(book_id)
+        rec = dict(rec, available_count=avail, next_due=next_due)
+        ctl.upsert_row(self._book_row_reader(rec), record=rec)
+
+    def _schedule_copies_reload(self, _event=None):
+        # событие приходит и когда выделенная строка уходит из окна при прокрутке —
+        # выделение в контроллере при этом то же, перезагружать нечего
+        book_id = self._get_selected_book_id()
+        if book_id == self._copies_book_id:
+            return
+        self._copies_book_id = book_id
+        # при быстром листании книг запрос уходит один раз — по последней выбранной
+        if self._copies_after is not None:
+            self.after_cancel(self._copies_after)
+        self._copies_after = self.after(_COPIES_DEBOUNCE_MS, self._on_copies_debounced)
+
+    def _on_copies_debounced(self):
+        self._copies_after = None
+        self._load_copies_for_selected_book(cached=True)
+
+    def _load_copies_for_selected_book(self, cached: bool = False):
+        """cached=True — можно взять строки из кэша (навигация); иначе всегда свежий запрос."""
+        if "manage_catalog" not in self._caps:
             return
 
         book_id = self._get_selected_book_id()
@@ -401,22 +669,24 @@ class MainWindow(tk.Tk):
             self._set_tree_data(self.copies_tree, [])
             return
 
-        rows = list_copies_for_book(book_id)
-        data = []
-        for r in rows:
-            data.append((
-                r["id"],
-                r["inventory_code"],
-                COPY_STATUS_RU.get(r["status"], r["status"]),
-                r.get("price") or "",
-                r.get("branch_name") or "—",
-                r.get("location_code") or "—",
-                r.get("condition_note") or ""
-            ))
-        self._set_tree_data(self.copies_tree, data)
+        cache = self._copies_cache
+        hit = cache.get(book_id) if cached else None
+        if hit is None:
+            rows = list_copies_for_book(book_id)
+            status_ru = COPY_STATUS_GET
+            data = [
+                (r["id"], r["inventory_code"], status_ru(r["status"], r["status"]), r["price"] or "",
+                 r["branch_name"] or "—", r["location_code"] or "—", r["condition_note"] or "")
+                for r in rows
+            ]
+            hit = cache[book_id] = (data, rows)
+            while len(cache) > _COPIES_CACHE_SIZE:
+                cache.popitem(last=False)
+        cache.move_to_end(book_id)
+        self._set_tree_data(self.copies_tree, *hit)
 
     def _ui_reserve_book(self):
-        if not self.session.can("create_reservation"):
+        if "create_reservation" not in self._caps:
             return
         book_id = self._get_selected_book_id()
         if not book_id:
@@ -426,58 +696,51 @@ class MainWindow(tk.Tk):
         dlg = ReserveDialog(self, self.session.user, book_id, title)
         self.wait_window(dlg)
         if getattr(dlg, "result_ok", False):
-            self._load_books()
-            self._load_reservations()
+            self._refresh_reservation_row(dlg.result_id, prepend=True)
+            self._invalidate_book(book_id)
 
     def _ui_add_book(self):
-        if not self.session.can("manage_catalog"):
+        if "manage_catalog" not in self._caps:
             return
-        pubs = list_publishers()
-        authors = list_authors()
+        pubs = self._publishers()
+        authors = self._authors()
         dlg = BookDialog(self, pubs, authors, initial=None)
         self.wait_window(dlg)
         if not dlg.result:
             return
         ok, msg = create_book(**dlg.result)
-        messagebox.showinfo("Ок", msg) if ok else messagebox.showerror("Ошибка", msg)
+        self._notify(ok, msg)
         if ok:
             self._load_books()
 
     def _ui_edit_book(self):
-        if not self.session.can("manage_catalog"):
+        if "manage_catalog" not in self._caps:
             return
         book_id = self._get_selected_book_id()
         if not book_id:
             messagebox.showwarning("Ошибка", "Выберите книгу.")
             return
 
-        sel = self.books_tree.selection()[0]
-        vals = self.books_tree.item(sel, "values")
-
-        current = {
-            "id": int(vals[0]),
-            "title": vals[1],
-            "publisher": vals[3] if vals[3] != "—" else None,
-            "publish_year": int(vals[4]) if str(vals[4]).strip() else None,
-            "language": vals[5],
-            "pages_count": int(vals[6]) if str(vals[6]).strip() else None,
-            "author_ids": get_book_author_ids(book_id),
-        }
+        current = self._enable_grid(self.books_tree).get_row(book_id)
+        if current is None:
+            messagebox.showwarning("Ошибка", "Книга не найдена, обновите список.")
+            return
+        current = dict(current, author_ids=list(current.get("author_ids") or ()))
 
-        pubs = list_publishers()
-        authors = list_authors()
+        pubs = self._publishers()
+        authors = self._authors()
         dlg = BookDialog(self, pubs, authors, initial=current)
         self.wait_window(dlg)
         if not dlg.result:
             return
 
         ok, msg = update_book(book_id=book_id, **dlg.result)
-        messagebox.showinfo("Ок", msg) if ok else messagebox.showerror("Ошибка", msg)
+        self._notify(ok, msg)
         if ok:
             self._load_books()
 
     def _ui_delete_book(self):
-        if not self.session.can("manage_catalog"):
+        if "manage_catalog" not in self._caps:
             return
         book_id = self._get_selected_book_id()
         if not book_id:
@@ -486,63 +749,53 @@ class MainWindow(tk.Tk):
         if not messagebox.askyesno("Подтверди", "Удалить книгу?"):
             return
         ok, msg = delete_book(book_id)
-        messagebox.showinfo("Ок", msg) if ok else messagebox.showerror("Ошибка", msg)
+        self._notify(ok, msg)
         if ok:
             self._load_books()
 
     def _ui_add_copy(self):
-        if not self.session.can("manage_catalog"):
+        if "manage_catalog" not in self._caps:
             return
         book_id = self._get_selected_book_id()
         if not book_id:
             messagebox.showwarning("Ошибка", "Сначала выберите книгу.")
             return
-        locs = list_locations()
+        locs = self._locations()
         dlg = CopyDialog(self, locs, initial=None)
         self.wait_window(dlg)
         if not dlg.result:
             return
         ok, msg = create_copy(book_id=book_id, **dlg.result)
-        messagebox.showinfo("Ок", msg) if ok else messagebox.showerror("Ошибка", msg)
+        self._notify(ok, msg)
         if ok:
             self._load_copies_for_selected_book()
 
     def _ui_edit_copy(self):
-        if not self.session.can("manage_catalog"):
+        if "manage_catalog" not in self._caps:
             return
         copy_id = self._get_selected_copy_id()
         if not copy_id:
             messagebox.showwarning("Ошибка", "Выберите экземпляр.")
             return
 
-        sel = self.copies_tree.selection()[0]
-        vals = self.copies_tree.item(sel, "values")
-
-        status_code = COPY_STATUS_EN.get(vals[2], vals[2])
-
-        current = {
-            "id": int(vals[0]),
-            "inventory_code": vals[1],
-            "status": status_code,
-            "price": float(vals[3]) if str(vals[3]).strip() else None,
-            "branch_name": vals[4] if vals[4] != "—" else None,
-            "location_code": vals[5] if vals[5] != "—" else None,
-            "condition_note": vals[6] or None,
-        }
+        current = self._enable_grid(self.copies_tree).get_row(copy_id)
+        if current is None:
+            messagebox.showwarning("Ошибка", "Экземпляр не найден, обновите список.")
+            return
 
-        locs = list_locations()
+        locs = self._locations()
         dlg = CopyDialog(self, locs, initial=current)
         self.wait_window(dlg)
         if not dlg.result:
             return
 
         ok, msg = update_copy(copy_id=copy_id, **dlg.result)
-        messagebox.showinfo("Ок", msg) if ok else messagebox.showerror("Ошибка", msg)
+        self._notify(ok, msg)
         if ok:
             self._load_copies_for_selected_book()
 
     def _ui_delete_copy(self):
-        if not self.session.can("manage_catalog"):
+        if "manage_catalog" not in self._caps:
             return
         copy_id = self._get_selected_copy_id()
         if not copy_id:
@@ -551,15 +804,13 @@ class MainWindow(tk.Tk):
         if not messagebox.askyesno("Подтверди", "Удалить экземпляр?"):
             return
         ok, msg = delete_copy(copy_id)
-        messagebox.showinfo("Ок", msg) if ok else messagebox.showerror("Ошибка", msg)
+        self._notify(ok, msg)
         if ok:
             self._load_copies_for_selected_book()
 
     # Вкладка выдачи
     def _build_loans_tab(self):
-        tab = ttk.Frame(self.notebook, padding=10)
-        self.notebook.add(tab, text="Выдачи")
-        self.tabs["Выдачи"] = tab
+        tab = self.tabs["Выдачи"]
 
         controls = ttk.LabelFrame(tab, text="Оформление / возврат", padding=10)
         self.controls_loans_frame = controls
@@ -619,75 +870,69 @@ class MainWindow(tk.Tk):
             self.loans_tree.column(c, width=w, anchor="w")
         self._enable_grid(self.loans_tree)
 
-        self._add_search_box(top2, self.loans_tree, "Поиск:")
-        self.loans_tree.pack(fill="both", expand=True, pady=(8, 0))
+        self._add_search_box(top2, self.loans_tree, "Поиск:", on_search=self._load_loans)
+        self._pack_tree(self.loans_tree, fill="both", expand=True, pady=(8, 0))
 
         self._load_loans()
 
     def _load_loans(self):
-        from app.models import Loan, Copy, Book, User
-
-        q = (Loan
-             .select(Loan.id, Loan.status, Loan.due_date,
-                     Copy.inventory_code, Book.title,
-                     User.login)
-             .join(Copy)
-             .join(Book)
-             .switch(Loan)
-             .join(User, on=(Loan.reader == User.id))
-             .order_by(Loan.due_date.asc()))
-
-        if not self.session.can("manage_loans"):
-            q = q.where(Loan.reader == self.session.user)
-
-        data = []
-        for row in q.dicts():
-            data.append((
-                row["id"],
-                LOAN_STATUS_RU.get(row["status"], row["status"]),
-                row["inventory_code"],
-                row["title"],
-                row["login"],
-                str(row["due_date"]) if row.get("due_date") else ""
-            ))
-
+        reader = None if "manage_loans" in self._caps else self.session.user
+
+        # строки — кортежами в порядке колонок (без dict на строку)
+        get = LOAN_STATUS_GET
+        data = [
+            (i, get(st, st), inv, title, login, str(due) if due else "")
+            for i, st, inv, title, login, due, _book_id in list_loans_view(
+                reader, search=self._search_text(self.loans_tree), limit=_ROWS_LIMIT
+            )
+        ]
         self._set_tree_data(self.loans_tree, data)
 
+    def _refresh_loan_row(self, loan_id):
+        """Перечитывает одну выдачу и правит её строку; возвращает id книги."""
+        if not loan_id:
+            return None
+        reader = None if "manage_loans" in self._caps else self.session.user
+        rows = list_loans_view(reader, loan_id=loan_id)
+        if not rows:
+            return None
+        i, st, inv, title, login, due, book_id = rows[0]
+        # вкладка ещё не открывалась — загрузит всё сама при первом показе
+        if self._tab_built("Выдачи"):
+            row = (i, LOAN_STATUS_GET(st, st), inv, title, login, str(due) if due else "")
+            self._enable_grid(self.loans_tree).upsert_row(row)
+        return book_id
+
     def _ui_issue_loan(self):
-        if not self.session.can("manage_loans"):
+        if "manage_loans" not in self._caps:
             return
-        ok, msg = issue_loan(
+        ok, msg, loan_id = issue_loan(
             copy_inventory_code=self.issue_inv_var.get(),
             reader_login=self.issue_reader_var.get(),
             librarian_user=self.session.user
         )
+        self._notify(ok, msg, ok_title="Готово", err_title="Не вышло")
         if not ok:
-            messagebox.showerror("Не вышло", msg)
             return
-        messagebox.showinfo("Готово", msg)
         self.issue_inv_var.set("")
         self.issue_reader_var.set("")
-        self._load_books()
-        self._load_loans()
+        self._invalidate_book(self._refresh_loan_row(loan_id))
 
     def _ui_return_loan(self):
-        if not self.session.can("manage_loans"):
+        if "manage_loans" not in self._caps:
             return
-        sel = self.loans_tree.selection()
-        if not sel:
+        loan_id = self._selected_id(self.loans_tree)
+        if loan_id is None:
             messagebox.showwarning("Ошибка", "Сначала выберите выдачу.")
             return
-        loan_id = int(self.loans_tree.item(sel[0], "values")[0])
         ok, msg = return_loan(loan_id, self.session.user)
+        self._notify(ok, msg, ok_title="Готово", err_title="Не вышло")
         if not ok:
-            messagebox.showerror("Не вышло", msg)
             return
-        messagebox.showinfo("Готово", msg)
-        self._load_books()
-        self._load_loans()
+        self._invalidate_book(self._refresh_loan_row(loan_id))
 
     def _ui_update_overdue(self):
-        if not self.session.can("manage_loans"):
+        if "manage_loans" not in self._caps:
             return
         n = update_overdue_statuses()
         self.loan_info.config(text=f"Обновлено: {n}")
@@ -695,9 +940,7 @@ class MainWindow(tk.Tk):
 
     # Вкладка резервы
     def _build_reservations_tab(self):
-        tab = ttk.Frame(self.notebook, padding=10)
-        self.notebook.add(tab, text="Резервы")
-        self.tabs["Резервы"] = tab
+        tab = self.tabs["Резервы"]
 
         top = ttk.Frame(tab)
         top.pack(fill="x")
@@ -706,9 +949,9 @@ class MainWindow(tk.Tk):
 
         self.res_tree = ttk.Treeview(tab, show="headings", height=20)
         self._enable_grid(self.res_tree)
-        self.res_tree.pack(fill="both", expand=True, pady=(10, 0))
+        self._pack_tree(self.res_tree, fill="both", expand=True, pady=(10, 0))
 
-        self._add_search_box(top, self.res_tree, "Поиск:")
+        self._add_search_box(top, self.res_tree, "Поиск:", on_search=self._load_reservations)
 
         btns = ttk.Frame(tab)
         btns.pack(fill="x", pady=(10, 0))
@@ -717,11 +960,11 @@ class MainWindow(tk.Tk):
         self.btn_res_extend = ttk.Button(btns, text="Продлить на 1 день (1 раз)", command=self._ui_extend_reservation)
         self.btn_res_fulfill = ttk.Button(btns, text="Выдать по резерву", command=self._ui_fulfill_reservation)
 
-        if self.session.can("manage_own_reservations"):
+        if "manage_own_reservations" in self._caps:
             self.btn_res_cancel.pack(side="left")
             self.btn_res_extend.pack(side="left", padx=8)
 
-        if self.session.can("manage_reservations"):
+        if "manage_reservations" in self._caps:
             self.btn_res_fulfill.pack(side="left")
 
         self._load_reservations()
@@ -779,96 +1022,108 @@ class MainWindow(tk.Tk):
             self.res_tree.column(c, width=w, anchor="w")
 
     def _get_selected_reservation_id(self):
-        sel = self.res_tree.selection()
-        if not sel:
-            return None
-        vals = self.res_tree.item(sel[0], "values")
-        return int(vals[0])
+        return self._selected_id(self.res_tree)
 
     def _load_reservations(self):
-        expire_old_reservations()
+        search = self._search_text(self.res_tree)
 
-        if self.session.can("manage_reservations"):
+        if "manage_reservations" in self._caps:
             self._configure_res_tree_staff()
-            rows = list_reservations_for_librarian()
-
-            data = []
-            for r in rows:
-                data.append((
-                    r["id"],
-                    RES_STATUS_RU.get(r["status"], r["status"]),
-                    r.get("book_title") or "",
-                    r.get("inv") or "",
-                    f"{r.get('branch_name') or ''} | {r.get('branch_address') or ''}",
-                    str(r.get("pickup_date") or ""),
-                    str(r.get("expires_at") or ""),
-                    r.get("reader_name") or r.get("reader_login") or "",
-                    r.get("reader_phone") or "",
-                ))
+            rows = list_reservations_for_librarian(search=search, limit=_ROWS_LIMIT)
+            data = [self._res_row_staff(r) for r in rows]
             self._set_tree_data(self.res_tree, data)
             return
 
-        if self.session.can("manage_own_reservations"):
+        if "manage_own_reservations" in self._caps:
             self._configure_res_tree_reader()
-            rows = list_reservations_for_reader(self.session.user)
-
-            data = []
-            for r in rows:
-                data.append((
-                    r["id"],
-                    RES_STATUS_RU.get(r["status"], r["status"]),
-                    r.get("book_title") or "",
-                    f"{r.get('branch_name') or ''} | {r.get('branch_address') or ''}",
-                    str(r.get("pickup_date") or ""),
-                    str(r.get("expires_at") or ""),
-                    _yes_no(r.get("extended_once")),
-                ))
+            rows = list_reservations_for_reader(self.session.user, search=search, limit=_ROWS_LIMIT)
+            data = [self._res_row_reader(r) for r in rows]
             self._set_tree_data(self.res_tree, data)
             return
 
         self._set_tree_data(self.res_tree, [("Нет данных",)])
 
+    @staticmethod
+    def _res_row_staff(r):
+        return (
+            r["id"],
+            RES_STATUS_GET(r["status"], r["status"]),
+            r.get("book_title") or "",
+            r.get("inv") or "",
+            r["branch_display"],
+            str(r.get("pickup_date") or ""),
+            str(r.get("expires_at") or ""),
+            r.get("reader_name") or r.get("reader_login") or "",
+            r.get("reader_phone") or "",
+        )
+
+    @staticmethod
+    def _res_row_reader(r):
+        return (
+            r["id"],
+            RES_STATUS_GET(r["status"], r["status"]),
+            r.get("book_title") or "",
+            r["branch_display"],
+            str(r.get("pickup_date") or ""),
+            str(r.get("expires_at") or ""),
+            _yes_no(r.get("extended_once")),
+        )
+
+    def _refresh_reservation_row(self, reservation_id, prepend: bool = False):
+        """Перечитывает один резерв и правит его строку; возвращает id книги."""
+        if not reservation_id:
+            return None
+        if "manage_reservations" in self._caps:
+            rows = list_reservations_for_librarian(reservation_id=reservation_id)
+            build = self._res_row_staff
+        elif "manage_own_reservations" in self._caps:
+            rows = list_reservations_for_reader(self.session.user, reservation_id=reservation_id)
+            build = self._res_row_reader
+        else:
+            return None
+        if not rows:
+            return None
+        if self._tab_built("Резервы"):
+            self._enable_grid(self.res_tree).upsert_row(build(rows[0]), prepend=prepend)
+        return rows[0].get("book_id")
+
     def _ui_cancel_reservation(self):
-        if not self.session.can("manage_own_reservations"):
+        if "manage_own_reservations" not in self._caps:
             return
         rid = self._get_selected_reservation_id()
         if not rid:
             messagebox.showwarning("Ошибка", "Выберите резерв.")
             return
         ok, msg = cancel_reservation(self.session.user, rid)
-        messagebox.showinfo("Ок", msg) if ok else messagebox.showerror("Ошибка", msg)
-        self._load_books()
-        self._load_reservations()
+        self._notify(ok, msg)
+        self._invalidate_book(self._refresh_reservation_row(rid))
 
     def _ui_extend_reservation(self):
-        if not self.session.can("manage_own_reservations"):
+        if "manage_own_reservations" not in self._caps:
             return
         rid = self._get_selected_reservation_id()
         if not rid:
             messagebox.showwarning("Ошибка", "Выберите резерв.")
             return
         ok, msg = extend_reservation(self.session.user, rid)
-        messagebox.showinfo("Ок", msg) if ok else messagebox.showerror("Ошибка", msg)
-        self._load_reservations()
+        self._notify(ok, msg)
+        self._refresh_reservation_row(rid)
 
     def _ui_fulfill_reservation(self):
-        if not self.session.can("manage_reservations"):
+        if "manage_reservations" not in self._caps:
             return
         rid = self._get_selected_reservation_id()
         if not rid:
             messagebox.showwarning("Ошибка", "Выберите резерв.")
             return
-        ok, msg = fulfill_reservation(self.session.user, rid, loan_days=14)
-        messagebox.showinfo("Ок", msg) if ok else messagebox.showerror("Ошибка", msg)
-        self._load_books()
-        self._load_loans()
-        self._load_reservations()
+        ok, msg, loan_id = fulfill_reservation(self.session.user, rid, loan_days=14)
+        self._notify(ok, msg)
+        self._refresh_loan_row(loan_id)
+        self._invalidate_book(self._refresh_reservation_row(rid))
 
     # Вкладка Отчеты
     def _build_reports_tab(self):
-        tab = ttk.Frame(self.notebook, padding=10)
-        self.notebook.add(tab, text="Отчёты")
-        self.tabs["Отчёты"] = tab
+        tab = self.tabs["Отчёты"]
 
         top = ttk.Frame(tab)
         top.pack(fill="x")
@@ -883,15 +1138,18 @@ class MainWindow(tk.Tk):
                           state="readonly", width=40)
         cb.pack(side="left", padx=8)
         cb.bind("<<ComboboxSelected>>", lambda e: self._show_report())
+        ttk.Button(top, text="Обновить", command=self._refresh_report).pack(side="left")
 
-        ttk.Button(top, text="Экспорт CSV", command=self._export_csv).pack(side="left", padx=8)
-        ttk.Button(top, text="Экспорт JSON", command=self._export_json).pack(side="left", padx=8)
+        self.btn_export_csv = ttk.Button(top, text="Экспорт CSV", command=self._export_csv)
+        self.btn_export_csv.pack(side="left", padx=8)
+        self.btn_export_json = ttk.Button(top, text="Экспорт JSON", command=self._export_json)
+        self.btn_export_json.pack(side="left", padx=8)
 
         self.report_tree = ttk.Treeview(tab, show="headings", height=22)
         self._enable_grid(self.report_tree)
 
         self._add_search_box(top, self.report_tree, "Поиск:")
-        self.report_tree.pack(fill="both", expand=True, pady=(10, 0))
+        self._pack_tree(self.report_tree, fill="both", expand=True, pady=(10, 0))
 
         self._show_report()
 
@@ -900,121 +1158,183 @@ class MainWindow(tk.Tk):
         fn = getattr(self, 'reports', {}).get(name)
         if not fn:
             return []
-        return fn()
+        return self._results_cache.get(("report", name), fn)
+
+    def _get_export_rows(self):
+        # показанный отчёт уже в памяти; иначе строки читаются потоком прямо в фоновом экспорте
+        name = self.report_var.get()
+        fn = getattr(self, 'reports', {}).get(name)
+        if not fn:
+            return []
+        rows = self._results_cache.peek(("report", name))
+        return rows if rows is not None else iter_report_rows(fn)
 
     def _show_report(self):
         rows = self._get_report_rows()
         self._fill_tree(self.report_tree, rows)
 
+    def _refresh_report(self):
+        self._results_cache.clear()
+        self._show_report()
+
     def _export_csv(self):
-        rows = self._get_report_rows()
+        rows = self._get_export_rows()
+        filetypes = [("CSV", "*.csv")]
+        if ARROW_EXPORT_SUFFIXES:
+            filetypes += [("Parquet", "*.parquet"), ("Feather", "*.feather")]
         path = filedialog.asksaveasfilename(defaultextension=".csv",
-                                            filetypes=[("CSV", "*.csv")],
+                                            filetypes=filetypes,
                                             title="Сохранить CSV")
         if not path:
             return
-        try:
-            export_csv(rows, path)
-            messagebox.showinfo("Готово", f"Сохранено: {path}")
-        except Exception as e:
-            messagebox.showerror("Ошибка", str(e))
+        report = self.reports.get(self.report_var.get())
+        if Path(path).suffix.lower() in ARROW_EXPORT_SUFFIXES:
+            export, source = export_arrow, rows
+        elif report and can_export_csv_by_copy(report):
+            # широкие таблицы выгружает сам Postgres (COPY TO STDOUT)
+            export, source = export_csv_by_copy, report
+        else:
+            export, source = export_csv, rows
+        self._run_bg(
+            export, source, path,
+            on_done=lambda _: messagebox.showinfo("Готово", f"Сохранено: {path}"),
+            buttons=(self.btn_export_csv, self.btn_export_json),
+        )
 
     def _export_json(self):
-        rows = self._get_report_rows()
+        rows = self._get_export_rows()
         path = filedialog.asksaveasfilename(defaultextension=".json",
                                             filetypes=[("JSON", "*.json")],
                                             title="Сохранить JSON")
         if not path:
             return
-        try:
-            export_json(rows, path)
-            messagebox.showinfo("Готово", f"Сохранено: {path}")
-        except Exception as e:
-            messagebox.showerror("Ошибка", str(e))
+        self._run_bg(
+            export_json, rows, path,
+            on_done=lambda _: messagebox.showinfo("Готово", f"Сохранено: {path}"),
+            buttons=(self.btn_export_csv, self.btn_export_json),
+        )
 
     def _fill_tree(self, tree: ttk.Treeview, rows):
         if not rows:
-            tree["columns"] = ("empty",)
-            tree["show"] = "headings"
-            tree.heading("empty", text="Нет данных")
-            tree.column("empty", width=900, anchor="w")
+            if self._tree_cols.get(tree) != ("empty",):
+                tree.configure(columns=("empty",), show="headings")
+                tree.heading("empty", text="Нет данных")
+                tree.column("empty", width=900, anchor="w")
+                self._tree_cols[tree] = ("empty",)
             self._set_tree_data(tree, [("Нет данных",)])
             return
 
-        cols = list(rows[0].keys())
-        tree["columns"] = cols
-        tree["show"] = "headings"
-
-        for c in cols:
-            tree.heading(c, text=ru_header(c))
-            tree.column(c, width=180, anchor="w")
+        cols = tuple(rows[0].keys())
+        if self._tree_cols.get(tree) != cols:
+            tree.configure(columns=cols, show="headings")
 
-        data = []
-        for r in rows:
-            row_vals = []
             for c in cols:
-                row_vals.append(format_cell(c, r.get(c), row=r))
-            data.append(tuple(row_vals))
+                tree.heading(c, text=ru_header(c))
+                tree.column(c, width=180, anchor="w")
+            self._tree_cols[tree] = cols
+
+        # колонки без зависимости от строки форматируются через кэш значений
+        data = [
+            tuple(format_cell(c, r.get(c), row=r) if c in ROW_AWARE_COLUMNS else format_cell_cached(c, r.get(c))
+                  for c in cols)
+            for r in rows
+        ]
         self._set_tree_data(tree, data)
 
     # Вкладка бэкап
     def _build_backup_tab(self):
-        tab = ttk.Frame(self.notebook, padding=10)
-        self.notebook.add(tab, text="Бэкап")
-        self.tabs["Бэкап"] = tab
+        tab = self.tabs["Бэкап"]
 
         box = ttk.LabelFrame(tab, text="pg_dump (сделать бэкап)", padding=12)
         box.pack(fill="x")
 
-        ttk.Label(box, text="Файл бэкапа (.dump):").grid(row=0, column=0, sticky="w")
+        ttk.Label(box, text="Каталог бэкапа (или файл .dump / .dump.zst):").grid(row=0, column=0, sticky="w")
 
-        self.backup_path_var = tk.StringVar(value="backup/library_backup.dump")
+        self._auto_backup_path = _default_backup_path()
+        self.backup_path_var = tk.StringVar(value=self._auto_backup_path)
         ttk.Entry(box, textvariable=self.backup_path_var, width=60).grid(row=0, column=1, sticky="w", padx=(8, 0))
 
         ttk.Button(box, text="Выбрать...", command=self._choose_backup_path).grid(row=0, column=2, sticky="w",
                                                                                  padx=(8, 0))
-        ttk.Button(box, text="Сделать бэкап", command=self._do_backup).grid(row=1, column=1, sticky="w",
-                                                                            pady=(10, 0))
+        ttk.Label(box, text="Потоков:").grid(row=1, column=0, sticky="w", pady=(10, 0))
+        self.backup_jobs_var = tk.IntVar(value=BACKUP_JOBS_DEFAULT)
+        ttk.Spinbox(box, from_=1, to=32, width=5, textvariable=self.backup_jobs_var).grid(
+            row=1, column=1, sticky="w", padx=(8, 0), pady=(10, 0))
 
-        self.backup_info = ttk.Label(box, text="Лог: logs/backup.log", foreground="#444")
-        self.backup_info.grid(row=2, column=0, columnspan=3, sticky="w", pady=(10, 0))
+        self.btn_backup = ttk.Button(box, text="Сделать бэкап", command=self._do_backup)
+        self.btn_backup.grid(row=2, column=1, sticky="w", pady=(10, 0))
+
+        self.backup_info = ttk.Label(box, text="Лог: logs/backup.log (потоки работают только для каталога)",
+                                     foreground="#444")
+        self.backup_info.grid(row=3, column=0, columnspan=3, sticky="w", pady=(10, 0))
 
         box2 = ttk.LabelFrame(tab, text="pg_restore (восстановить из дампа)", padding=12)
         box2.pack(fill="x", pady=(12, 0))
 
-        ttk.Label(box2, text="Дамп для восстановления (.dump):").grid(row=0, column=0, sticky="w")
+        ttk.Label(box2, text="Дамп для восстановления (каталог, .dump или .dump.zst):").grid(row=0, column=0, sticky="w")
 
-        self.restore_path_var = tk.StringVar(value="backup/library_backup.dump")
+        # после бэкапа сюда подставляется только что созданный дамп
+        self.restore_path_var = tk.StringVar(value="")
         ttk.Entry(box2, textvariable=self.restore_path_var, width=60).grid(row=0, column=1, sticky="w", padx=(8, 0))
 
-        ttk.Button(box2, text="Выбрать...", command=self._choose_restore_path).grid(row=0, column=2, sticky="w",
-                                                                                   padx=(8, 0))
+        ttk.Button(box2, text="Каталог...", command=self._choose_restore_dir).grid(row=0, column=2, sticky="w",
+                                                                                  padx=(8, 0))
+        ttk.Button(box2, text="Файл...", command=self._choose_restore_path).grid(row=0, column=3, sticky="w",
+                                                                                padx=(8, 0))
 
         ttk.Label(
             box2,
             text="ВНИМАНИЕ: восстановление перезатрёт текущую базу (clean).",
             foreground="#a00"
-        ).grid(row=1, column=0, columnspan=3, sticky="w", pady=(8, 0))
+        ).grid(row=1, column=0, columnspan=4, sticky="w", pady=(8, 0))
 
-        ttk.Button(box2, text="Восстановить из дампа", command=self._do_restore).grid(row=2, column=1, sticky="w",
-                                                                                     pady=(10, 0))
+        self.btn_restore = ttk.Button(box2, text="Восстановить из дампа", command=self._do_restore)
+        self.btn_restore.grid(row=2, column=1, sticky="w", pady=(10, 0))
 
     def _choose_backup_path(self):
-        path = filedialog.asksaveasfilename(defaultextension=".dump",
-                                            filetypes=[("PostgreSQL dump", "*.dump"), ("All files", "*.*")],
+        # без расширения — каталог для -Fd, с .dump — однофайловый дамп, .dump.zst — он же через zstd
+        path = filedialog.asksaveasfilename(filetypes=[("Каталог дампа", "*"), ("PostgreSQL dump", "*.dump"),
+                                                       ("PostgreSQL dump + zstd", "*.dump.zst")],
                                             title="Куда сохранить бэкап")
         if path:
             self.backup_path_var.set(path)
 
+    def _choose_restore_dir(self):
+        path = filedialog.askdirectory(title="Выберите каталог дампа", mustexist=True)
+        if path:
+            self.restore_path_var.set(path)
+
     def _choose_restore_path(self):
-        path = filedialog.askopenfilename(filetypes=[("PostgreSQL dump", "*.dump"), ("All files", "*.*")],
+        path = filedialog.askopenfilename(filetypes=[("PostgreSQL dump", "*.dump"),
+                                                     ("PostgreSQL dump + zstd", "*.dump.zst"), ("All files", "*.*")],
                                           title="Выберите дамп для восстановления")
         if path:
             self.restore_path_var.set(path)
 
+    def _backup_jobs(self) -> int:
+        try:
+            return max(1, int(self.backup_jobs_var.get()))
+        except (tk.TclError, ValueError):
+            return BACKUP_JOBS_DEFAULT
+
     def _do_backup(self):
-        ok, msg = make_backup(self.session, self.backup_path_var.get())
-        messagebox.showinfo("Готово", msg) if ok else messagebox.showerror("Ошибка", msg)
+        path = self.backup_path_var.get().strip()
+        if path == self._auto_backup_path:
+            # путь по умолчанию не меняли вручную — новое имя на каждый запуск
+            path = self._auto_backup_path = _default_backup_path()
+            self.backup_path_var.set(path)
+
+        def done(res):
+            ok, msg = res
+            if ok:
+                self.restore_path_var.set(path)
+            self._notify(ok, msg, ok_title="Готово")
+
+        self._run_bg(
+            make_backup, self.session, path, self._backup_jobs(),
+            on_done=done,
+            buttons=(self.btn_backup, self.btn_restore),
+        )
 
     def _do_restore(self):
         path = self.restore_path_var.get().strip()
@@ -1026,14 +1346,18 @@ class MainWindow(tk.Tk):
             "Точно восстановить БД из дампа?\nТекущие данные будут перезаписаны.",
         ):
             return
-        ok, msg = restore_backup(self.session, path)
-        messagebox.showinfo("Готово", msg) if ok else messagebox.showerror("Ошибка", msg)
+        # соединение главного потока закрываем до pg_restore --clean; peewee переподключится сам
+        if not db.is_closed():
+            db.close()
+        self._run_bg(
+            restore_backup, self.session, path, self._backup_jobs(),
+            on_done=lambda res: self._notify(*res, ok_title="Готово"),
+            buttons=(self.btn_backup, self.btn_restore),
+        )
 
     # Вкладка пользователи
     def _build_users_tab(self):
-        tab = ttk.Frame(self.notebook, padding=10)
-        self.notebook.add(tab, text="Пользователи")
-        self.tabs["Пользователи"] = tab
+        tab = self.tabs["Пользователи"]
 
         self.users_tree = ttk.Treeview(
             tab,
@@ -1064,7 +1388,7 @@ class MainWindow(tk.Tk):
         top = ttk.Frame(tab)
         top.pack(fill="x")
 
-        ttk.Button(top, text="Обновить", command=self._load_users).pack(side="left")
+        ttk.Button(top, text="Обновить", command=self._refresh_users).pack(side="left")
         self._add_search_box(top, self.users_tree, "Поиск:")
 
         ttk.Label(top, text="Показать:").pack(side="left", padx=(12, 4))
@@ -1095,7 +1419,7 @@ class MainWindow(tk.Tk):
         self.btn_user_delete = ttk.Button(top, text="Удалить пользователя", command=self._ui_delete_user)
         self.btn_user_delete.pack(side="right", padx=8)
 
-        self.users_tree.pack(fill="both", expand=True, pady=(10, 0))
+        self._pack_tree(self.users_tree, fill="both", expand=True, pady=(10, 0))
 
         self._load_users()
 
@@ -1107,36 +1431,32 @@ class MainWindow(tk.Tk):
             return "Reader"
         return None
 
+    def _refresh_users(self):
+        self._results_cache.clear()
+        self._load_users()
+
     def _load_users(self):
         role = self._filter_to_role()
-        rows = list_users_filtered(role)
-
-        data = []
-        for r in rows:
-            roles_ru = roles_label_list(r.get("roles") or "")
-            data.append((
-                r["id"],
-                r["login"],
-                r["full_name"],
-                r.get("phone") or "",
-                "Да" if r["is_active"] else "Нет",
-                roles_ru
-            ))
+        rows = self._results_cache.get(("users", role), lambda: list_users_filtered(role))
+
+        # сочетаний ролей немного: переводим каждое один раз на загрузку
+        label_by = {s: roles_label_list(s) for s in {r.get("roles") or "" for r in rows}}
+        data = [
+            (*_USER_MAIN_COLS(r), r.get("phone") or "", _YES_NO[bool(r["is_active"])],
+             label_by[r.get("roles") or ""])
+            for r in rows
+        ]
         self._set_tree_data(self.users_tree, data)
 
     def _get_selected_user_row(self):
-        sel = self.users_tree.selection()
-        if not sel:
-            return None
-        return self.users_tree.item(sel[0], "values")
+        return self._selected_row(self.users_tree)
 
     def _get_selected_user_id(self):
-        vals = self._get_selected_user_row()
-        if not vals:
-            return None
-        return int(vals[0])
+        return self._selected_id(self.users_tree)
 
     def _ui_register_librarian(self):
+        # диалоги пользователей нужны только админу — модуль грузится при первом открытии
+        from app.gui_users_dialogs import RegisterLibrarianDialog
         dlg = RegisterLibrarianDialog(self)
         self.wait_window(dlg)
         if not dlg.result:
@@ -1149,7 +1469,7 @@ class MainWindow(tk.Tk):
             phone=dlg.result["phone"],
             password=dlg.result["password"]
         )
-        messagebox.showinfo("Ок", msg) if ok else messagebox.showerror("Ошибка", msg)
+        self._notify(ok, msg)
         if ok:
             self._load_users()
 
@@ -1164,7 +1484,7 @@ class MainWindow(tk.Tk):
         new_active = not current_active
 
         ok, msg = set_user_active(self.session, user_id, new_active)
-        messagebox.showinfo("Ок", msg) if ok else messagebox.showerror("Ошибка", msg)
+        self._notify(ok, msg)
         if ok:
             self._load_users()
 
@@ -1174,13 +1494,14 @@ class MainWindow(tk.Tk):
             messagebox.showwarning("Ошибка", "Выберите пользователя.")
             return
 
+        from app.gui_users_dialogs import ResetPasswordDialog
         dlg = ResetPasswordDialog(self)
         self.wait_window(dlg)
         if not dlg.result:
             return
 
         ok, msg = reset_user_password(self.session, user_id, dlg.result)
-        messagebox.showinfo("Ок", msg) if ok else messagebox.showerror("Ошибка", msg)
+        self._notify(ok, msg)
 
     def _ui_edit_user(self):
         vals = self._get_selected_user_row()
@@ -1192,13 +1513,14 @@ class MainWindow(tk.Tk):
         current_full_name = vals[2]
         current_phone = vals[3]
 
+        from app.gui_users_dialogs import EditUserDialog
         dlg = EditUserDialog(self, current_full_name, current_phone)
         self.wait_window(dlg)
         if not dlg.result:
             return
 
         ok, msg = update_user_profile(self.session, user_id, dlg.result["full_name"], dlg.result["phone"])
-        messagebox.showinfo("Ок", msg) if ok else messagebox.showerror("Ошибка", msg)
+        self._notify(ok, msg)
         if ok:
             self._load_users()
 
@@ -1218,10 +1540,46 @@ class MainWindow(tk.Tk):
             return
 
         ok, msg = delete_user(self.session, user_id)
-        messagebox.showinfo("Ок", msg) if ok else messagebox.showerror("Ошибка", msg)
+        self._notify(ok, msg)
         if ok:
             self._load_users()
 
+    # Фоновые операции
+    def _run_bg(self, fn, *args, on_done, buttons=()):
+        """Запускает fn(*args) в фоновом потоке; on_done(результат) вызывается в mainloop."""
+        for b in buttons:
+            b.state(["disabled"])
+        if not self._bg_running:
+            self.bg_progress.pack(side="right", padx=(0, 12))
+            self.bg_progress.start(12)
+        self._bg_running += 1
+
+        fut = self._bg_pool.submit(_run_in_worker, fn, *args)
+        self.after(100, self._poll_bg, fut, on_done, buttons)
+
+    def _poll_bg(self, fut, on_done, buttons):
+        if not fut.done():
+            self.after(100, self._poll_bg, fut, on_done, buttons)
+            return
+
+        self._bg_running -= 1
+        if not self._bg_running:
+            self.bg_progress.stop()
+            self.bg_progress.pack_forget()
+        for b in buttons:
+            b.state(["!disabled"])
+
+        try:
+            result = fut.result()
+        except Exception as e:
+            messagebox.showerror("Ошибка", str(e))
+            return
+        on_done(result)
+
+    def destroy(self):
+        self._bg_pool.shutdown(wait=False)
+        super().destroy()
+
     def _logout(self):
         if messagebox.askyesno("Выход", "Выйти из аккаунта?"):
             self.logged_out = True
@@ -15,6 +15,7 @@ class ReserveDialog(tk.Toplevel):
         self.book_id = book_id
         self.book_title = book_title
         self.result_ok = False
+        self.result_id = None
 
         frm = ttk.Frame(self, padding=14)
         frm.pack(fill="both", expand=True)
@@ -48,24 +49,22 @@ class ReserveDialog(tk.Toplevel):
 
     def _load_branches(self):
         branches = list_available_branches_for_book(self.book_id)
-        self._branches = branches
+        self._branch_ids = tuple(int(b["branch_id"]) for b in branches)
 
         if not branches:
             messagebox.showwarning("Печаль", "Эта книга сейчас нигде не доступна для резерва.")
             self.destroy()
             return
 
-        items = []
-        for b in branches:
-            items.append(f"{b['name']} | {b.get('address') or '—'} | доступно: {b['available_count']}")
-        self.branch_cb["values"] = items
+        self.branch_cb["values"] = tuple(
+            f"{b['name']} | {b.get('address') or '—'} | доступно: {b['available_count']}" for b in branches
+        )
         self.branch_cb.current(0)
 
     def _parse_date(self):
         try:
-            y, m, d = self.date_var.get().strip().split("-")
-            return date(int(y), int(m), int(d))
-        except Exception:
+            return date.fromisoformat(self.date_var.get().strip())
+        except ValueError:
             return None
 
     def _do(self):
@@ -79,12 +78,13 @@ class ReserveDialog(tk.Toplevel):
             messagebox.showwarning("Ошибка", "Дата должна быть в формате YYYY-MM-DD.")
             return
 
-        branch_id = int(self._branches[idx]["branch_id"])
-        ok, msg, _rid = create_reservation(self.reader_user, self.book_id, branch_id, pickup)
+        branch_id = self._branch_ids[idx]
+        ok, msg, rid = create_reservation(self.reader_user, self.book_id, branch_id, pickup)
         if not ok:
             messagebox.showerror("Ошибка", msg)
             return
 
         messagebox.showinfo("Ок", msg)
         self.result_ok = True
+        self.result_id = rid
         self.destroy()
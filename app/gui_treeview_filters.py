@@ -1,6 +1,15 @@
+import re
 import tkinter as tk
 from tkinter import ttk
-from typing import Any, List, Optional, Sequence, Tuple
+from typing import Any, Callable, List, Optional, Sequence, Set, Tuple
+
+# С какого числа строк дерево держит в себе только видимое окно
+_VIRTUAL_THRESHOLD = 300
+# Запас строк под окном, чтобы частичная строка внизу не была пустой
+_OVERSCAN = 5
+_DEFAULT_ROW_HEIGHT = 20
+# Фильтр применяется после паузы в наборе, а не на каждую клавишу
+_SEARCH_DEBOUNCE_MS = 120
 
 
 def _to_str(v: Any) -> str:
@@ -9,18 +18,48 @@ def _to_str(v: Any) -> str:
     return str(v)
 
 
+# Число в ячейке: проверяем регуляркой, а не ловим исключение float() на каждой текстовой ячейке
+_NUM_RE = re.compile(r"-?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)")
+
+
 def _try_num(v: str):
     s = (v or "").strip().replace(",", ".")
-    try:
-        return float(s)
-    except Exception:
-        return None
+    return float(s) if _NUM_RE.fullmatch(s) else None
+
+
+def _haystack(row: Tuple[Any, ...]) -> str:
+    # строка для поиска подстроки по всем значениям
+    return " | ".join(_to_str(x).lower() for x in row)
+
+
+# Индекс триграмм строится только для больших таблиц и запросов не короче триграммы
+_NGRAM = 3
+
+
+def _ngram_index(hays: List[str]) -> dict:
+    """Триграмма -> номера строк, в haystack которых она встречается."""
+    index: dict = {}
+    for i, h in enumerate(hays):
+        for g in {h[j:j + _NGRAM] for j in range(len(h) - _NGRAM + 1)}:
+            bucket = index.get(g)
+            if bucket is None:
+                index[g] = [i]
+            else:
+                bucket.append(i)
+    return index
+
+
+def _sort_key(v: Any):
+    s = _to_str(v)
+    n = _try_num(s)
+    return (0, n) if n is not None else (1, s.lower())
 
 
 class TreeviewGridController:
     """
     - Click header: sort ASC/DESC
-    - Search: substring filter across ALL columns
+    - Search: every word of the query must occur in some column (substring match)
+    - Large result sets: only the visible window of rows lives in the tree
     """
     def __init__(self, tree: ttk.Treeview):
         self.tree = tree
@@ -33,59 +72,337 @@ class TreeviewGridController:
 
         # search
         self.search_text: str = ""
+        self._search_pending: Optional[str] = None
+        self._search_after = None
+        # строки поиска и ключи сортировки считаются один раз на данные, параллельно all_rows
+        self._haystacks: List[str] = []
+        self._sort_keys: dict = {}  # индекс колонки -> ключи по строкам, заполняется при первой сортировке
+        # результат прошлого фильтра (индексы all_rows): если запрос лишь дописали, фильтруем его
+        self._last_query: Optional[Tuple[str, ...]] = None
+        self._last_filtered: List[int] = []
+        # триграммный индекс по _haystacks; строится при первом поиске, который не сузил прошлый
+        self._ngrams: Optional[dict] = None
+
+        # строки после поиска/сортировки; iid в дереве = "v<индекс в этом списке>"
+        self._view: List[Tuple[Any, ...]] = []
+        # id строки (первая колонка) -> индекс в _view, для точечного обновления
+        self._index_by_key: dict = {}
+        # id строки -> исходная запись из сервиса (типизированные значения, без разбора строк)
+        self._row_by_id: dict = {}
+
+        # окно отрисовки: первая строка и диапазон [start, stop) строк _view, уже вставленных в дерево
+        self._first = 0
+        self._win: Optional[Tuple[int, int]] = None
+        # значения строк окна в том виде, в каком они сейчас стоят в дереве
+        self._shown: List[Tuple[Any, ...]] = []
+        self._selected: Set[int] = set()
+        self._yscroll: Optional[Callable[[float, float], Any]] = None
 
         self.tree.bind("<Button-1>", self._on_click, add=True)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select, add=True)
+        self.tree.bind("<Configure>", self._on_configure, add=True)
+        self.tree.bind("<MouseWheel>", self._on_wheel, add=True)
+        self.tree.bind("<Button-4>", self._on_wheel, add=True)
+        self.tree.bind("<Button-5>", self._on_wheel, add=True)
+        self.tree.bind("<Up>", lambda e: self._on_step(-1), add=True)
+        self.tree.bind("<Down>", lambda e: self._on_step(1), add=True)
+        self.tree.bind("<Prior>", lambda e: self._on_step(-self._visible_count()), add=True)
+        self.tree.bind("<Next>", lambda e: self._on_step(self._visible_count()), add=True)
 
-    def set_data(self, rows: Sequence[Tuple[Any, ...]]):
+    def set_data(self, rows: Sequence[Tuple[Any, ...]], records: Optional[Sequence[dict]] = None):
         self.columns = list(self.tree["columns"])
         self.all_rows = list(rows)
+        self._haystacks = [_haystack(r) for r in self.all_rows]
+        self._sort_keys = {}
+        self._last_query = None
+        self._ngrams = None
+        self._row_by_id = {r["id"]: r for r in records} if records else {}
         self.apply()
 
-    def set_search(self, text: str):
-        self.search_text = (text or "").strip().lower()
+    def get_row(self, item_id: Any) -> Optional[dict]:
+        """Исходная запись по id (первая колонка), если её передали в set_data."""
+        return self._row_by_id.get(item_id)
+
+    def selected_row(self) -> Optional[Tuple[Any, ...]]:
+        """Первая выделенная строка; выделение ведётся по <<TreeviewSelect>>, без запросов к Tcl."""
+        if not self._selected:
+            return None
+        i = min(self._selected)
+        return self._view[i] if i < len(self._view) else None
+
+    def upsert_row(self, row: Tuple[Any, ...], prepend: bool = False, record: Optional[dict] = None):
+        """Заменяет строку с тем же id (первая колонка) или добавляет новую."""
+        row = tuple(row)
+        key = row[0]
+        self._last_query = None
+        self._ngrams = None
+        if record is not None:
+            self._row_by_id[key] = record
+        for i, r in enumerate(self.all_rows):
+            if r and r[0] == key:
+                if r == row:
+                    return
+                self.all_rows[i] = row
+                self._haystacks[i] = _haystack(row)
+                for c, keys in self._sort_keys.items():
+                    keys[i] = _sort_key(row[c])
+                idx = self._index_by_key.get(key)
+                # без поиска/сортировки позиция не меняется — правим строку на месте
+                if idx is not None and not self.search_text and not self.sort_col:
+                    self._view[idx] = row
+                    self._render_window()
+                    return
+                break
+        else:
+            pos = 0 if prepend else len(self.all_rows)
+            self.all_rows.insert(pos, row)
+            self._haystacks.insert(pos, _haystack(row))
+            for c, keys in self._sort_keys.items():
+                keys.insert(pos, _sort_key(row[c]))
         self.apply()
 
+    def set_search(self, text: str):
+        self._search_pending = (text or "").strip().lower()
+        self._cancel_pending_search()
+        self._search_after = self.tree.after(_SEARCH_DEBOUNCE_MS, self._apply_debounced)
+
     def clear_search(self):
+        self._cancel_pending_search()
         self.search_text = ""
         self.apply()
 
+    def _cancel_pending_search(self):
+        if self._search_after is not None:
+            self.tree.after_cancel(self._search_after)
+            self._search_after = None
+
+    def _apply_debounced(self):
+        self._search_after = None
+        if self._search_pending != self.search_text:
+            self.search_text = self._search_pending
+            self.apply()
+
     def apply(self):
-        rows = self._searched_rows()
-        rows = self._sorted_rows(rows)
-        self._render(rows)
+        idx = self._searched_indices()
+        idx = self._sorted_indices(idx)
+        rows = self.all_rows
+        self._render([rows[i] for i in idx])
+
+    def attach_scrollbar(self, set_fn: Callable[[float, float], Any]):
+        """Передать scrollbar.set; команду скроллбара вешать на ctl.yview."""
+        self._yscroll = set_fn
+        self.tree.configure(yscrollcommand=self._on_tree_yscroll)
+
+    def yview(self, *args):
+        """Аналог Treeview.yview для скроллбара (moveto / scroll N units|pages)."""
+        if not self._is_virtual():
+            return self.tree.yview(*args)
+        if not args:
+            return self._fractions()
+        visible = self._visible_count()
+        if args[0] == "moveto":
+            self._scroll_to(int(float(args[1]) * len(self._view)))
+        elif args[0] == "scroll":
+            step = int(args[1]) * (visible if args[2] == "pages" else 1)
+            self._scroll_to(self._first + step)
 
     # ---------- render ----------
     def _render(self, rows: List[Tuple[Any, ...]]):
-        self.tree.delete(*self.tree.get_children())
-        for row in rows:
-            self.tree.insert("", "end", values=row)
+        # выделение переносим по id строки: после обновления данных она может сменить позицию
+        old_view = self._view
+        selected_keys = {old_view[i][0] for i in self._selected if i < len(old_view) and old_view[i]}
+
+        self._view = rows
+        self._index_by_key = {row[0]: i for i, row in enumerate(rows) if row}
+        self._first = 0
+        index = self._index_by_key
+        self._selected = {index[k] for k in selected_keys if k in index}
+        self._render_window()
+
+    def _is_virtual(self) -> bool:
+        return len(self._view) > _VIRTUAL_THRESHOLD
+
+    def _visible_count(self) -> int:
+        h = self.tree.winfo_height()
+        if h <= 1:
+            # ещё не отрисовано — берём высоту из настроек
+            return max(1, int(self.tree.cget("height")))
+        row_h = ttk.Style().lookup("Treeview", "rowheight")
+        try:
+            row_h = int(row_h)
+        except (TypeError, ValueError):
+            row_h = _DEFAULT_ROW_HEIGHT
+        # минус строка заголовков
+        return max(1, h // row_h - 1)
+
+    def _render_window(self):
+        tree = self.tree
+
+        if self._is_virtual():
+            start = self._first
+            stop = min(len(self._view), start + self._visible_count() + _OVERSCAN)
+        else:
+            start, stop = 0, len(self._view)
+
+        # прямой вызов Tcl-команды виджета: без разбора опций Treeview.insert на каждую строку;
+        # кортеж значений уходит в Tcl как список без склейки в строку
+        call, w, view = tree.tk.call, tree._w, self._view
+
+        win = self._win
+        if win is None or stop <= win[0] or start >= win[1]:
+            tree.delete(*tree.get_children())
+            for i in range(start, stop):
+                call(w, "insert", "", "end", "-id", f"v{i}", "-values", view[i])
+        else:
+            # окна пересекаются: убираем ушедшие строки, в общих правим только изменившиеся,
+            # дорисовываем пришедшие
+            old_start, old_stop = win
+            drop = [f"v{i}" for i in range(old_start, start)] + [f"v{i}" for i in range(stop, old_stop)]
+            if drop:
+                tree.delete(*drop)
+            shown = self._shown
+            for i in range(max(start, old_start), min(stop, old_stop)):
+                row = view[i]
+                if shown[i - old_start] != row:
+                    call(w, "item", f"v{i}", "-values", row)
+            for i in range(min(old_start, stop) - 1, start - 1, -1):
+                call(w, "insert", "", 0, "-id", f"v{i}", "-values", view[i])
+            for i in range(max(old_stop, start), stop):
+                call(w, "insert", "", "end", "-id", f"v{i}", "-values", view[i])
+        self._win = (start, stop)
+        self._shown = view[start:stop]
+
+        keep = [f"v{i}" for i in self._selected if start <= i < stop]
+        if set(keep) != set(tree.selection()):
+            tree.selection_set(keep)
+        self._push_scrollbar()
+
+    def _scroll_to(self, first: int):
+        first = max(0, min(first, len(self._view) - self._visible_count()))
+        if first != self._first:
+            self._first = first
+            self._render_window()
+
+    def _fractions(self) -> Tuple[float, float]:
+        n = len(self._view)
+        if not n:
+            return 0.0, 1.0
+        return self._first / n, min(1.0, (self._first + self._visible_count()) / n)
+
+    def _push_scrollbar(self):
+        if self._yscroll is not None and self._is_virtual():
+            self._yscroll(*self._fractions())
+
+    def _on_tree_yscroll(self, first, last):
+        # в виртуальном режиме положение ползунка считаем сами
+        if self._yscroll is not None and not self._is_virtual():
+            self._yscroll(first, last)
+
+    # ---------- events ----------
+    def _on_select(self, _event=None):
+        sel = set(self.tree.selection())
+        # <<TreeviewSelect>> приходит из очереди событий, в том числе после перерисовки окна,
+        # удалившей выделенные строки. Совпадает с выделением, выставленным окном, — это оно и есть,
+        # выделение вне окна сохраняем; иначе выделение сменил пользователь — заменяем целиком
+        win = self._win
+        if win is not None and sel == {f"v{i}" for i in self._selected if win[0] <= i < win[1]}:
+            return
+        self._selected = {int(iid[1:]) for iid in sel}
+
+    def _on_configure(self, _event=None):
+        if self._is_virtual():
+            self._render_window()
+
+    def _on_wheel(self, event: tk.Event):
+        if not self._is_virtual():
+            return None
+        if getattr(event, "num", None) == 4 or getattr(event, "delta", 0) > 0:
+            self._scroll_to(self._first - 3)
+        else:
+            self._scroll_to(self._first + 3)
+        return "break"
+
+    def _on_step(self, delta: int):
+        if not self._is_virtual() or not self._view:
+            return None
+        cur = self.tree.focus()
+        idx = int(cur[1:]) if cur.startswith("v") else self._first
+        idx = max(0, min(idx + delta, len(self._view) - 1))
+
+        visible = self._visible_count()
+        if idx < self._first:
+            self._scroll_to(idx)
+        elif idx >= self._first + visible:
+            self._scroll_to(idx - visible + 1)
+
+        iid = f"v{idx}"
+        if self.tree.exists(iid):
+            self._selected = {idx}
+            self.tree.selection_set(iid)
+            self.tree.focus(iid)
+        return "break"
 
     # ---------- search ----------
-    def _searched_rows(self) -> List[Tuple[Any, ...]]:
+    def _searched_indices(self) -> List[int]:
         q = self.search_text
         if not q:
-            return list(self.all_rows)
-
-        out: List[Tuple[Any, ...]] = []
-        for row in self.all_rows:
-            # ищем подстроку по всем значениям
-            hay = " | ".join(_to_str(x).lower() for x in row)
-            if q in hay:
-                out.append(row)
+            self._last_query = None
+            return list(range(len(self.all_rows)))
+
+        # слова запроса ищутся по отдельности, строка должна содержать каждое
+        tokens = tuple(q.split())
+
+        # монотонный фильтр: строки, не прошедшие "abc", не пройдут и "abcd" или "abc de";
+        # годится, если каждое прошлое слово входит в какое-то из новых
+        last = self._last_query
+        hays = self._haystacks
+        if last and all(any(t in n for n in tokens) for t in last):
+            source = self._last_filtered
+        elif len(hays) > _VIRTUAL_THRESHOLD and any(len(t) >= _NGRAM for t in tokens):
+            source = self._ngram_candidates(tokens)
+        else:
+            source = range(len(self.all_rows))
+
+        if len(tokens) == 1:
+            t = tokens[0]
+            out = [i for i in source if t in hays[i]]
+        else:
+            out = [i for i in source if all(t in hays[i] for t in tokens)]
+        self._last_query = tokens
+        self._last_filtered = out
         return out
 
+    def _ngram_candidates(self, tokens: Tuple[str, ...]) -> List[int]:
+        # строки, содержащие все триграммы слов запроса; сами слова всё равно проверяет вызывающий
+        if self._ngrams is None:
+            self._ngrams = _ngram_index(self._haystacks)
+        index = self._ngrams
+        buckets = []
+        for q in tokens:
+            for j in range(len(q) - _NGRAM + 1):
+                bucket = index.get(q[j:j + _NGRAM])
+                if bucket is None:
+                    return []
+                buckets.append(bucket)
+        buckets.sort(key=len)
+        cand = set(buckets[0])
+        for b in buckets[1:]:
+            cand.intersection_update(b)
+            if not cand:
+                return []
+        return sorted(cand)
+
     # ---------- sorting ----------
-    def _sorted_rows(self, rows: List[Tuple[Any, ...]]) -> List[Tuple[Any, ...]]:
+    def _sorted_indices(self, idx: List[int]) -> List[int]:
         if not self.sort_col or self.sort_col not in self.columns:
-            return rows
-        i = self.columns.index(self.sort_col)
+            return idx
+        c = self.columns.index(self.sort_col)
 
-        def key_fn(r):
-            s = _to_str(r[i])
-            n = _try_num(s)
-            return (0, n) if n is not None else (1, s.lower())
+        keys = self._sort_keys.get(c)
+        if keys is None:
+            keys = self._sort_keys[c] = [_sort_key(r[c]) for r in self.all_rows]
 
-        return sorted(rows, key=key_fn, reverse=self.sort_desc)
+        return sorted(idx, key=keys.__getitem__, reverse=self.sort_desc)
 
     def _on_click(self, event: tk.Event):
         region = self.tree.identify_region(event.x, event.y)
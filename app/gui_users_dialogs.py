@@ -1,56 +1,84 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 
+# Строка формы: (подпись, опции Entry); опции None — подсказка под предыдущим полем
+FormRow = Tuple[str, Optional[Dict[str, Any]]]
 
-class RegisterLibrarianDialog(tk.Toplevel):
-    def __init__(self, parent):
+_PHONE_HINT: FormRow = ("(формат +7xxxxxxxxxx)", None)
+
+
+class _FormDialog(tk.Toplevel):
+    """
+    Модальный диалог "подпись — поле" с кнопками Отмена/OK; форма строится одним циклом.
+    Поля читаются через Entry.get() при OK — без StringVar и трассировки Tcl-переменных.
+    Подкласс определяет _ok(): проверка полей, запись result и закрытие окна.
+    """
+
+    def __init__(self, parent, title: str):
         super().__init__(parent)
-        self.title("Регистрация нового библиотекаря")
+        self._parent = parent
+        self.title(title)
         self.resizable(False, False)
-        self.result: Optional[Dict[str, Any]] = None
+        self.result = None
 
-        frm = ttk.Frame(self, padding=12)
-        frm.pack(fill="both", expand=True)
-
-        ttk.Label(frm, text="Фамилия:").grid(row=0, column=0, sticky="w")
-        ttk.Label(frm, text="Имя:").grid(row=1, column=0, sticky="w", pady=(8, 0))
-        ttk.Label(frm, text="Отчество:").grid(row=2, column=0, sticky="w", pady=(8, 0))
-        ttk.Label(frm, text="Телефон:").grid(row=3, column=0, sticky="w", pady=(8, 0))
-        ttk.Label(frm, text="(формат +7xxxxxxxxxx)").grid(row=4, column=1, sticky="w", padx=(8, 0), pady=(2, 0))
-        ttk.Label(frm, text="Логин:").grid(row=5, column=0, sticky="w", pady=(8, 0))
-        ttk.Label(frm, text="Пароль:").grid(row=6, column=0, sticky="w", pady=(8, 0))
-
-        self.last_name_var = tk.StringVar()
-        self.first_name_var = tk.StringVar()
-        self.patronymic_var = tk.StringVar()
-        self.phone_var = tk.StringVar()
-        self.login_var = tk.StringVar()
-        self.pass_var = tk.StringVar()
-
-        ttk.Entry(frm, textvariable=self.last_name_var, width=38).grid(row=0, column=1, sticky="w", padx=(8, 0))
-        ttk.Entry(frm, textvariable=self.first_name_var, width=38).grid(row=1, column=1, sticky="w", padx=(8, 0), pady=(8, 0))
-        ttk.Entry(frm, textvariable=self.patronymic_var, width=38).grid(row=2, column=1, sticky="w", padx=(8, 0), pady=(8, 0))
-        ttk.Entry(frm, textvariable=self.phone_var, width=38).grid(row=3, column=1, sticky="w", padx=(8, 0), pady=(8, 0))
-        ttk.Entry(frm, textvariable=self.login_var, width=38).grid(row=5, column=1, sticky="w", padx=(8, 0), pady=(8, 0))
-        ttk.Entry(frm, textvariable=self.pass_var, show="*", width=38).grid(row=6, column=1, sticky="w", padx=(8, 0), pady=(8, 0))
+        self.frm = ttk.Frame(self, padding=12)
+        self.frm.pack(fill="both", expand=True)
+
+    def _build_form(self, rows: List[FormRow], entry_width: int, ok_text: str) -> List[ttk.Entry]:
+        """Строит форму и возвращает поля ввода в порядке строк (без подсказок)."""
+        frm = self.frm
+        entries: List[ttk.Entry] = []
+        for row, (text, opts) in enumerate(rows):
+            if opts is None:
+                ttk.Label(frm, text=text).grid(row=row, column=1, sticky="w", padx=(8, 0), pady=(2, 0))
+                continue
+            pady = (8, 0) if row else 0
+            ttk.Label(frm, text=text).grid(row=row, column=0, sticky="w", pady=pady)
+            ent = ttk.Entry(frm, width=entry_width, **opts)
+            ent.grid(row=row, column=1, sticky="w", padx=(8, 0), pady=pady)
+            entries.append(ent)
 
         btns = ttk.Frame(frm)
-        btns.grid(row=7, column=0, columnspan=2, sticky="e", pady=(12, 0))
+        btns.grid(row=len(rows), column=0, columnspan=2, sticky="e", pady=(12, 0))
         ttk.Button(btns, text="Отмена", command=self._cancel).pack(side="right")
-        ttk.Button(btns, text="Создать", command=self._ok).pack(side="right", padx=(0, 8))
+        ttk.Button(btns, text=ok_text, command=self._ok).pack(side="right", padx=(0, 8))
+        return entries
 
+    def _show_modal(self):
         self.grab_set()
-        self.transient(parent)
+        self.transient(self._parent)
         self.wait_visibility()
         self.focus_set()
 
+    def _cancel(self):
+        self.result = None
+        self.destroy()
+
+
+class RegisterLibrarianDialog(_FormDialog):
+    def __init__(self, parent):
+        super().__init__(parent, "Регистрация нового библиотекаря")
+        self.result: Optional[Dict[str, Any]] = None
+
+        (self.last_name_entry, self.first_name_entry, self.patronymic_entry,
+         self.phone_entry, self.login_entry, self.pass_entry) = self._build_form([
+            ("Фамилия:", {}),
+            ("Имя:", {}),
+            ("Отчество:", {}),
+            ("Телефон:", {}),
+            _PHONE_HINT,
+            ("Логин:", {}),
+            ("Пароль:", {"show": "*"}),
+        ], entry_width=38, ok_text="Создать")
+        self._show_modal()
+
     def _ok(self):
-        last_name = self.last_name_var.get().strip()
-        first_name = self.first_name_var.get().strip()
-        patronymic = self.patronymic_var.get().strip()
-        login = self.login_var.get().strip()
-        password = self.pass_var.get()
+        last_name = self.last_name_entry.get().strip()
+        first_name = self.first_name_entry.get().strip()
+        patronymic = self.patronymic_entry.get().strip()
+        login = self.login_entry.get().strip()
+        password = self.pass_entry.get()
 
         if not last_name or not first_name or not login or not password:
             messagebox.showwarning("Ошибка", "Заполни фамилию, имя, логин и пароль.")
@@ -63,63 +91,40 @@ class RegisterLibrarianDialog(tk.Toplevel):
 
         self.result = {
             "full_name": full_name,
-            "phone": self.phone_var.get().strip() or None,
+            "phone": self.phone_entry.get().strip() or None,
             "login": login,
             "password": password,
         }
         self.destroy()
 
-    def _cancel(self):
-        self.result = None
-        self.destroy()
-
 
-class EditUserDialog(tk.Toplevel):
+class EditUserDialog(_FormDialog):
     def __init__(self, parent, initial_full_name: str, initial_phone: str):
-        super().__init__(parent)
-        self.title("Редактировать пользователя")
-        self.resizable(False, False)
+        super().__init__(parent, "Редактировать пользователя")
         self.result: Optional[Dict[str, Any]] = None
 
-        frm = ttk.Frame(self, padding=12)
-        frm.pack(fill="both", expand=True)
-
         parts = (initial_full_name or "").split()
         init_last = parts[0] if len(parts) >= 1 else ""
         init_first = parts[1] if len(parts) >= 2 else ""
         init_pat = " ".join(parts[2:]) if len(parts) >= 3 else ""
 
-        ttk.Label(frm, text="Фамилия:").grid(row=0, column=0, sticky="w")
-        ttk.Label(frm, text="Имя:").grid(row=1, column=0, sticky="w", pady=(8, 0))
-        ttk.Label(frm, text="Отчество:").grid(row=2, column=0, sticky="w", pady=(8, 0))
-        ttk.Label(frm, text="Телефон:").grid(row=3, column=0, sticky="w", pady=(8, 0))
-        ttk.Label(frm, text="(формат +7xxxxxxxxxx)").grid(row=4, column=1, sticky="w", padx=(8, 0), pady=(2, 0))
-
-        self.last_name_var = tk.StringVar(value=init_last)
-        self.first_name_var = tk.StringVar(value=init_first)
-        self.patronymic_var = tk.StringVar(value=init_pat)
-        self.phone_var = tk.StringVar(value=initial_phone or "")
-
-        ttk.Entry(frm, textvariable=self.last_name_var, width=42).grid(row=0, column=1, sticky="w", padx=(8, 0))
-        ttk.Entry(frm, textvariable=self.first_name_var, width=42).grid(row=1, column=1, sticky="w", padx=(8, 0), pady=(8, 0))
-        ttk.Entry(frm, textvariable=self.patronymic_var, width=42).grid(row=2, column=1, sticky="w", padx=(8, 0), pady=(8, 0))
-        ttk.Entry(frm, textvariable=self.phone_var, width=42).grid(row=3, column=1, sticky="w", padx=(8, 0), pady=(8, 0))
-
-        btns = ttk.Frame(frm)
-        btns.grid(row=5, column=0, columnspan=2, sticky="e", pady=(12, 0))
-        ttk.Button(btns, text="Отмена", command=self._cancel).pack(side="right")
-        ttk.Button(btns, text="Сохранить", command=self._ok).pack(side="right", padx=(0, 8))
-
-        self.grab_set()
-        self.transient(parent)
-        self.wait_visibility()
-        self.focus_set()
+        entries = self._build_form([
+            ("Фамилия:", {}),
+            ("Имя:", {}),
+            ("Отчество:", {}),
+            ("Телефон:", {}),
+            _PHONE_HINT,
+        ], entry_width=42, ok_text="Сохранить")
+        for ent, value in zip(entries, (init_last, init_first, init_pat, initial_phone or "")):
+            ent.insert(0, value)
+        self.last_name_entry, self.first_name_entry, self.patronymic_entry, self.phone_entry = entries
+        self._show_modal()
 
     def _ok(self):
-        last_name = self.last_name_var.get().strip()
-        first_name = self.first_name_var.get().strip()
-        patronymic = self.patronymic_var.get().strip()
-        phone = self.phone_var.get().strip() or None
+        last_name = self.last_name_entry.get().strip()
+        first_name = self.first_name_entry.get().strip()
+        patronymic = self.patronymic_entry.get().strip()
+        phone = self.phone_entry.get().strip() or None
         if not last_name or not first_name:
             messagebox.showwarning("Ошибка", "Фамилия/имя пустые.")
             return
@@ -128,39 +133,17 @@ class EditUserDialog(tk.Toplevel):
         self.result = {"full_name": full_name, "phone": phone}
         self.destroy()
 
-    def _cancel(self):
-        self.result = None
-        self.destroy()
-
 
-class ResetPasswordDialog(tk.Toplevel):
+class ResetPasswordDialog(_FormDialog):
     def __init__(self, parent):
-        super().__init__(parent)
-        self.title("Сброс пароля")
-        self.resizable(False, False)
+        super().__init__(parent, "Сброс пароля")
         self.result: Optional[str] = None
 
-        frm = ttk.Frame(self, padding=12)
-        frm.pack(fill="both", expand=True)
-
-        ttk.Label(frm, text="Новый пароль:").grid(row=0, column=0, sticky="w")
-        ttk.Label(frm, text="Повтори:").grid(row=1, column=0, sticky="w", pady=(8, 0))
-
-        self.p1 = tk.StringVar()
-        self.p2 = tk.StringVar()
-
-        ttk.Entry(frm, textvariable=self.p1, show="*", width=30).grid(row=0, column=1, sticky="w", padx=(8, 0))
-        ttk.Entry(frm, textvariable=self.p2, show="*", width=30).grid(row=1, column=1, sticky="w", padx=(8, 0), pady=(8, 0))
-
-        btns = ttk.Frame(frm)
-        btns.grid(row=2, column=0, columnspan=2, sticky="e", pady=(12, 0))
-        ttk.Button(btns, text="Отмена", command=self._cancel).pack(side="right")
-        ttk.Button(btns, text="OK", command=self._ok).pack(side="right", padx=(0, 8))
-
-        self.grab_set()
-        self.transient(parent)
-        self.wait_visibility()
-        self.focus_set()
+        self.p1, self.p2 = self._build_form([
+            ("Новый пароль:", {"show": "*"}),
+            ("Повтори:", {"show": "*"}),
+        ], entry_width=30, ok_text="OK")
+        self._show_modal()
 
     def _ok(self):
         a = self.p1.get()
@@ -173,7 +156,3 @@ class ResetPasswordDialog(tk.Toplevel):
             return
         self.result = a
         self.destroy()
-
-    def _cancel(self):
-        self.result = None
-        self.destroy()
@@ -1,10 +1,21 @@
+import tkinter as tk
+
 from app.db import db
 from app.gui_login import LoginWindow
 from app.gui_main import MainWindow
 
 
+def _cancel_pending_after(root: tk.Tk):
+    # интерпретатор общий: таймеры закрытого окна иначе сработают в следующем
+    for after_id in root.tk.splitlist(root.tk.call("after", "info")):
+        root.after_cancel(after_id)
+
+
 def run():
-    db.connect(reuse_if_open=True)
+    # Один Tcl-интерпретатор на всё время работы; окна входа и главное — его Toplevel.
+    # wait_window ждёт события внутри Tcl, без опросного цикла mainloop().
+    root = tk.Tk()
+    root.withdraw()
     try:
         while True:
             box = {"session": None}
@@ -12,21 +23,26 @@ def run():
             def on_success(session):
                 box["session"] = session
 
-            login = LoginWindow(on_success=on_success)
-            login.mainloop()
+            # соединение на итерацию входа: по выходу из контекста оно уходит в пул,
+            # при повторном входе берётся оттуда же
+            with db.connection_context():
+                login = LoginWindow(root, on_success=on_success)
+                root.wait_window(login)
+                _cancel_pending_after(root)
 
-            session = box.get("session")
-            if session is None:
-                break
+                session = box.get("session")
+                if session is None:
+                    break
 
-            app = MainWindow(session)
-            app.mainloop()
+                app = MainWindow(root, session)
+                root.wait_window(app)
+                _cancel_pending_after(root)
 
             if not getattr(app, "logged_out", False):
                 break
     finally:
-        if not db.is_closed():
-            db.close()
+        root.destroy()
+        db.close_all()
 
 
 if __name__ == "__main__":
@@ -1,11 +1,27 @@
+import functools
 from pathlib import Path
 
 from peewee_migrate import Router
 from app.db import db
 
 
+@functools.lru_cache(maxsize=None)
+def _compiled(path: str, mtime_ns: int):
+    # mtime в ключе: правка файла миграции даёт новый код
+    return compile(Path(path).read_text(encoding="utf-8"), path, "exec")
+
+
 class Utf8Router(Router):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (migrate, rollback) по имени миграции — файл читается один раз на роутер
+        self._read_cache = {}
+
     def read(self, name):
+        cache = self._read_cache
+        if name in cache:
+            return cache[name]
+
         migrate_dir = self.migrate_dir
         if not isinstance(migrate_dir, (str, Path)):
             migrate_dir = str(migrate_dir)
@@ -13,24 +29,23 @@ class Utf8Router(Router):
         mdir = Path(migrate_dir)
         path = mdir / f"{name}.py"
 
-        code = path.read_text(encoding="utf-8")
         scope = {}
-        exec(compile(code, str(path), "exec"), scope)
+        exec(_compiled(str(path), path.stat().st_mtime_ns), scope)
 
         migrate = scope.get("migrate")
         rollback = scope.get("rollback")
+        cache[name] = (migrate, rollback)
         return migrate, rollback
 
 
 def run():
-    db.connect(reuse_if_open=True)
+    # одно соединение из пула на весь прогон миграций; после — закрываем все соединения пула
     try:
-        router = Utf8Router(db, migrate_dir="migrations")
-        router.run()
+        with db.connection_context():
+            router = Utf8Router(db, migrate_dir="migrations")
+            router.run()
     finally:
-        if not db.is_closed():
-            db.close()
-
+        db.close_all()
 
 if __name__ == "__main__":
     run()
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime
 from peewee import *
-from playhouse.postgres_ext import BinaryJSONField
+from playhouse.postgres_ext import ArrayField, BinaryJSONField
 
 from app.db import db
 
@@ -86,6 +86,26 @@ class BookAuthor(BaseModel):
         primary_key = CompositeKey("book", "author")
 
 
+class BookAuthorsAgg(BaseModel):
+    """Авторы книги одной строкой; таблицу ведут триггеры (migrations/008_book_authors_agg.py)."""
+    book_id = IntegerField(primary_key=True)
+    authors = TextField()
+    author_ids = ArrayField(IntegerField)
+
+    class Meta:
+        table_name = "book_authors_agg"
+
+
+class BookReaderStats(BaseModel):
+    """Свободные экземпляры и ближайший срок возврата; ведут триггеры (migrations/009_book_reader_stats.py)."""
+    book_id = IntegerField(primary_key=True)
+    available_count = IntegerField(default=0)
+    next_due = DateField(null=True)
+
+    class Meta:
+        table_name = "book_reader_stats"
+
+
 class BookGenre(BaseModel):
     book = ForeignKeyField(Book, backref="book_genres", column_name="book_id", on_delete="CASCADE")
     genre = ForeignKeyField(Genre, backref="genre_books", column_name="genre_id", on_delete="RESTRICT")
@@ -116,14 +136,16 @@ class Location(BaseModel):
         )
 
 
+# На горячих FK ленивая подгрузка выключена: без join обращение к loan.copy даёт id, а не лишний SELECT
 class Copy(BaseModel):
     inventory_code = TextField(unique=True)
     status = TextField(default="available")
     price = FloatField(null=True)
     condition_note = TextField(null=True)
 
-    book = ForeignKeyField(Book, backref="copies", column_name="book_id", on_delete="CASCADE")
-    location = ForeignKeyField(Location, backref="copies", column_name="location_id", null=True, on_delete="SET NULL")
+    book = ForeignKeyField(Book, backref="copies", column_name="book_id", on_delete="CASCADE", lazy_load=False)
+    location = ForeignKeyField(Location, backref="copies", column_name="location_id", null=True, on_delete="SET NULL",
+                               lazy_load=False)
 
     class Meta:
         table_name = "copies"
@@ -135,13 +157,23 @@ class Loan(BaseModel):
     due_date = DateField()
     return_date = DateField(null=True)
 
-    copy = ForeignKeyField(Copy, backref="loans", column_name="copy_id", on_delete="RESTRICT")
-    reader = ForeignKeyField(User, backref="loans_reader", column_name="reader_id", on_delete="RESTRICT")
-    librarian = ForeignKeyField(User, backref="loans_librarian", column_name="librarian_id", on_delete="RESTRICT")
+    copy = ForeignKeyField(Copy, backref="loans", column_name="copy_id", on_delete="RESTRICT", lazy_load=False)
+    reader = ForeignKeyField(User, backref="loans_reader", column_name="reader_id", on_delete="RESTRICT",
+                             lazy_load=False)
+    librarian = ForeignKeyField(User, backref="loans_librarian", column_name="librarian_id", on_delete="RESTRICT",
+                                lazy_load=False)
 
     class Meta:
         table_name = "loans"
 
+    @classmethod
+    def loans_with_book(cls):
+        """Выдачи сразу с экземпляром и книгой: loan.copy.book без дополнительных запросов."""
+        return (cls
+                .select(cls, Copy, Book)
+                .join(Copy)
+                .join(Book))
+
 
 class Reservation(BaseModel):
     status = TextField(default="active")
@@ -150,9 +182,33 @@ class Reservation(BaseModel):
     expires_at = DateTimeField()
     extended_once = BooleanField(default=False)
 
-    reader = ForeignKeyField(User, backref="reservations", column_name="reader_id", on_delete="RESTRICT")
-    copy = ForeignKeyField(Copy, backref="reservations", column_name="copy_id", on_delete="RESTRICT")
-    branch = ForeignKeyField(Branch, backref="reservations", column_name="branch_id", on_delete="RESTRICT")
+    reader = ForeignKeyField(User, backref="reservations", column_name="reader_id", on_delete="RESTRICT",
+                             lazy_load=False)
+    copy = ForeignKeyField(Copy, backref="reservations", column_name="copy_id", on_delete="RESTRICT", lazy_load=False)
+    branch = ForeignKeyField(Branch, backref="reservations", column_name="branch_id", on_delete="RESTRICT",
+                             lazy_load=False)
 
     class Meta:
         table_name = "reservations"
+
+
+class ReservationDetails(BaseModel):
+    """Резерв с книгой, экземпляром, филиалом и читателем; представление (migrations/013_reservation_details_view.py)."""
+    reader_id = IntegerField()
+    status = TextField()
+    pickup_date = DateField()
+    created_at = DateTimeField()
+    expires_at = DateTimeField()
+    extended_once = BooleanField()
+    book_id = IntegerField()
+    book_title = TextField()
+    inv = TextField()
+    branch_name = TextField()
+    branch_address = TextField(null=True)
+    branch_display = TextField()
+    reader_name = TextField(null=True)
+    reader_phone = TextField(null=True)
+    reader_login = TextField(null=True)
+
+    class Meta:
+        table_name = "v_reservation_details"
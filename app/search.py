@@ -0,0 +1,14 @@
+from typing import Dict, List
+
+
+def like_pattern(term: str) -> str:
+    """Шаблон ILIKE «содержит term»: % и _ из ввода ищутся буквально, а не как подстановка."""
+    # обратная косая — экранирующий символ LIKE в Postgres по умолчанию, ESCAPE указывать не нужно
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def status_codes_matching(term: str, labels: Dict[str, str]) -> List[str]:
+    """Коды статусов, чья русская подпись содержит term: в БД хранятся коды, а вводят подписи."""
+    t = term.lower()
+    return [code for code, label in labels.items() if t in label.lower()]
@@ -1,16 +1,18 @@
 from __future__ import annotations
 
+import csv
+import io
 from datetime import date, timedelta
-from typing import Optional, List, Tuple, Dict
+from typing import Any, Iterable, Optional, List, Sequence, Tuple, Dict
 
 from app.db import db
-from app.auth import hash_password
+from app.auth import hash_passwords_bulk
+from app.services_catalog import INV_SEQUENCE
 from app.models import (
     Role, User, UserRole,
     Publisher, Author, Genre, Book,
     BookAuthor, BookGenre,
     Branch, Location, Copy,
-    Loan
 )
 
 DEFAULT_USERS: List[Tuple[str, str, Optional[str], str, str]] = [
@@ -64,116 +66,201 @@ ROLE_RIGHTS: Dict[str, Dict[str, bool]] = {
 }
 
 
-def upsert_role(name: str, rights: Dict[str, bool]):
-    Role.get_or_create(name=name, defaults={"rights": rights})
+# Справочники сида; вставляются пачкой, по одному запросу на таблицу
+PUBLISHERS: List[Tuple[str, Optional[str], Optional[str]]] = [
+    ("АСТ", "Москва", "Россия"),
+    ("Эксмо", "Москва", "Россия"),
+    ("Питер", "Санкт-Петербург", "Россия"),
+    ("Азбука", "Санкт-Петербург", "Россия"),
+]
 
+AUTHORS: List[Tuple[str, Optional[int], Optional[int]]] = [
+    ("Достоевский Фёдор", 1821, 1881),
+    ("Толстой Лев", 1828, 1910),
+    ("Булгаков Михаил", 1891, 1940),
+    ("Пушкин Александр", 1799, 1837),
+    ("Гоголь Николай", 1809, 1852),
+]
 
-def upsert_user(login: str, full_name: str, phone: Optional[str], password: str) -> User:
-    user, created = User.get_or_create(
-        login=login,
-        defaults={
-            "full_name": full_name,
-            "phone": phone,
-            "password_hash": hash_password(password),
-            "is_active": True,
-        }
-    )
-    if not created:
-        user.full_name = full_name
-        user.phone = phone
-        user.password_hash = hash_password(password)
-        user.is_active = True
-        user.save()
-    return user
-
-
-def assign_role(user: User, role_name: str):
-    role = Role.get(Role.name == role_name)
-    UserRole.get_or_create(user=user, role=role)
-
-
-def get_or_create_publisher(name: str, city: Optional[str] = None, country: Optional[str] = None) -> Publisher:
-    p, _ = Publisher.get_or_create(name=name, defaults={"city": city, "country": country})
-    return p
-
-
-def get_or_create_author(full_name: str, birth_year: Optional[int] = None, death_year: Optional[int] = None) -> Author:
-    a, _ = Author.get_or_create(full_name=full_name, defaults={"birth_year": birth_year, "death_year": death_year})
-    return a
-
-
-def get_or_create_genre(name: str) -> Genre:
-    g, _ = Genre.get_or_create(name=name)
-    return g
-
-
-def get_or_create_book(
-    title: str,
-    publisher: Optional[Publisher],
-    publish_year: Optional[int] = None,
-    pages_count: Optional[int] = None,
-    language: str = "ru",
-) -> Book:
-    b, _ = Book.get_or_create(
-        title=title,
-        defaults={
-            "publisher": publisher,
-            "publish_year": publish_year,
-            "pages_count": pages_count,
-            "language": language,
-        }
-    )
-    return b
+GENRES: List[str] = ["Классика", "Роман", "Фантастика", "Поэзия", "Драма"]
+
+# (название, издательство, год, страниц, авторы, жанры)
+BOOKS: List[Tuple[str, str, int, int, Tuple[str, ...], Tuple[str, ...]]] = [
+    ("Преступление и наказание", "АСТ", 1866, 672, ("Достоевский Фёдор",), ("Классика", "Роман")),
+    ("Идиот", "Эксмо", 1869, 640, ("Достоевский Фёдор",), ("Классика", "Роман")),
+    ("Война и мир", "Эксмо", 1869, 1225, ("Толстой Лев",), ("Классика", "Роман")),
+    ("Анна Каренина", "АСТ", 1877, 864, ("Толстой Лев",), ("Классика", "Роман")),
+    ("Мастер и Маргарита", "Азбука", 1967, 480, ("Булгаков Михаил",), ("Классика", "Роман", "Фантастика")),
+    ("Собачье сердце", "Питер", 1925, 240, ("Булгаков Михаил",), ("Классика", "Роман")),
+    ("Евгений Онегин", "АСТ", 1833, 224, ("Пушкин Александр",), ("Классика", "Поэзия")),
+    ("Капитанская дочка", "Эксмо", 1836, 192, ("Пушкин Александр",), ("Классика", "Роман")),
+    ("Мёртвые души", "Азбука", 1842, 352, ("Гоголь Николай",), ("Классика", "Роман")),
+    ("Ревизор", "Питер", 1836, 160, ("Гоголь Николай",), ("Классика", "Драма")),
+]
 
+BRANCHES: List[Tuple[str, Optional[str], Optional[str]]] = [
+    ("Главный филиал", "ул Пушкина 1", "+70000001000"),
+    ("Филиал Север", "пр. Мира 10", "+70000002000"),
+    ("Филиал Юг", "ул Ленина 5", "+70000003000"),
+]
 
-def link_book_author(book: Book, author: Author):
-    BookAuthor.get_or_create(book=book, author=author)
+# (филиал, код, описание)
+LOCATIONS: List[Tuple[str, str, Optional[str]]] = [
+    ("Главный филиал", "A-1", "Зал A, стеллаж 1"),
+    ("Главный филиал", "A-2", "Зал A, стеллаж 2"),
+    ("Филиал Север", "B-1", "Зал B, стеллаж 1"),
+    ("Филиал Север", "B-2", "Зал B, стеллаж 2"),
+    ("Филиал Юг", "C-1", "Зал C, стеллаж 1"),
+    ("Филиал Юг", "C-2", "Зал C, стеллаж 2"),
+]
 
 
-def link_book_genre(book: Book, genre: Genre):
-    BookGenre.get_or_create(book=book, genre=genre)
+def _ids_by(field, values) -> Dict[Any, int]:
+    """Одним SELECT: значение уникального (по смыслу) поля -> id."""
+    model = field.model
+    return dict(model.select(field, model.id).where(field.in_(list(values))).tuples())
+
+
+def _ensure_by_name(field, rows: List[Dict[str, Any]]) -> Dict[Any, int]:
+    """Для таблиц без UNIQUE на имени: вставляет пачкой только отсутствующие строки."""
+    ids = _ids_by(field, [r[field.name] for r in rows])
+    missing = [r for r in rows if r[field.name] not in ids]
+    if missing:
+        field.model.insert_many(missing).execute()
+        ids = _ids_by(field, [r[field.name] for r in rows])
+    return ids
+
+
+def seed_roles() -> Dict[str, int]:
+    # существующие роли не трогаем: права могли поменять в БД
+    (Role
+     .insert_many([{"name": name, "rights": rights} for name, rights in ROLE_RIGHTS.items()])
+     .on_conflict_ignore()
+     .execute())
+    return _ids_by(Role.name, ROLE_RIGHTS)
+
+
+def seed_users(role_ids: Dict[str, int]) -> Dict[str, int]:
+    # пользователи сида перезаписываются (ФИО, телефон, пароль), как и раньше
+    hashes = hash_passwords_bulk([pwd for _, _, _, pwd, _ in DEFAULT_USERS])
+    rows = [
+        {"login": login, "full_name": full_name, "phone": phone, "password_hash": h, "is_active": True}
+        for (login, full_name, phone, _, _), h in zip(DEFAULT_USERS, hashes)
+    ]
+    (User
+     .insert_many(rows)
+     .on_conflict(
+         conflict_target=[User.login],
+         preserve=[User.full_name, User.phone, User.password_hash, User.is_active],
+     )
+     .execute())
+    user_ids = _ids_by(User.login, [u[0] for u in DEFAULT_USERS])
+
+    (UserRole
+     .insert_many([{"user": user_ids[login], "role": role_ids[role]} for login, _, _, _, role in DEFAULT_USERS])
+     .on_conflict_ignore()
+     .execute())
+    return user_ids
+
+
+def seed_catalog() -> List[int]:
+    """Издательства, авторы, жанры, книги и их связи; возвращает id книг в порядке BOOKS."""
+    (Publisher
+     .insert_many([{"name": n, "city": c, "country": cn} for n, c, cn in PUBLISHERS])
+     .on_conflict_ignore()
+     .execute())
+    publisher_ids = _ids_by(Publisher.name, [p[0] for p in PUBLISHERS])
+
+    author_ids = _ensure_by_name(
+        Author.full_name,
+        [{"full_name": n, "birth_year": b, "death_year": d} for n, b, d in AUTHORS],
+    )
 
+    Genre.insert_many([{"name": n} for n in GENRES]).on_conflict_ignore().execute()
+    genre_ids = _ids_by(Genre.name, GENRES)
+
+    book_ids = _ensure_by_name(
+        Book.title,
+        [
+            {"title": t, "publisher": publisher_ids[p], "publish_year": y, "pages_count": pages, "language": "ru"}
+            for t, p, y, pages, _, _ in BOOKS
+        ],
+    )
 
-def get_or_create_branch(name: str, address: Optional[str], phone: Optional[str]) -> Branch:
-    br, _ = Branch.get_or_create(name=name, defaults={"address": address, "phone": phone})
-    return br
+    BookAuthor.insert_many([
+        {"book": book_ids[t], "author": author_ids[a]} for t, _, _, _, authors, _ in BOOKS for a in authors
+    ]).on_conflict_ignore().execute()
+    BookGenre.insert_many([
+        {"book": book_ids[t], "genre": genre_ids[g]} for t, _, _, _, _, genres in BOOKS for g in genres
+    ]).on_conflict_ignore().execute()
+
+    return [book_ids[b[0]] for b in BOOKS]
+
+
+def seed_locations() -> List[Location]:
+    """Филиалы и места хранения; возвращает места в порядке LOCATIONS."""
+    (Branch
+     .insert_many([{"name": n, "address": a, "phone": ph} for n, a, ph in BRANCHES])
+     .on_conflict_ignore()
+     .execute())
+    branch_ids = _ids_by(Branch.name, [b[0] for b in BRANCHES])
+
+    (Location
+     .insert_many([{"branch": branch_ids[b], "code": code, "description": d} for b, code, d in LOCATIONS])
+     .on_conflict_ignore()
+     .execute())
+    by_key = {
+        (loc.branch_id, loc.code): loc
+        for loc in Location.select().where(Location.branch.in_(list(branch_ids.values())))
+    }
+    return [by_key[(branch_ids[b], code)] for b, code, _ in LOCATIONS]
+
+
+def _copy_into_staging(table: str, columns: Sequence[str], rows: Iterable[Sequence[Any]]) -> str:
+    """
+    COPY FROM STDIN во временную таблицу с колонками table; возвращает её имя.
+    У COPY нет ON CONFLICT, поэтому в целевую таблицу строки переносит INSERT ... SELECT.
+    """
+    staging = f"_seed_{table}"
+    cols = ", ".join(columns)
+    db.execute_sql(f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS SELECT {cols} FROM {table} WITH NO DATA")
+
+    # None -> пустое поле без кавычек, в CSV-формате COPY это NULL
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerows(rows)
+    buf.seek(0)
+    cur = db.cursor()
+    try:
+        cur.copy_expert(f"COPY {staging} ({cols}) FROM STDIN WITH (FORMAT csv)", buf)
+    finally:
+        cur.close()
+    return staging
 
 
-def get_or_create_location(branch: Branch, code: str, description: Optional[str]) -> Location:
-    loc, _ = Location.get_or_create(branch=branch, code=code, defaults={"description": description})
-    return loc
+_COPY_COLUMNS = ("inventory_code", "book_id", "location_id", "status", "price", "condition_note")
 
 
 def _inv_code(n: int) -> str:
-    return f"INV-{str(n).zfill(4)}"
-
-
-def _ensure_copy(
-    book: Book,
-    location: Optional[Location],
-    inv: str,
-    status: str = "available",
-    price: Optional[float] = None,
-    condition_note: Optional[str] = None
-) -> Copy:
-    c, created = Copy.get_or_create(
-        inventory_code=inv,
-        defaults={
-            "book": book,
-            "location": location,
-            "status": status,
-            "price": price,
-            "condition_note": condition_note,
-        }
+    return f"INV-{n:04d}"
+
+
+# PREPARE живёт в сессии, а не в транзакции: после сида снимаем DEALLOCATE,
+# чтобы соединение вернулось в пул без него
+_LOAN_INSERT_STMT = "seed_loan_insert_if_absent"
+
+
+def _prepare_loan_insert() -> None:
+    # проверка и вставка одним запросом; разбор и план — один раз на сид
+    db.execute_sql(
+        f"""
+        PREPARE {_LOAN_INSERT_STMT} (int, int, int, text, date, date, date) AS
+        INSERT INTO loans (copy_id, reader_id, librarian_id, status, start_date, due_date, return_date)
+        SELECT $1, $2, $3, $4, $5, $6, $7
+        WHERE NOT EXISTS (
+            SELECT 1 FROM loans WHERE copy_id = $1 AND status IN ('open', 'overdue')
+        )
+        """
     )
-    if not created:
-        c.book = book
-        c.location = location
-        c.status = status
-        c.price = price
-        c.condition_note = condition_note
-        c.save()
-    return c
 
 
 def _ensure_loan_for_copy(
@@ -185,158 +272,43 @@ def _ensure_loan_for_copy(
     due: date,
     returned: Optional[date] = None
 ) -> None:
-    exists = (
-        Loan.select(Loan.id)
-        .where((Loan.copy == copy) & (Loan.status.in_(("open", "overdue"))))
-        .limit(1)
-        .exists()
-    )
-    if exists:
-        return
-
-    Loan.create(
-        copy=copy,
-        reader=reader,
-        librarian=librarian,
-        status=status,
-        start_date=start,
-        due_date=due,
-        return_date=returned
+    db.execute_sql(
+        f"EXECUTE {_LOAN_INSERT_STMT} (%s, %s, %s, %s, %s, %s, %s)",
+        (copy.id, reader.id, librarian.id, status, start, due, returned),
     )
 
 
 def run_seed():
     db.connect(reuse_if_open=True)
+    prepared = False
     try:
         with db.atomic():
-            # --- Roles
-            for role_name, rights in ROLE_RIGHTS.items():
-                upsert_role(role_name, rights)
-
-            # --- Users
-            users: Dict[str, User] = {}
-            for login, full_name, phone, pwd, role in DEFAULT_USERS:
-                u = upsert_user(login, full_name, phone, pwd)
-                assign_role(u, role)
-                users[login] = u
+            # только для разового сида, не для работы приложения: SET LOCAL действует до конца транзакции
+            db.execute_sql("SET LOCAL synchronous_commit = off")
+            db.execute_sql("SET LOCAL statement_timeout = 0")
+            db.execute_sql("SET LOCAL work_mem = '64MB'")
 
+            user_ids = seed_users(seed_roles())
+            users = {u.login: u for u in User.select().where(User.id.in_(list(user_ids.values())))}
             librarian = users["lib"]
             reader = users["kap213"]
 
-            # --- Publishers
-            ast = get_or_create_publisher("АСТ", "Москва", "Россия")
-            eksmo = get_or_create_publisher("Эксмо", "Москва", "Россия")
-            piter = get_or_create_publisher("Питер", "Санкт-Петербург", "Россия")
-            azb = get_or_create_publisher("Азбука", "Санкт-Петербург", "Россия")
-
-            # --- Authors
-            dost = get_or_create_author("Достоевский Фёдор", 1821, 1881)
-            tolst = get_or_create_author("Толстой Лев", 1828, 1910)
-            bulg = get_or_create_author("Булгаков Михаил", 1891, 1940)
-            push = get_or_create_author("Пушкин Александр", 1799, 1837)
-            gog = get_or_create_author("Гоголь Николай", 1809, 1852)
-
-            # --- Genres
-            klass = get_or_create_genre("Классика")
-            roman = get_or_create_genre("Роман")
-            fantasy = get_or_create_genre("Фантастика")
-            poetry = get_or_create_genre("Поэзия")
-            drama = get_or_create_genre("Драма")
-
-            # --- Books
-            books: List[Book] = []
-
-            b1 = get_or_create_book("Преступление и наказание", ast, 1866, 672)
-            link_book_author(b1, dost)
-            link_book_genre(b1, klass); link_book_genre(b1, roman)
-            books.append(b1)
-
-            b2 = get_or_create_book("Идиот", eksmo, 1869, 640)
-            link_book_author(b2, dost)
-            link_book_genre(b2, klass); link_book_genre(b2, roman)
-            books.append(b2)
-
-            b3 = get_or_create_book("Война и мир", eksmo, 1869, 1225)
-            link_book_author(b3, tolst)
-            link_book_genre(b3, klass); link_book_genre(b3, roman)
-            books.append(b3)
-
-            b4 = get_or_create_book("Анна Каренина", ast, 1877, 864)
-            link_book_author(b4, tolst)
-            link_book_genre(b4, klass); link_book_genre(b4, roman)
-            books.append(b4)
-
-            b5 = get_or_create_book("Мастер и Маргарита", azb, 1967, 480)
-            link_book_author(b5, bulg)
-            link_book_genre(b5, klass); link_book_genre(b5, roman); link_book_genre(b5, fantasy)
-            books.append(b5)
-
-            b6 = get_or_create_book("Собачье сердце", piter, 1925, 240)
-            link_book_author(b6, bulg)
-            link_book_genre(b6, klass); link_book_genre(b6, roman)
-            books.append(b6)
-
-            b7 = get_or_create_book("Евгений Онегин", ast, 1833, 224)
-            link_book_author(b7, push)
-            link_book_genre(b7, klass); link_book_genre(b7, poetry)
-            books.append(b7)
-
-            b8 = get_or_create_book("Капитанская дочка", eksmo, 1836, 192)
-            link_book_author(b8, push)
-            link_book_genre(b8, klass); link_book_genre(b8, roman)
-            books.append(b8)
-
-            b9 = get_or_create_book("Мёртвые души", azb, 1842, 352)
-            link_book_author(b9, gog)
-            link_book_genre(b9, klass); link_book_genre(b9, roman)
-            books.append(b9)
-
-            b10 = get_or_create_book("Ревизор", piter, 1836, 160)
-            link_book_author(b10, gog)
-            link_book_genre(b10, klass); link_book_genre(b10, drama)
-            books.append(b10)
-
-            # --- Branches & Locations
-            br1 = get_or_create_branch("Главный филиал", "ул Пушкина 1", "+70000001000")
-            br2 = get_or_create_branch("Филиал Север", "пр. Мира 10", "+70000002000")
-            br3 = get_or_create_branch("Филиал Юг", "ул Ленина 5", "+70000003000")
-
-            locations: List[Location] = [
-                get_or_create_location(br1, "A-1", "Зал A, стеллаж 1"),
-                get_or_create_location(br1, "A-2", "Зал A, стеллаж 2"),
-                get_or_create_location(br2, "B-1", "Зал B, стеллаж 1"),
-                get_or_create_location(br2, "B-2", "Зал B, стеллаж 2"),
-                get_or_create_location(br3, "C-1", "Зал C, стеллаж 1"),
-                get_or_create_location(br3, "C-2", "Зал C, стеллаж 2"),
-            ]
-
-            # --- Copies: много экземпляров
+            books = seed_catalog()
+            locations = seed_locations()
+
+            # --- Copies: много экземпляров; номера кодов берём из последовательности одним запросом
+            total = sum(8 + (idx % 5) for idx in range(len(books)))
             cur = db.execute_sql(
-                """
-                SELECT COALESCE(
-                    MAX(CAST(SUBSTRING(inventory_code FROM '([0-9]+)$') AS INT)),
-                    0
-                )
-                FROM copies
-                WHERE inventory_code ~ '^INV\\-[0-9]+$'
-                """
+                f"SELECT nextval('{INV_SEQUENCE}') FROM generate_series(1, %s)", (total,)
             )
-            max_n = cur.fetchone()[0] or 0
-            inv_counter = int(max_n)
-
-            def next_inv() -> str:
-                nonlocal inv_counter
-                inv_counter += 1
-                return _inv_code(inv_counter)
+            inv_codes = iter([_inv_code(n) for (n,) in cur.fetchall()])
 
-            copies_by_book: Dict[int, List[Copy]] = {}
-            for idx, book in enumerate(books):
+            # все экземпляры считаются в Python, грузятся COPY во временную таблицу
+            # и переносятся одним INSERT ... ON CONFLICT ... RETURNING; строки — в порядке _COPY_COLUMNS
+            copy_rows: List[Tuple[Any, ...]] = []
+            for idx, book_id in enumerate(books):
                 cnt = 8 + (idx % 5)  # 8..12
-                copies: List[Copy] = []
                 for i in range(cnt):
-                    loc = locations[(idx + i) % len(locations)]
-                    inv = next_inv()
-
                     status = "available"
                     if i == cnt - 1 and idx % 3 == 0:
                         status = "reserved"
@@ -345,32 +317,57 @@ def run_seed():
                     elif i == cnt - 3 and idx % 9 == 0:
                         status = "lost"
 
-                    price = 350 + (idx * 50) + (i * 10)
-                    c = _ensure_copy(book, loc, inv, status=status, price=price)
-                    copies.append(c)
+                    copy_rows.append((
+                        next(inv_codes),
+                        book_id,
+                        locations[(idx + i) % len(locations)].id,
+                        status,
+                        350 + (idx * 50) + (i * 10),
+                        None,
+                    ))
+
+            staging = _copy_into_staging("copies", _COPY_COLUMNS, copy_rows)
+            cols = ", ".join(_COPY_COLUMNS)
+            cur = db.execute_sql(
+                f"""
+                INSERT INTO copies ({cols})
+                SELECT {cols} FROM {staging}
+                ON CONFLICT (inventory_code) DO UPDATE SET
+                    book_id = EXCLUDED.book_id,
+                    location_id = EXCLUDED.location_id,
+                    status = EXCLUDED.status,
+                    price = EXCLUDED.price,
+                    condition_note = EXCLUDED.condition_note
+                RETURNING id, inventory_code, book_id, status
+                """
+            )
+            by_inv = {
+                inv: Copy(id=cid, inventory_code=inv, book=book_id, status=status)
+                for cid, inv, book_id, status in cur.fetchall()
+            }
 
-                copies_by_book[book.id] = copies
+            # порядок экземпляров внутри книги — как в copy_rows
+            copies_by_book: Dict[int, List[Copy]] = {book_id: [] for book_id in books}
+            for inv, book_id, *_ in copy_rows:
+                copies_by_book[book_id].append(by_inv[inv])
 
             # --- Loans: делаем 1 открытую и 1 просроченную на одного читателя
             open_copy = None
-            for book in books:
-                for c in copies_by_book[book.id]:
+            for book_id in books:
+                for c in copies_by_book[book_id]:
                     if c.status == "available":
                         open_copy = c
                         break
                 if open_copy:
                     break
 
+            # статус меняем сразу: второй поиск не должен взять тот же экземпляр
             if open_copy:
                 open_copy.status = "loaned"
-                open_copy.save()
-                start = date.today()
-                due = start + timedelta(days=14)
-                _ensure_loan_for_copy(open_copy, reader, librarian, "open", start, due)
 
             overdue_copy = None
-            for book in reversed(books):
-                for c in copies_by_book[book.id]:
+            for book_id in reversed(books):
+                for c in copies_by_book[book_id]:
                     if c.status == "available":
                         overdue_copy = c
                         break
@@ -379,12 +376,27 @@ def run_seed():
 
             if overdue_copy:
                 overdue_copy.status = "loaned"
-                overdue_copy.save()
+
+            loaned_ids = [c.id for c in (open_copy, overdue_copy) if c]
+            if loaned_ids:
+                Copy.update(status="loaned").where(Copy.id.in_(loaned_ids)).execute()
+
+            _prepare_loan_insert()
+            prepared = True
+
+            if open_copy:
+                start = date.today()
+                due = start + timedelta(days=14)
+                _ensure_loan_for_copy(open_copy, reader, librarian, "open", start, due)
+
+            if overdue_copy:
                 start = date.today() - timedelta(days=30)
                 due = date.today() - timedelta(days=7)
                 _ensure_loan_for_copy(overdue_copy, reader, librarian, "overdue", start, due)
 
     finally:
+        if prepared:
+            db.execute_sql(f"DEALLOCATE {_LOAN_INSERT_STMT}")
         if not db.is_closed():
             db.close()
 
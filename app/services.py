@@ -1,21 +1,46 @@
 from __future__ import annotations
 
+import csv
+import functools
+import io
 import json
+import logging
 import os
+import shutil
 import subprocess
-from dataclasses import dataclass
-from datetime import date, timedelta
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from itertools import chain, islice
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple, Callable, Union
+from typing import List, Dict, Any, Optional, Tuple, Callable, Union, Iterable, Iterator
 
-from peewee import fn, JOIN, IntegrityError, Case
+from peewee import fn, JOIN, IntegrityError, ModelSelect
+from playhouse.postgres_ext import ServerSide
+
+# pyarrow необязателен: с ним доступен экспорт отчётов в Parquet/Feather
+try:
+    import pyarrow as pa
+    import pyarrow.feather as pa_feather
+    import pyarrow.parquet as pa_parquet
+except ImportError:
+    pa = None
+
+# orjson необязателен: с ним быстрее разбор прав ролей и экспорт в JSON
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from app.db import db, DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
-from app.auth import verify_password, hash_password
+from app.auth import verify_and_maybe_rehash, hash_password
+from app.search import like_pattern, status_codes_matching
 from app.models import (
     User, Role, UserRole,
     Publisher, Author, Genre,
-    Book, BookAuthor, BookGenre,
+    Book, BookAuthor, BookAuthorsAgg, BookGenre,
     Branch, Location, Copy,
     Loan, Reservation,
 )
@@ -104,11 +129,17 @@ def roles_label_list(roles_value: Any) -> str:
         return ""
     if isinstance(roles_value, (list, tuple, set)):
         parts = [str(x).strip() for x in roles_value if str(x).strip()]
-    else:
-        s = str(roles_value).strip()
-        if not s:
-            return ""
-        parts = [p.strip() for p in s.split(",") if p.strip()]
+        return ", ".join(role_label(p) for p in parts)
+    return _roles_label_str(str(roles_value))
+
+
+# Наборов ролей у пользователей немного ("Reader", "Librarian, Reader", ...) — строка ролей кэшируется
+@functools.lru_cache(maxsize=64)
+def _roles_label_str(s: str) -> str:
+    s = s.strip()
+    if not s:
+        return ""
+    parts = [p.strip() for p in s.split(",") if p.strip()]
     return ", ".join(role_label(p) for p in parts)
 
 
@@ -132,6 +163,17 @@ RES_STATUS_RU = {
     "cancelled": "Отменён",
 }
 
+# Перевод статуса по домену одной заранее связанной функцией;
+# для неизвестного домена приоритет: экземпляр, выдача, резерв
+_STATUS_RU_BY_DOMAIN = {
+    "copy": COPY_STATUS_RU,
+    "loan": LOAN_STATUS_RU,
+    "reservation": RES_STATUS_RU,
+}
+_ANY_STATUS_RU = {**RES_STATUS_RU, **LOAN_STATUS_RU, **COPY_STATUS_RU}
+_STATUS_GET_BY_DOMAIN = {domain: labels.get for domain, labels in _STATUS_RU_BY_DOMAIN.items()}
+_ANY_STATUS_GET = _ANY_STATUS_RU.get
+
 
 def ru_header(key: str) -> str:
     return RU_COL.get(key, key)
@@ -144,7 +186,13 @@ def _yes_no(v: Any) -> str:
 def _detect_status_domain(row: Optional[Dict[str, Any]]) -> str:
     if not row:
         return ""
-    keys = set(row.keys())
+    # у строк одного отчёта один и тот же набор полей — домен считается раз на схему
+    return _status_domain_for_keys(tuple(row))
+
+
+@functools.lru_cache(maxsize=64)
+def _status_domain_for_keys(fields: Tuple[str, ...]) -> str:
+    keys = frozenset(fields)
     if "loan_id" in keys or "due_date" in keys or "start_date" in keys or "return_date" in keys:
         return "loan"
     if "reservation_id" in keys or "pickup_date" in keys or "expires_at" in keys:
@@ -157,10 +205,7 @@ def _detect_status_domain(row: Optional[Dict[str, Any]]) -> str:
 def _looks_like_roles_table_row(row: Optional[Dict[str, Any]]) -> bool:
     if not row:
         return False
-    if "rights" not in row:
-        return False
-    keys = set(row.keys())
-    return ("name" in keys) and ("rights" in keys)
+    return "rights" in row and "name" in row
 
 
 def format_cell(key: str, value: Any, row: Optional[Dict[str, Any]] = None) -> Any:
@@ -180,13 +225,7 @@ def format_cell(key: str, value: Any, row: Optional[Dict[str, Any]] = None) -> A
     if key == "status":
         domain = _detect_status_domain(row)
         s = str(value)
-        if domain == "copy":
-            return COPY_STATUS_RU.get(s, s)
-        if domain == "loan":
-            return LOAN_STATUS_RU.get(s, s)
-        if domain == "reservation":
-            return RES_STATUS_RU.get(s, s)
-        return COPY_STATUS_RU.get(s, LOAN_STATUS_RU.get(s, RES_STATUS_RU.get(s, s)))
+        return _STATUS_GET_BY_DOMAIN.get(domain, _ANY_STATUS_GET)(s, s)
 
     if hasattr(value, "isoformat"):
         try:
@@ -197,21 +236,111 @@ def format_cell(key: str, value: Any, row: Optional[Dict[str, Any]] = None) -> A
     return value
 
 
+# Перевод этих колонок зависит от набора полей строки (домен статуса, таблица ролей)
+ROW_AWARE_COLUMNS = frozenset(("name", "status"))
+
+# Кэшируются только типы, у которых равные значения выглядят одинаково (не Decimal/float)
+_CACHEABLE_CELL_TYPES = (str, bool, int, date, datetime)
+
+
+@functools.lru_cache(maxsize=4096, typed=True)
+def _format_cell_simple(key: str, value: Any) -> Any:
+    return format_cell(key, value)
+
+
+def format_cell_cached(key: str, value: Any) -> Any:
+    """format_cell для колонок вне ROW_AWARE_COLUMNS; повторяющиеся значения берутся из кэша."""
+    if type(value) in _CACHEABLE_CELL_TYPES:
+        return _format_cell_simple(key, value)
+    return format_cell(key, value)
+
+
+# Даты в отчётах сильно повторяются (сроки выдач, даты резервов) — строка берётся из кэша
+@functools.lru_cache(maxsize=4096)
+def _date_iso(d: date) -> str:
+    return d.isoformat()
+
+
+def _format_plain(value: Any) -> Any:
+    if value is None:
+        return ""
+    if type(value) is date:
+        return _date_iso(value)
+    if hasattr(value, "isoformat"):
+        try:
+            return value.isoformat(sep=" ")
+        except TypeError:
+            return value.isoformat()
+    return value
+
+
+def _blank_none(fmt: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    return lambda v: "" if v is None else fmt(v)
+
+
+def _status_formatter(domain: str) -> Callable[[Any], Any]:
+    get = _STATUS_GET_BY_DOMAIN.get(domain, _ANY_STATUS_GET)
+
+    def fmt(v: Any) -> Any:
+        if v is None:
+            return ""
+        s = str(v)
+        return get(s, s)
+    return fmt
+
+
+def _build_formatters(keys: Iterable[str], sample_row: Optional[Dict[str, Any]]) -> Dict[str, Callable[[Any], Any]]:
+    """Форматтер на колонку, как в format_cell; домен статуса и таблица ролей определяются один раз."""
+    roles_table = _looks_like_roles_table_row(sample_row)
+    fmts: Dict[str, Callable[[Any], Any]] = {}
+    for k in keys:
+        if k == "role" or (k == "name" and roles_table):
+            fmts[k] = _blank_none(role_label)
+        elif k == "roles":
+            fmts[k] = _blank_none(roles_label_list)
+        elif k in ("is_active", "extended_once"):
+            fmts[k] = _blank_none(_yes_no)
+        elif k == "status":
+            fmts[k] = _status_formatter(_detect_status_domain(sample_row))
+        else:
+            fmts[k] = _format_plain
+    return fmts
+
+
 def translate_rows_values(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    out: List[Dict[str, Any]] = []
-    for r in rows:
-        out.append({k: format_cell(k, v, r) for k, v in r.items()})
-    return out
+    if not rows:
+        return []
+    # у строк одного отчёта одинаковый набор полей
+    fmts = _build_formatters(rows[0].keys(), rows[0])
+    return [{k: fmts.get(k, _format_plain)(v) for k, v in r.items()} for r in rows]
+
+
+def iter_values_for_export(rows: Iterable[Dict[str, Any]], keys: List[str]) -> Iterator[List[Any]]:
+    """Значения строки в порядке keys; заголовки переводятся один раз у вызывающего."""
+    it = iter(rows)
+    first = next(it, None)
+    if first is None:
+        return
+    by_key = _build_formatters(keys, first)
+    fmts = [by_key[k] for k in keys]
+    for r in chain((first,), it):
+        yield [fmt(r.get(k)) for k, fmt in zip(keys, fmts)]
+
+
+def iter_rows_for_export(rows: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Построчный перевод для экспорта: без второй копии всего отчёта в памяти."""
+    it = iter(rows)
+    first = next(it, None)
+    if first is None:
+        return
+    keys = list(first.keys())
+    headers = [ru_header(k) for k in keys]
+    for values in iter_values_for_export(chain((first,), it), keys):
+        yield dict(zip(headers, values))
 
 
 def translate_rows_for_export(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    out: List[Dict[str, Any]] = []
-    for r in rows:
-        nr: Dict[str, Any] = {}
-        for k, v in r.items():
-            nr[ru_header(k)] = format_cell(k, v, r)
-        out.append(nr)
-    return out
+    return list(iter_rows_for_export(rows))
 
 
 # ПРАВА (roles.rights -> session.can())
@@ -221,17 +350,26 @@ def _normalize_rights(v: Any) -> Dict[str, Any]:
     if isinstance(v, dict):
         return dict(v)
     if isinstance(v, str):
-        s = v.strip()
-        if not s:
-            return {}
-        try:
-            obj = json.loads(s)
-            return obj if isinstance(obj, dict) else {}
-        except Exception:
-            return {}
+        return dict(_parse_rights_str(v))
     return {}
 
 
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+
+# Строк прав столько же, сколько ролей, — разбор JSON кэшируется; наружу отдаётся копия
+@functools.lru_cache(maxsize=32)
+def _parse_rights_str(v: str) -> Tuple[Tuple[str, Any], ...]:
+    s = v.strip()
+    if not s:
+        return ()
+    try:
+        obj = _json_loads(s)
+    except Exception:
+        return ()
+    return tuple(obj.items()) if isinstance(obj, dict) else ()
+
+
 def get_user_roles(user: User) -> List[str]:
     q = Role.select(Role.name).join(UserRole).where(UserRole.user == user)
     return [r.name for r in q]
@@ -240,14 +378,19 @@ def get_user_roles(user: User) -> List[str]:
 def get_user_rights(user: User) -> Dict[str, Any]:
 # если где-то all=true -> всё разрешено
 # иначе смотрим булевые флаги
+    # роль с {"all": true} (jsonb @>) идёт первой: для админа цикл кончается на первой строке
+    is_all = Role.rights.contains({"all": True})
     q = (
-        Role.select(Role.rights)
+        Role.select(Role.rights, is_all.alias("is_all"))
         .join(UserRole)
         .where(UserRole.user == user)
+        .order_by(is_all.desc())
     )
 
     merged: Dict[str, Any] = {}
     for r in q:
+        if r.is_all:
+            return {"all": True}
         d = _normalize_rights(r.rights)
         if d.get("all") is True:
             return {"all": True}
@@ -267,12 +410,34 @@ def get_user_rights(user: User) -> Dict[str, Any]:
 
 ROLE_PRIORITY = ["Admin", "Librarian", "Reader"]
 
+# Все ключи прав системы (описание — в seed.ROLE_RIGHTS)
+ALL_RIGHTS = (
+    "manage_users",
+    "manage_catalog",
+    "manage_loans",
+    "view_reports",
+    "export_tables",
+    "backup",
+    "create_reservation",
+    "manage_own_reservations",
+    "manage_reservations",
+)
+_ALL_RIGHTS_SET = frozenset(ALL_RIGHTS)
+
 
 @dataclass
 class Session:
     user: User
     roles: List[str]
     rights: Dict[str, Any]
+    # права разворачиваются один раз при входе: can() — проверка флага и поиск в наборе
+    _all: bool = field(init=False, repr=False)
+    _granted: frozenset = field(init=False, repr=False)
+
+    def __post_init__(self):
+        d = self.rights or {}
+        self._all = d.get("all") is True
+        self._granted = _ALL_RIGHTS_SET if self._all else frozenset(k for k, v in d.items() if v)
 
     @property
     def primary_role(self) -> str:
@@ -282,10 +447,11 @@ class Session:
         return self.roles[0] if self.roles else "Reader"
 
     def can(self, perm: str) -> bool:
-        d = self.rights or {}
-        if d.get("all") is True:
-            return True
-        return bool(d.get(perm))
+        return self._all or perm in self._granted
+
+    def granted(self) -> frozenset:
+        """Набор выданных прав — для частых проверок в GUI через `in`."""
+        return self._granted & _ALL_RIGHTS_SET
 
 
 def authenticate(login: str, password: str) -> Tuple[bool, str, Optional[Session]]:
@@ -301,8 +467,12 @@ def authenticate(login: str, password: str) -> Tuple[bool, str, Optional[Session
     if not user.is_active:
         return False, "Пользователь отключён.", None
 
-    if not verify_password(password, user.password_hash):
+    ok, new_hash = verify_and_maybe_rehash(password, user.password_hash)
+    if not ok:
         return False, "Неверный логин или пароль.", None
+    if new_hash:
+        User.update(password_hash=new_hash).where(User.id == user.id).execute()
+        user.password_hash = new_hash
 
     roles = get_user_roles(user)
     if not roles:
@@ -313,10 +483,26 @@ def authenticate(login: str, password: str) -> Tuple[bool, str, Optional[Session
 
 
 # Пользователи / регистрация
+_BASE_ROLES = ("Admin", "Librarian", "Reader")
+
+# имя роли -> id; роли в приложении не редактируются, кэш сбрасывается после восстановления БД
+_role_ids: Dict[str, int] = {}
+
+
 def _ensure_base_roles():
-    Role.get_or_create(name="Admin", defaults={"rights": {}})
-    Role.get_or_create(name="Librarian", defaults={"rights": {}})
-    Role.get_or_create(name="Reader", defaults={"rights": {}})
+    (Role
+     .insert_many([{"name": name, "rights": {}} for name in _BASE_ROLES])
+     .on_conflict_ignore()
+     .execute())
+
+
+def _role_id(role_name: str) -> int:
+    rid = _role_ids.get(role_name)
+    if rid is None:
+        _ensure_base_roles()
+        _role_ids.update(Role.select(Role.name, Role.id).tuples())
+        rid = _role_ids[role_name]
+    return rid
 
 
 def _map_user_integrity_error(e: IntegrityError) -> str:
@@ -351,8 +537,7 @@ def _create_user_with_role(
     if len(password) < 4:
         return False, "Пароль минимум 4 символа."
 
-    _ensure_base_roles()
-    role = Role.get(Role.name == role_name)
+    role_id = _role_id(role_name)
 
     try:
         with db.atomic():
@@ -363,7 +548,7 @@ def _create_user_with_role(
                 password_hash=hash_password(password),
                 is_active=True,
             )
-            UserRole.create(user=user, role=role)
+            UserRole.create(user=user, role=role_id)
         return True, f"Пользователь создан ({role_label(role_name)})."
     except IntegrityError as e:
         return False, _map_user_integrity_error(e)
@@ -387,28 +572,34 @@ def admin_register_librarian(
     return _create_user_with_role(login, full_name, phone, password, "Librarian")
 
 
-def list_users_with_roles() -> List[Dict[str, Any]]:
-    users = list(User.select().order_by(User.id).dicts())
-    if not users:
-        return []
+def _users_with_roles_query():
+    # роли склеиваются в БД одним запросом; у пользователя без ролей — пустая строка
+    roles = fn.COALESCE(fn.STRING_AGG(Role.name, ", ").order_by(Role.name), "").alias("roles")
+    return (
+        User.select(User, roles)
+        .join(UserRole, JOIN.LEFT_OUTER)
+        .join(Role, JOIN.LEFT_OUTER)
+        .group_by(User.id)
+        .order_by(User.id)
+    )
 
-    q = UserRole.select(UserRole.user_id.alias("user_id"), Role.name.alias("role")).join(Role)
-    role_map: Dict[int, List[str]] = {}
-    for r in q.dicts():
-        role_map.setdefault(r["user_id"], []).append(r["role"])
 
-    for u in users:
-        roles = role_map.get(u["id"], [])
-        u["roles"] = ", ".join(sorted(roles))
-    return users
+def list_users_with_roles() -> List[Dict[str, Any]]:
+    return list(_users_with_roles_query().dicts())
 
 
 def list_users_filtered(role_name: Optional[str] = None) -> List[Dict[str, Any]]:
-    rows = list_users_with_roles()
+    role_name = (role_name or "").strip()
     if not role_name:
-        return rows
-    role_name = role_name.strip()
-    return [r for r in rows if role_name in (r.get("roles") or "")]
+        return list_users_with_roles()
+
+    # точное совпадение имени роли в БД; в строке ролей остаются все роли пользователя
+    ur, r = UserRole.alias(), Role.alias()
+    has_role = (ur
+                .select(ur.role)
+                .join(r, on=(ur.role == r.id))
+                .where((ur.user == User.id) & (r.name == role_name)))
+    return list(_users_with_roles_query().where(fn.EXISTS(has_role)).dicts())
 
 
 def update_user_profile(session: Session, user_id: int, full_name: str, phone: Optional[str]) -> Tuple[bool, str]:
@@ -482,35 +673,30 @@ def delete_user(session: Session, user_id: int) -> Tuple[bool, str]:
     if not session.can("manage_users"):
         return False, "Нет прав: управление пользователями."
 
-    user = User.get_or_none(User.id == user_id)
-    if not user:
-        return False, "Пользователь не найден."
-
-    if user.id == session.user.id:
+    if user_id == session.user.id:
         return False, "Нельзя удалить самого себя."
 
-    admin_role = Role.get_or_none(Role.name == "Admin")
-    if admin_role:
-        is_admin = (
-            UserRole.select()
-            .where((UserRole.user == user) & (UserRole.role == admin_role))
-            .exists()
-        )
-        if is_admin:
-            return False, "Нельзя удалить администратора."
-
-    has_loans = (
-        Loan.select(Loan.id)
-        .where((Loan.reader == user) | (Loan.librarian == user))
-        .limit(1)
-        .exists()
+    # существование, роль админа и история выдач — одним запросом
+    ur, r = UserRole.alias(), Role.alias()
+    is_admin = fn.EXISTS(
+        ur.select(ur.role)
+        .join(r, on=(ur.role == r.id))
+        .where((ur.user == User.id) & (r.name == "Admin"))
+    )
+    has_loans = fn.EXISTS(
+        Loan.select(Loan.id).where((Loan.reader == User.id) | (Loan.librarian == User.id))
     )
-    if has_loans:
+    row = User.select(is_admin, has_loans).where(User.id == user_id).tuples().first()
+    if row is None:
+        return False, "Пользователь не найден."
+    if row[0]:
+        return False, "Нельзя удалить администратора."
+    if row[1]:
         return False, "Нельзя удалить: у пользователя есть выдачи (история). Лучше его отключить."
 
     try:
         with db.atomic():
-            user.delete_instance()
+            User.delete().where(User.id == user_id).execute()
         return True, "Пользователь удалён."
     except IntegrityError as e:
         return False, f"Ошибка БД при удалении: {e}"
@@ -522,94 +708,208 @@ def delete_user(session: Session, user_id: int) -> Tuple[bool, str]:
 DEFAULT_LOAN_DAYS = 14
 
 
-def issue_loan(copy_inventory_code: str, reader_login: str, librarian_user: User) -> Tuple[bool, str]:
+# Выдача одним запросом: экземпляр захватывается UPDATE ... WHERE status = 'available',
+# и только захваченный попадает в INSERT — гонка двух библиотекарей решается блокировкой строки
+_ISSUE_LOAN_SQL = """
+    WITH claim AS (
+        UPDATE copies SET status = 'loaned'
+        WHERE inventory_code = %s AND status = 'available'
+          AND EXISTS (SELECT 1 FROM users WHERE login = %s)
+        RETURNING id
+    )
+    INSERT INTO loans (copy_id, reader_id, librarian_id, status, start_date, due_date, return_date)
+    SELECT claim.id, u.id, %s, 'open', %s, %s, NULL
+    FROM claim JOIN users u ON u.login = %s
+    RETURNING id
+"""
+
+# Возврат одним запросом: выдача закрывается, её экземпляр возвращается в наличие
+_RETURN_LOAN_SQL = """
+    WITH ret AS (
+        UPDATE loans SET status = 'returned', return_date = %s, librarian_id = %s
+        WHERE id = %s AND status IN ('open', 'overdue')
+        RETURNING copy_id
+    )
+    UPDATE copies SET status = 'available'
+    FROM ret
+    WHERE copies.id = ret.copy_id
+    RETURNING copies.id
+"""
+
+
+def issue_loan(copy_inventory_code: str, reader_login: str, librarian_user: User) -> Tuple[bool, str, Optional[int]]:
     copy_inventory_code = (copy_inventory_code or "").strip()
     reader_login = (reader_login or "").strip()
 
     if not copy_inventory_code or not reader_login:
-        return False, "Нужно указать инвентарный код и читателя."
-
-    copy = Copy.get_or_none(Copy.inventory_code == copy_inventory_code)
-    if not copy:
-        return False, f"Экземпляр {copy_inventory_code} не найден."
-
-    if copy.status != "available":
-        return False, f"Экземпляр сейчас не доступен (status={copy.status})."
-
-    reader = User.get_or_none(User.login == reader_login)
-    if not reader:
-        return False, f"Читатель {reader_login} не найден."
+        return False, "Нужно указать инвентарный код и читателя.", None
 
     start = date.today()
     due = start + timedelta(days=DEFAULT_LOAN_DAYS)
 
     try:
-        with db.atomic():
-            copy = Copy.select().where(Copy.id == copy.id).for_update().get()
-            if copy.status != "available":
-                return False, f"Кто-то уже успел забрать (status={copy.status})."
-
-            loan = Loan.create(
-                copy=copy,
-                reader=reader,
-                librarian=librarian_user,
-                status="open",
-                start_date=start,
-                due_date=due,
-                return_date=None,
-            )
-            copy.status = "loaned"
-            copy.save()
-        return True, f"Выдача оформлена. Loan ID={loan.id}, до {due}."
+        row = db.execute_sql(
+            _ISSUE_LOAN_SQL,
+            (copy_inventory_code, reader_login, librarian_user.id, start, due, reader_login),
+        ).fetchone()
     except IntegrityError as e:
-        return False, f"Ошибка БД: {e}"
+        return False, f"Ошибка БД: {e}", None
 
+    if row:
+        return True, f"Выдача оформлена. Loan ID={row[0]}, до {due}.", row[0]
 
-def return_loan(loan_id: int, librarian_user: User) -> Tuple[bool, str]:
-    loan = Loan.get_or_none(Loan.id == loan_id)
-    if not loan:
-        return False, "Выдача не найдена."
-
-    if loan.status not in ("open", "overdue"):
-        return False, f"Нельзя вернуть выдачу со статусом {loan.status}."
+    # выдача не прошла — выясняем причину только на этом пути
+    status = Copy.select(Copy.status).where(Copy.inventory_code == copy_inventory_code).scalar()
+    if status is None:
+        return False, f"Экземпляр {copy_inventory_code} не найден.", None
+    if status != "available":
+        return False, f"Экземпляр сейчас не доступен (status={status}).", None
+    if not User.select().where(User.login == reader_login).exists():
+        return False, f"Читатель {reader_login} не найден.", None
+    return False, "Кто-то уже успел забрать экземпляр, повторите выдачу.", None
 
-    with db.atomic():
-        loan = Loan.select().where(Loan.id == loan_id).for_update().get()
-        if loan.status not in ("open", "overdue"):
-            return False, f"Уже изменили статус на {loan.status}."
 
-        loan.status = "returned"
-        loan.return_date = date.today()
-        loan.librarian = librarian_user
-        loan.save()
-
-        copy = loan.copy
-        copy.status = "available"
-        copy.save()
+def return_loan(loan_id: int, librarian_user: User) -> Tuple[bool, str]:
+    row = db.execute_sql(_RETURN_LOAN_SQL, (date.today(), librarian_user.id, loan_id)).fetchone()
+    if row:
+        return True, "Возврат оформлен."
 
-    return True, "Возврат оформлен."
+    status = Loan.select(Loan.status).where(Loan.id == loan_id).scalar()
+    if status is None:
+        return False, "Выдача не найдена."
+    return False, f"Нельзя вернуть выдачу со статусом {status}."
+
+
+def list_loans_view(
+    reader: Optional[User] = None,
+    loan_id: Optional[int] = None,
+    search: Optional[str] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> List[Tuple[Any, ...]]:
+    """Строки для вкладки выдач: (id, status, inventory_code, title, reader_login, due_date, book_id)"""
+    q = (Loan
+         .select(Loan.id, Loan.status, Copy.inventory_code,
+                 Book.title, User.login, Loan.due_date, Book.id)
+         .join(Copy)
+         .join(Book)
+         .switch(Loan)
+         .join(User, on=(Loan.reader == User.id))
+         .order_by(Loan.due_date.asc()))
+
+    if reader is not None:
+        q = q.where(Loan.reader == reader)
+    if loan_id is not None:
+        q = q.where(Loan.id == loan_id)
+
+    term = (search or "").strip()
+    if term:
+        pat = like_pattern(term)
+        cond = Copy.inventory_code.ilike(pat) | Book.title.ilike(pat) | User.login.ilike(pat)
+        statuses = status_codes_matching(term, LOAN_STATUS_RU)
+        if statuses:
+            cond |= Loan.status.in_(statuses)
+        q = q.where(cond)
+    if limit is not None:
+        q = q.limit(limit).offset(offset)
+    return list(q.tuples())
+
+
+# Просрочки переводятся пачками: каждый UPDATE — своя короткая транзакция с небольшим числом блокировок
+_OVERDUE_BATCH = 1000
 
 
 def update_overdue_statuses() -> int:
     today = date.today()
-    return Loan.update(status="overdue").where((Loan.status == "open") & (Loan.due_date < today)).execute()
+    # отбор идёт по частичному индексу ix_loans_open_due (migrations/006_status_partial_indexes.py)
+    is_overdue = (Loan.status == "open") & (Loan.due_date < today)
+    batch = (Loan
+             .select(Loan.id)
+             .where(is_overdue)
+             .order_by(Loan.id)
+             .limit(_OVERDUE_BATCH))
+    total = 0
+    while True:
+        # условие повторяется во внешнем WHERE: при READ COMMITTED строку, которую после снимка
+        # подзапроса вернула другая сессия, UPDATE перепроверяет уже по нему и пропускает
+        n = Loan.update(status="overdue").where(Loan.id.in_(batch) & is_overdue).execute()
+        total += n
+        # пропущенные строки могут сделать пачку неполной, хотя просрочки ещё есть — до пустой пачки
+        if n == 0:
+            return total
 
 
 # Отчёты + экспорт
 def _authors_subquery():
+    # готовая строка авторов из book_authors_agg вместо STRING_AGG по связям на каждый отчёт
     return (
-        BookAuthor
-        .select(
-            BookAuthor.book.alias("book_id"),
-            fn.STRING_AGG(Author.full_name, ", ").alias("authors"),
-        )
-        .join(Author)
-        .group_by(BookAuthor.book)
+        BookAuthorsAgg
+        .select(BookAuthorsAgg.book_id, BookAuthorsAgg.authors)
         .alias("ba")
     )
 
 
-def report_active_loans() -> List[Dict[str, Any]]:
+# Отчёт описывается построителем запроса: вызов отчёта возвращает список строк (таблица в GUI),
+# iter_report_rows() читает те же строки серверным курсором (экспорт без списка в памяти)
+_STREAM_ARRAY_SIZE = 2000
+
+
+def _query_report(build: Callable[[], ModelSelect]) -> Callable[[], List[Dict[str, Any]]]:
+    @functools.wraps(build)
+    def report() -> List[Dict[str, Any]]:
+        return list(build().dicts())
+
+    report.query = build
+    report.raw = False
+    return report
+
+
+def _raw_query_report(build: Callable[[], ModelSelect]) -> Callable[[], List[Dict[str, Any]]]:
+    """Как _query_report, но строки читаются мимо конвертеров полей peewee.
+
+    Для широких отчётов по многим таблицам: psycopg2 уже отдаёт date/Decimal/bool,
+    а поштучный python_value на каждую колонку каждой строки ничего не меняет.
+    """
+    @functools.wraps(build)
+    def report() -> List[Dict[str, Any]]:
+        return list(_raw_rows(build()))
+
+    report.query = build
+    report.raw = True
+    return report
+
+
+def _raw_rows(query: ModelSelect, named: bool = False) -> Iterator[Dict[str, Any]]:
+    sql, params = query.sql()
+    cur = db.execute_sql(sql, params, named_cursor=named)
+    if named:
+        cur.itersize = _STREAM_ARRAY_SIZE
+    it = iter(cur)
+    first = next(it, None)
+    if first is None:
+        return
+    # у именованного курсора description заполняется только после первой выборки
+    cols = [c.name for c in cur.description]
+    yield dict(zip(cols, first))
+    for row in it:
+        yield dict(zip(cols, row))
+
+
+def iter_report_rows(report: Callable[[], Iterable[Dict[str, Any]]]) -> Iterator[Dict[str, Any]]:
+    """Строки отчёта по мере чтения из БД; именованный курсор живёт только внутри транзакции."""
+    build = getattr(report, "query", None)
+    if build is None:
+        yield from report()
+        return
+    with db.atomic():
+        if report.raw:
+            yield from _raw_rows(build(), named=True)
+        else:
+            yield from ServerSide(build().dicts(), array_size=_STREAM_ARRAY_SIZE)
+
+
+@_query_report
+def report_active_loans() -> ModelSelect:
     ba = _authors_subquery()
 
     q = (
@@ -632,46 +932,58 @@ def report_active_loans() -> List[Dict[str, Any]]:
         .where(Loan.status.in_(["open", "overdue"]))
         .order_by(Loan.due_date.asc())
     )
-    return list(q.dicts())
+    return q
 
 
-def report_copies_by_book() -> List[Dict[str, Any]]:
+_COPY_STATUSES = ("available", "loaned", "reserved", "lost", "damaged")
+
+
+@_raw_query_report
+def report_copies_by_book() -> ModelSelect:
     ba = _authors_subquery()
+    # счётчики по статусам — один проход по copies с COUNT(*) FILTER, до соединения с книгами
+    cs = (
+        Copy.select(
+            Copy.book.alias("book_id"),
+            fn.COUNT(Copy.id).alias("total"),
+            *(fn.COUNT(Copy.id).filter(Copy.status == st).alias(st) for st in _COPY_STATUSES),
+        )
+        .group_by(Copy.book)
+        .alias("cs")
+    )
 
     q = (
         Book.select(
             Book.id.alias("book_id"),
             Book.title.alias("title"),
             ba.c.authors.alias("authors"),
-            fn.COUNT(Copy.id).alias("total"),
-            fn.SUM(Case(None, ((Copy.status == "available", 1),), 0)).alias("available"),
-            fn.SUM(Case(None, ((Copy.status == "loaned", 1),), 0)).alias("loaned"),
-            fn.SUM(Case(None, ((Copy.status == "reserved", 1),), 0)).alias("reserved"),
-            fn.SUM(Case(None, ((Copy.status == "lost", 1),), 0)).alias("lost"),
-            fn.SUM(Case(None, ((Copy.status == "damaged", 1),), 0)).alias("damaged"),
+            fn.COALESCE(cs.c.total, 0).alias("total"),
+            *(fn.COALESCE(getattr(cs.c, st), 0).alias(st) for st in _COPY_STATUSES),
         )
-        .join(Copy, on=(Copy.book == Book.id), join_type=JOIN.LEFT_OUTER)
+        .join(cs, JOIN.LEFT_OUTER, on=(cs.c.book_id == Book.id))
         .switch(Book)
         .join(ba, JOIN.LEFT_OUTER, on=(ba.c.book_id == Book.id))
-        .group_by(Book.id, ba.c.authors)
         .order_by(Book.title.asc())
     )
-    return list(q.dicts())
+    return q
 
 
-def report_table_roles() -> List[Dict[str, Any]]:
+@_query_report
+def report_table_roles() -> ModelSelect:
     q = Role.select(Role.id, Role.name, Role.rights).order_by(Role.id.asc())
-    return list(q.dicts())
+    return q
 
 
-def report_table_users() -> List[Dict[str, Any]]:
+@_query_report
+def report_table_users() -> ModelSelect:
     q = User.select(User.id, User.login, User.full_name, User.phone, User.is_active, User.created_at).order_by(
         User.id.asc()
     )
-    return list(q.dicts())
+    return q
 
 
-def report_table_user_roles() -> List[Dict[str, Any]]:
+@_query_report
+def report_table_user_roles() -> ModelSelect:
     q = (
         UserRole.select(
             UserRole.user_id.alias("user_id"),
@@ -683,25 +995,29 @@ def report_table_user_roles() -> List[Dict[str, Any]]:
         .join(User)
         .order_by(UserRole.user_id.asc(), Role.name.asc())
     )
-    return list(q.dicts())
+    return q
 
 
-def report_table_publishers() -> List[Dict[str, Any]]:
+@_query_report
+def report_table_publishers() -> ModelSelect:
     q = Publisher.select(Publisher.id, Publisher.name, Publisher.city, Publisher.country).order_by(Publisher.id.asc())
-    return list(q.dicts())
+    return q
 
 
-def report_table_authors() -> List[Dict[str, Any]]:
+@_query_report
+def report_table_authors() -> ModelSelect:
     q = Author.select(Author.id, Author.full_name, Author.birth_year, Author.death_year).order_by(Author.id.asc())
-    return list(q.dicts())
+    return q
 
 
-def report_table_genres() -> List[Dict[str, Any]]:
+@_query_report
+def report_table_genres() -> ModelSelect:
     q = Genre.select(Genre.id, Genre.name).order_by(Genre.id.asc())
-    return list(q.dicts())
+    return q
 
 
-def report_table_books() -> List[Dict[str, Any]]:
+@_query_report
+def report_table_books() -> ModelSelect:
     q = (
         Book.select(
             Book.id,
@@ -715,10 +1031,11 @@ def report_table_books() -> List[Dict[str, Any]]:
         .join(Publisher, JOIN.LEFT_OUTER)
         .order_by(Book.id.asc())
     )
-    return list(q.dicts())
+    return q
 
 
-def report_table_book_authors() -> List[Dict[str, Any]]:
+@_query_report
+def report_table_book_authors() -> ModelSelect:
     q = (
         BookAuthor.select(
             BookAuthor.book_id.alias("book_id"),
@@ -731,10 +1048,11 @@ def report_table_book_authors() -> List[Dict[str, Any]]:
         .join(Author)
         .order_by(Book.title.asc(), Author.full_name.asc())
     )
-    return list(q.dicts())
+    return q
 
 
-def report_table_book_genres() -> List[Dict[str, Any]]:
+@_query_report
+def report_table_book_genres() -> ModelSelect:
     q = (
         BookGenre.select(
             BookGenre.book_id.alias("book_id"),
@@ -747,15 +1065,17 @@ def report_table_book_genres() -> List[Dict[str, Any]]:
         .join(Genre)
         .order_by(Book.title.asc(), Genre.name.asc())
     )
-    return list(q.dicts())
+    return q
 
 
-def report_table_branches() -> List[Dict[str, Any]]:
+@_query_report
+def report_table_branches() -> ModelSelect:
     q = Branch.select(Branch.id, Branch.name, Branch.address, Branch.phone).order_by(Branch.id.asc())
-    return list(q.dicts())
+    return q
 
 
-def report_table_locations() -> List[Dict[str, Any]]:
+@_query_report
+def report_table_locations() -> ModelSelect:
     q = (
         Location.select(
             Location.id,
@@ -767,10 +1087,11 @@ def report_table_locations() -> List[Dict[str, Any]]:
         .join(Branch)
         .order_by(Location.id.asc())
     )
-    return list(q.dicts())
+    return q
 
 
-def report_table_copies() -> List[Dict[str, Any]]:
+@_raw_query_report
+def report_table_copies() -> ModelSelect:
     q = (
         Copy.select(
             Copy.id,
@@ -791,10 +1112,11 @@ def report_table_copies() -> List[Dict[str, Any]]:
         .join(Branch, JOIN.LEFT_OUTER)
         .order_by(Copy.id.asc())
     )
-    return list(q.dicts())
+    return q
 
 
-def report_table_loans() -> List[Dict[str, Any]]:
+@_raw_query_report
+def report_table_loans() -> ModelSelect:
     reader = User.alias()
     librarian = User.alias()
 
@@ -823,10 +1145,11 @@ def report_table_loans() -> List[Dict[str, Any]]:
         .join(librarian, on=(Loan.librarian == librarian.id))
         .order_by(Loan.id.asc())
     )
-    return list(q.dicts())
+    return q
 
 
-def report_table_reservations() -> List[Dict[str, Any]]:
+@_raw_query_report
+def report_table_reservations() -> ModelSelect:
     reader = User.alias()
 
     q = (
@@ -855,7 +1178,7 @@ def report_table_reservations() -> List[Dict[str, Any]]:
         .join(reader, on=(Reservation.reader == reader.id))
         .order_by(Reservation.id.asc())
     )
-    return list(q.dicts())
+    return q
 
 
 BASE_REPORTS: Dict[str, Callable[[], List[Dict[str, Any]]]] = {
@@ -900,50 +1223,299 @@ def get_reports_for_role(role_or_session: Union[str, Session]) -> Dict[str, Call
     return out
 
 
-def export_json(rows: List[Dict[str, Any]], filepath: str) -> None:
-    rows = translate_rows_for_export(rows)
-    Path(filepath).write_text(
-        json.dumps(rows, ensure_ascii=False, indent=2, default=str),
-        encoding="utf-8",
-    )
+# Буфер файла экспорта: запись крупными блоками, а не на каждую строку
+_EXPORT_BUFFER = 1 << 20
 
 
-def export_csv(rows: List[Dict[str, Any]], filepath: str) -> None:
-    import csv
+if orjson is not None:
+    def _json_object_bytes(obj: Dict[str, Any]) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2, default=str)
+else:
+    def _json_object_bytes(obj: Dict[str, Any]) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, indent=2, default=str).encode("utf-8")
 
-    rows = translate_rows_for_export(rows)
-    if not rows:
+
+def export_json(rows: Iterable[Dict[str, Any]], filepath: str) -> None:
+    # массив пишется по одному объекту — вывод совпадает с json.dumps(список, indent=2)
+    with open(filepath, "wb", buffering=_EXPORT_BUFFER) as f:
+        sep = b"[\n  "
+        for r in iter_rows_for_export(rows):
+            f.write(sep)
+            f.write(_json_object_bytes(r).replace(b"\n", b"\n  "))
+            sep = b",\n  "
+        f.write(b"[]" if sep.startswith(b"[") else b"\n]")
+
+
+# Крупный CSV форматируется блоками по _CSV_CHUNK_ROWS строк в пуле потоков
+_CSV_CHUNK_ROWS = 65536
+
+
+def _csv_writer(f):
+    return csv.writer(f, delimiter=";", quoting=csv.QUOTE_MINIMAL)
+
+
+def _csv_chunk_text(rows: List[Dict[str, Any]], keys: List[str]) -> str:
+    buf = io.StringIO()
+    _csv_writer(buf).writerows(iter_values_for_export(rows, keys))
+    return buf.getvalue()
+
+
+def export_csv(rows: Iterable[Dict[str, Any]], filepath: str) -> None:
+    it = iter(rows)
+    first = next(it, None)
+    if first is None:
         Path(filepath).write_text("", encoding="utf-8-sig")
         return
 
-    headers = list(rows[0].keys())
-    with open(filepath, "w", newline="", encoding="utf-8-sig") as f:
-        w = csv.DictWriter(
-            f,
-            fieldnames=headers,
-            delimiter=";",
-            quoting=csv.QUOTE_MINIMAL,
+    # строки пишутся списками в порядке keys — словарь с русскими ключами на строку не нужен
+    keys = list(first.keys())
+    it = chain((first,), it)
+    chunks = iter(lambda: list(islice(it, _CSV_CHUNK_ROWS)), [])
+
+    with open(filepath, "w", newline="", encoding="utf-8-sig", buffering=_EXPORT_BUFFER) as f:
+        w = _csv_writer(f)
+        w.writerow([ru_header(k) for k in keys])
+
+        chunk = next(chunks)
+        if len(chunk) < _CSV_CHUNK_ROWS:
+            # небольшой отчёт — без пула и без промежуточной строки блока
+            w.writerows(iter_values_for_export(chunk, keys))
+            return
+
+        # блоки форматируются параллельно, а пишутся строго по порядку;
+        # в очереди не больше двух блоков на поток, чтобы не держать весь отчёт
+        workers = os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            pending = deque([ex.submit(_csv_chunk_text, chunk, keys)])
+            for chunk in chunks:
+                pending.append(ex.submit(_csv_chunk_text, chunk, keys))
+                if len(pending) >= workers * 2:
+                    f.write(pending.popleft().result())
+            while pending:
+                f.write(pending.popleft().result())
+
+
+# CSV широких таблиц (отчёты _raw_query_report) Postgres пишет сам: COPY ... TO STDOUT,
+# перевод заголовков и значений — выражениями в SELECT, без строк в Python
+def _sql_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _sql_text(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _sql_label_case(col: str, labels: Dict[str, str]) -> str:
+    whens = " ".join(f"WHEN {_sql_text(code)} THEN {_sql_text(label)}" for code, label in labels.items())
+    return f"CASE {col}::text {whens} ELSE {col}::text END"
+
+
+# OID типов Postgres, текст которых в COPY отличается от str()/isoformat() в export_csv
+_PG_BOOL_OID = 16
+_PG_FLOAT_OIDS = (700, 701)
+_PG_TIMESTAMP_OID = 1114
+
+
+def _copy_column_expr(key: str, fields: Tuple[str, ...], type_code: int) -> str:
+    """SQL-аналог _build_formatters для одной колонки; NULL в CSV — пустое поле, как у format_cell."""
+    col = "t." + _sql_ident(key)
+    if key == "role" or (key == "name" and "rights" in fields):
+        expr = _sql_label_case(col, ROLE_RU)
+    elif key in ("is_active", "extended_once"):
+        expr = f"CASE WHEN {col} THEN 'Да' WHEN NOT {col} THEN 'Нет' END"
+    elif key == "status":
+        labels = _STATUS_RU_BY_DOMAIN.get(_status_domain_for_keys(fields), _ANY_STATUS_RU)
+        expr = _sql_label_case(col, labels)
+    elif type_code in _PG_FLOAT_OIDS:
+        # Python пишет 350.0, Postgres — 350: целому значению дописываем .0
+        expr = f"CASE WHEN {col}::text ~ '^-?[0-9]+$' THEN {col}::text || '.0' ELSE {col}::text END"
+    elif type_code == _PG_TIMESTAMP_OID:
+        # как datetime.isoformat(sep=" "): микросекунды — только ненулевые и всегда шестью цифрами
+        expr = (f"to_char({col}, 'YYYY-MM-DD HH24:MI:SS') || "
+                f"CASE WHEN date_trunc('second', {col}) <> {col} THEN to_char({col}, '.US') ELSE '' END")
+    elif type_code == _PG_BOOL_OID:
+        expr = f"CASE WHEN {col} THEN 'True' WHEN NOT {col} THEN 'False' END"
+    else:
+        expr = col
+    return f"{expr} AS {_sql_ident(ru_header(key))}"
+
+
+def can_export_csv_by_copy(report: Callable[[], Any]) -> bool:
+    return getattr(report, "raw", False)
+
+
+def export_csv_by_copy(report: Callable[[], Any], filepath: str) -> None:
+    """CSV отчёта через COPY ... TO STDOUT прямо в файл."""
+    query = report.query()
+    sql, params = query.sql()
+    cur = db.cursor()
+    try:
+        inner = cur.mogrify(sql, params).decode("utf-8")
+        # имена колонок — из пустой выборки того же запроса
+        cur.execute(f"SELECT * FROM ({inner}) t LIMIT 0")
+        desc = cur.description
+        fields = tuple(c.name for c in desc)
+        select = ", ".join(_copy_column_expr(c.name, fields, c.type_code) for c in desc)
+        copy_sql = (
+            f"COPY (SELECT {select} FROM ({inner}) t) TO STDOUT "
+            f"WITH (FORMAT csv, HEADER true, DELIMITER ';', ENCODING 'UTF8')"
         )
-        w.writeheader()
-        w.writerows(rows)
+        with open(filepath, "wb", buffering=_EXPORT_BUFFER) as f:
+            f.write("\ufeff".encode("utf-8"))  # BOM, как у export_csv (utf-8-sig)
+            cur.copy_expert(copy_sql, f)
+    finally:
+        cur.close()
+
+
+# Колоночные форматы (только при установленном pyarrow)
+ARROW_EXPORT_SUFFIXES = (".parquet", ".feather") if pa is not None else ()
+
+
+def _arrow_column(values: List[Any]):
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # смешанные типы в колонке (например, "" и числа) — пишем строками
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+
+def export_arrow(rows: Iterable[Dict[str, Any]], filepath: str) -> None:
+    """Экспорт в .parquet или .feather — по расширению файла."""
+    if pa is None:
+        raise RuntimeError("Для экспорта в Parquet/Feather нужен пакет pyarrow.")
+
+    suffix = Path(filepath).suffix.lower()
+    if suffix not in ARROW_EXPORT_SUFFIXES:
+        raise ValueError(f"Неизвестный формат экспорта: {suffix}")
+
+    it = iter(rows)
+    first = next(it, None)
+    keys = list(first.keys()) if first is not None else []
+    columns: List[List[Any]] = [[] for _ in keys]
+    if first is not None:
+        for r in chain((first,), it):
+            for col, k in zip(columns, keys):
+                col.append(r.get(k))
+        # перевод по колонкам: один форматтер на колонку, цикл — во встроенном map
+        fmts = _build_formatters(keys, first)
+        for i, k in enumerate(keys):
+            columns[i] = list(map(fmts[k], columns[i]))
+
+    table = pa.table({ru_header(k): _arrow_column(col) for k, col in zip(keys, columns)})
+    if suffix == ".parquet":
+        pa_parquet.write_table(table, filepath)
+    else:
+        pa_feather.write_feather(table, filepath)
 
 
 # Бэкап
-def run_pg_dump(output_path: str) -> Tuple[bool, str]:
+# По умолчанию — каталоговый формат (-Fd): только он позволяет pg_dump работать в несколько потоков.
+# Путь с расширением .dump — старый однофайловый custom-формат (-Fc), он всегда в один поток.
+# Путь .dump.zst — тот же -Fc без собственного сжатия, сжимает внешний zstd -T0 на всех ядрах.
+BACKUP_JOBS_DEFAULT = min(8, os.cpu_count() or 1)
+
+# Для восстановления индексов/ключей: больше памяти на CREATE INDEX в сессиях pg_restore
+_RESTORE_PGOPTIONS = "-c maintenance_work_mem=512MB"
+
+
+# Однофайловый дамп пишем сами из stdout pg_dump крупными блоками
+_DUMP_WRITE_BUFFER = 16 << 20
+
+
+_ZSTD_DUMP_SUFFIXES = [".dump", ".zst"]
+
+
+# Журнал бэкапов: один FileHandler на процесс, создаётся при первой записи
+_BACKUP_LOG_FILE = Path("logs") / "backup.log"
+_backup_log = logging.getLogger("backup")
+
+
+def _backup_logger() -> logging.Logger:
+    if not _backup_log.handlers:
+        _BACKUP_LOG_FILE.parent.mkdir(exist_ok=True)
+        h = logging.FileHandler(_BACKUP_LOG_FILE, encoding="utf-8")
+        h.setFormatter(logging.Formatter("%(asctime)s %(message)s", datefmt="%Y-%m-%d"))
+        _backup_log.addHandler(h)
+        _backup_log.setLevel(logging.INFO)
+        _backup_log.propagate = False
+    return _backup_log
+
+
+def _is_dump_file(path: str) -> bool:
+    return Path(path).suffix.lower() == ".dump"
+
+
+def _is_zstd_dump_file(path: str) -> bool:
+    return [s.lower() for s in Path(path).suffixes[-2:]] == _ZSTD_DUMP_SUFFIXES
+
+
+def _read_stderr(err) -> str:
+    err.seek(0)
+    return err.read().decode("utf-8", errors="replace")
+
+
+def _pg_dump_to_file(cmd: List[str], env: Dict[str, str], output_path: str) -> Tuple[int, str]:
+    """pg_dump в stdout -> файл через буфер _DUMP_WRITE_BUFFER; возвращает (код, stderr)."""
+    # stderr — во временный файл: pipe мог бы переполниться, пока читаем stdout
+    with tempfile.TemporaryFile() as err, open(output_path, "wb", buffering=_DUMP_WRITE_BUFFER) as out:
+        proc = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=err, bufsize=0)
+        with proc.stdout:
+            shutil.copyfileobj(proc.stdout, out, _DUMP_WRITE_BUFFER)
+        code = proc.wait()
+        stderr = _read_stderr(err)
+    if code != 0:
+        Path(output_path).unlink(missing_ok=True)
+    return code, stderr
+
+
+def _pg_dump_to_zstd(cmd: List[str], env: Dict[str, str], output_path: str) -> Tuple[int, str]:
+    """pg_dump | zstd -T0: дамп и сжатие идут параллельно; возвращает (код, stderr обоих)."""
+    with tempfile.TemporaryFile() as err:
+        dump = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=err)
+        try:
+            zstd = subprocess.Popen(
+                ["zstd", "-T0", "-q", "-f", "-o", output_path],
+                stdin=dump.stdout, stderr=err,
+            )
+        except FileNotFoundError:
+            dump.kill()
+            dump.wait()
+            raise
+        # свой конец pipe закрываем: иначе pg_dump не узнает, что zstd упал
+        dump.stdout.close()
+        zstd_code = zstd.wait()
+        code = dump.wait() or zstd_code
+        stderr = _read_stderr(err)
+    if code != 0:
+        Path(output_path).unlink(missing_ok=True)
+    return code, stderr
+
+
+def run_pg_dump(output_path: str, jobs: int = BACKUP_JOBS_DEFAULT) -> Tuple[bool, str]:
     output_path = str(output_path)
     Path(output_path).parent.mkdir(parents=True, exist_ok=True)
 
-    logs_dir = Path("logs")
-    logs_dir.mkdir(exist_ok=True)
-    log_file = logs_dir / "backup.log"
+    zstd = _is_zstd_dump_file(output_path)
+    to_stdout = zstd or _is_dump_file(output_path)
+    if zstd:
+        fmt_args = ["-F", "c", "-Z", "0"]
+    elif to_stdout:
+        fmt_args = ["-F", "c"]
+    else:
+        out_dir = Path(output_path)
+        if out_dir.exists() and (not out_dir.is_dir() or any(out_dir.iterdir())):
+            return False, f"Каталог бэкапа должен быть новым или пустым: {output_path}"
+        fmt_args = ["-F", "d", "-j", str(max(1, int(jobs)))]
+
+    log = _backup_logger()
 
     cmd = [
         "pg_dump",
         "-h", DB_HOST,
         "-p", str(DB_PORT),
         "-U", DB_USER,
-        "-F", "c",
-        "-f", output_path,
+        *fmt_args,
+        *(() if to_stdout else ("-f", output_path)),
         DB_NAME,
     ]
     env = os.environ.copy()
@@ -951,45 +1523,86 @@ def run_pg_dump(output_path: str) -> Tuple[bool, str]:
         env["PGPASSWORD"] = DB_PASSWORD
 
     try:
-        res = subprocess.run(cmd, env=env, capture_output=True, text=True)
-        if res.returncode != 0:
-            msg = f"pg_dump fail ({res.returncode}): {res.stderr.strip()}"
-            with open(log_file, "a", encoding="utf-8") as f:
-                f.write(f"{date.today()} FAIL {msg}\n")
+        if zstd:
+            returncode, stderr = _pg_dump_to_zstd(cmd, env, output_path)
+        elif to_stdout:
+            returncode, stderr = _pg_dump_to_file(cmd, env, output_path)
+        else:
+            res = subprocess.run(cmd, env=env, capture_output=True, text=True)
+            returncode, stderr = res.returncode, res.stderr
+        if returncode != 0:
+            msg = f"pg_dump fail ({returncode}): {stderr.strip()}"
+            log.error("FAIL %s", msg)
             return False, msg
 
-        with open(log_file, "a", encoding="utf-8") as f:
-            f.write(f"{date.today()} OK Backup to {output_path}\n")
+        log.info("OK Backup to %s", output_path)
         return True, f"Бэкап готов: {output_path}"
 
-    except FileNotFoundError:
-        msg = "pg_dump не найден."
-        with open(log_file, "a", encoding="utf-8") as f:
-            f.write(f"{date.today()} FAIL {msg}\n")
+    except FileNotFoundError as e:
+        msg = f"{e.filename or 'pg_dump'} не найден."
+        log.error("FAIL %s", msg)
         return False, msg
     except Exception as e:
         msg = f"Ошибка бэкапа: {e}"
-        with open(log_file, "a", encoding="utf-8") as f:
-            f.write(f"{date.today()} FAIL {msg}\n")
+        log.error("FAIL %s", msg)
         return False, msg
 
 
-def make_backup(session: Session, output_path: str) -> Tuple[bool, str]:
+def make_backup(session: Session, output_path: str, jobs: int = BACKUP_JOBS_DEFAULT) -> Tuple[bool, str]:
     if not session.can("backup"):
         return False, "Нет прав: бэкап/восстановление БД."
-    return run_pg_dump(output_path)
+    return run_pg_dump(output_path, jobs)
 
 
-def run_pg_restore(input_path: str) -> Tuple[bool, str]:
+# В сообщение об ошибке идут последние строки stderr; целиком он уходит в журнал по мере вывода
+_STDERR_TAIL_LINES = 50
+
+
+def _log_stderr(stream, log: logging.Logger, tool: str) -> str:
+    """Построчно пишет stderr в журнал бэкапов; возвращает хвост для сообщения об ошибке."""
+    tail = deque(maxlen=_STDERR_TAIL_LINES)
+    for line in stream:
+        line = line.rstrip()
+        if line:
+            log.info("%s: %s", tool, line)
+            tail.append(line)
+    return "\n".join(tail)
+
+
+def _pg_restore_from_zstd(cmd: List[str], env: Dict[str, str], input_path: str,
+                          log: logging.Logger) -> Tuple[int, str]:
+    """zstd -dc | pg_restore; stderr обоих — в журнал; возвращает (код, хвост stderr)."""
+    r, w = os.pipe()
+    with open(r, encoding="utf-8", errors="replace") as err:
+        try:
+            unzstd = subprocess.Popen(["zstd", "-dc", "-q", input_path], stdout=subprocess.PIPE, stderr=w)
+            try:
+                restore = subprocess.Popen(cmd, env=env, stdin=unzstd.stdout,
+                                           stdout=subprocess.DEVNULL, stderr=w)
+            except FileNotFoundError:
+                unzstd.kill()
+                unzstd.wait()
+                raise
+        finally:
+            # пишущий конец остаётся только у дочерних процессов — иначе чтение не дождётся EOF
+            os.close(w)
+        unzstd.stdout.close()
+        stderr = _log_stderr(err, log, "pg_restore")
+        restore_code = restore.wait()
+        unzstd_code = unzstd.wait()
+    return restore_code or unzstd_code, stderr
+
+
+def run_pg_restore(input_path: str, jobs: int = BACKUP_JOBS_DEFAULT) -> Tuple[bool, str]:
     input_path = str(input_path)
 
-    logs_dir = Path("logs")
-    logs_dir.mkdir(exist_ok=True)
-    log_file = logs_dir / "backup.log"
+    log = _backup_logger()
 
     try:
         if not db.is_closed():
             db.close()
+        # простаивающие соединения пула не должны пережить --clean со старым каталогом
+        db.close_idle()
     except Exception:
         pass
 
@@ -1003,23 +1616,32 @@ def run_pg_restore(input_path: str) -> Tuple[bool, str]:
         "--if-exists",
         "--no-owner",
         "--no-privileges",
-        input_path,
     ]
+    # -j: таблицы и индексы в несколько сессий; как и --clean, рассчитано на монопольный доступ к БД.
+    # сжатый zstd дамп приходит через stdin, а из pipe pg_restore читает только в один поток
+    zstd = _is_zstd_dump_file(input_path)
+    if not zstd:
+        cmd += ["-j", str(max(1, int(jobs))), input_path]
 
     env = os.environ.copy()
     if DB_PASSWORD:
         env["PGPASSWORD"] = DB_PASSWORD
+    env["PGOPTIONS"] = f"{env.get('PGOPTIONS', '')} {_RESTORE_PGOPTIONS}".strip()
 
     try:
-        res = subprocess.run(cmd, env=env, capture_output=True, text=True)
-        if res.returncode != 0:
-            msg = f"pg_restore fail ({res.returncode}): {res.stderr.strip()}"
-            with open(log_file, "a", encoding="utf-8") as f:
-                f.write(f"{date.today()} FAIL RESTORE {msg}\n")
+        if zstd:
+            returncode, stderr = _pg_restore_from_zstd(cmd, env, input_path, log)
+        else:
+            with subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                  text=True, encoding="utf-8", errors="replace") as proc:
+                stderr = _log_stderr(proc.stderr, log, "pg_restore")
+            returncode = proc.returncode
+        if returncode != 0:
+            msg = f"pg_restore fail ({returncode}): {stderr.strip()}"
+            log.error("FAIL RESTORE %s", msg)
             return False, msg
 
-        with open(log_file, "a", encoding="utf-8") as f:
-            f.write(f"{date.today()} OK RESTORE from {input_path}\n")
+        log.info("OK RESTORE from %s", input_path)
 
         try:
             db.connect(reuse_if_open=True)
@@ -1028,19 +1650,20 @@ def run_pg_restore(input_path: str) -> Tuple[bool, str]:
 
         return True, f"Восстановление выполнено из: {input_path}."
 
-    except FileNotFoundError:
-        msg = "pg_restore не найден."
-        with open(log_file, "a", encoding="utf-8") as f:
-            f.write(f"{date.today()} FAIL RESTORE {msg}\n")
+    except FileNotFoundError as e:
+        msg = f"{e.filename or 'pg_restore'} не найден."
+        log.error("FAIL RESTORE %s", msg)
         return False, msg
     except Exception as e:
         msg = f"Ошибка восстановления: {e}"
-        with open(log_file, "a", encoding="utf-8") as f:
-            f.write(f"{date.today()} FAIL RESTORE {msg}\n")
+        log.error("FAIL RESTORE %s", msg)
         return False, msg
 
 
-def restore_backup(session: Session, input_path: str) -> Tuple[bool, str]:
+def restore_backup(session: Session, input_path: str, jobs: int = BACKUP_JOBS_DEFAULT) -> Tuple[bool, str]:
     if not session.can("backup"):
         return False, "Нет прав: бэкап/восстановление БД."
-    return run_pg_restore(input_path)
+    ok, msg = run_pg_restore(input_path, jobs)
+    if ok:
+        _role_ids.clear()
+    return ok, msg
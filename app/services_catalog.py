@@ -1,11 +1,15 @@
+import re
+from dataclasses import dataclass
+from datetime import date
 from typing import List, Dict, Any, Optional, Tuple
 
-from peewee import fn, JOIN, Case, IntegrityError
+from peewee import fn, JOIN, IntegrityError
 
 from app.db import db
+from app.search import like_pattern
 from app.models import (
     Book, Publisher,
-    Author, BookAuthor,
+    Author, BookAuthor, BookAuthorsAgg, BookReaderStats,
     Copy, Location, Branch, Loan
 )
 
@@ -13,8 +17,39 @@ from app.models import (
 _ALLOWED_COPY_STATUSES = ("available", "loaned", "reserved", "lost", "damaged")
 
 
-def _generate_next_inventory_code(prefix: str = "INV-", width: int = 4) -> str:
+# Лёгкие записи справочников для диалогов (вместо dict на каждую строку)
+@dataclass(slots=True, frozen=True)
+class PublisherRow:
+    id: int
+    name: str
+
+
+@dataclass(slots=True, frozen=True)
+class AuthorRow:
+    id: int
+    full_name: str
+
+
+@dataclass(slots=True, frozen=True)
+class LocationRow:
+    id: int
+    code: str
+    branch_name: str
+
+
+# Номера кодов INV-NNNN выдаёт последовательность (migrations/005_copy_inventory_sequence.py)
+INV_PREFIX = "INV-"
+INV_SEQUENCE = "copy_inv_seq"
+_INV_CODE_RE = re.compile(r"INV-([0-9]+)")
+
+
+def _generate_next_inventory_code(prefix: str = INV_PREFIX, width: int = 4) -> str:
     """Генерирует следующий инвентарный код вида INV-0001"""
+    if prefix == INV_PREFIX:
+        n = db.execute_sql(f"SELECT nextval('{INV_SEQUENCE}')").fetchone()[0]
+        return f"{prefix}{n:0{width}d}"
+
+    # прочие префиксы — по максимуму среди существующих кодов
     sql = """
         SELECT COALESCE(
             MAX(CAST(SUBSTRING(inventory_code FROM '([0-9]+)$') AS INT)),
@@ -29,13 +64,23 @@ def _generate_next_inventory_code(prefix: str = "INV-", width: int = 4) -> str:
 
     cur = db.execute_sql(sql, (full_regex,))
     max_n = cur.fetchone()[0] or 0
-    return f"{prefix}{str(max_n + 1).zfill(width)}"
+    return f"{prefix}{max_n + 1:0{width}d}"
+
+
+def _reserve_manual_inventory_code(code: str) -> None:
+    """Ручной код INV-NNNN сдвигает последовательность, чтобы nextval его не повторил."""
+    m = _INV_CODE_RE.fullmatch(code)
+    if m:
+        db.execute_sql(
+            f"SELECT setval('{INV_SEQUENCE}', GREATEST(%s, (SELECT last_value FROM {INV_SEQUENCE})))",
+            (int(m.group(1)),)
+        )
 
 
 # Авторы
-def list_authors() -> List[Dict[str, Any]]:
+def list_authors() -> List[AuthorRow]:
     q = Author.select(Author.id, Author.full_name).order_by(Author.full_name.asc())
-    return list(q.dicts())
+    return [AuthorRow(*r) for r in q.tuples()]
 
 
 def get_book_author_ids(book_id: int) -> List[int]:
@@ -45,91 +90,107 @@ def get_book_author_ids(book_id: int) -> List[int]:
     return [r.author_id for r in q]
 
 
+def _link_authors(book: Book, author_ids: List[int]) -> None:
+    """Привязать к книге существующих авторов: одна выборка id и одна вставка."""
+    if not author_ids:
+        return
+    valid_ids = {aid for (aid,) in Author.select(Author.id).where(Author.id.in_(author_ids)).tuples()}
+    rows = [{"book": book, "author": aid} for aid in dict.fromkeys(author_ids) if aid in valid_ids]
+    if rows:
+        BookAuthor.insert_many(rows).on_conflict_ignore().execute()
+
+
 def _authors_subquery():
+    # строка авторов и их id ведутся триггерами в book_authors_agg
     return (
-        BookAuthor
-        .select(
-            BookAuthor.book.alias("book_id"),
-            fn.STRING_AGG(Author.full_name, ", ").alias("authors")
-        )
-        .join(Author)
-        .group_by(BookAuthor.book)
+        BookAuthorsAgg
+        .select(BookAuthorsAgg.book_id, BookAuthorsAgg.authors, BookAuthorsAgg.author_ids)
         .alias("ba")
     )
 
 
-def _reader_stats_subquery():
-    avail_count = fn.SUM(
-        Case(None, ((Copy.status == "available", 1),), 0)
-    ).alias("available_count")
-
-    next_due = fn.MIN(Loan.due_date).alias("next_due")
-
-    return (
-        Copy
-        .select(
-            Copy.book.alias("book_id"),
-            avail_count,
-            next_due
-        )
-        .join(
-            Loan,
-            JOIN.LEFT_OUTER,
-            on=((Loan.copy == Copy.id) & (Loan.status.in_(("open", "overdue"))))
-        )
-        .group_by(Copy.book)
-        .alias("st")
-    )
+def get_book_availability(book_id: int) -> Tuple[int, Optional[date]]:
+    """(свободных экземпляров, ближайший срок возврата) для одной книги."""
+    row = (BookReaderStats
+           .select(BookReaderStats.available_count, BookReaderStats.next_due)
+           .where(BookReaderStats.book_id == book_id)
+           .tuples()
+           .first())
+    if not row:
+        return 0, None
+    return int(row[0] or 0), row[1]
 
 
 # ---------- справочники ----------
-def list_publishers() -> List[Dict[str, Any]]:
-    return list(Publisher.select(Publisher.id, Publisher.name).order_by(Publisher.name).dicts())
+def list_publishers() -> List[PublisherRow]:
+    q = Publisher.select(Publisher.id, Publisher.name).order_by(Publisher.name)
+    return [PublisherRow(*r) for r in q.tuples()]
 
 
-def list_locations() -> List[Dict[str, Any]]:
+def list_locations() -> List[LocationRow]:
     q = (Location
          .select(Location.id, Location.code, Branch.name.alias("branch_name"))
          .join(Branch)
          .order_by(Branch.name, Location.code))
-    return list(q.dicts())
+    return [LocationRow(*r) for r in q.tuples()]
 
 
 # ---------- книги ----------
-def list_books() -> List[Dict[str, Any]]:
+def list_books(search: Optional[str] = None, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
     ba = _authors_subquery()
 
     q = (Book
          .select(
              Book.id, Book.title, Book.language, Book.publish_year, Book.pages_count,
              Publisher.name.alias("publisher"),
-             ba.c.authors.alias("authors")
+             ba.c.authors.alias("authors"),
+             ba.c.author_ids.alias("author_ids")
          )
          .join(Publisher, join_type=JOIN.LEFT_OUTER)
          .switch(Book)
          .join(ba, JOIN.LEFT_OUTER, on=(ba.c.book_id == Book.id))
          .order_by(Book.title.asc()))
+
+    term = (search or "").strip()
+    if term:
+        pat = like_pattern(term)
+        q = q.where(Book.title.ilike(pat) | ba.c.authors.ilike(pat) | Publisher.name.ilike(pat))
+    if limit is not None:
+        q = q.limit(limit).offset(offset)
     return list(q.dicts())
 
 
-def list_books_reader_view() -> List[Dict[str, Any]]:
+def list_books_reader_view(
+    book_id: Optional[int] = None,
+    search: Optional[str] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> List[Dict[str, Any]]:
     ba = _authors_subquery()
-    st = _reader_stats_subquery()
 
     q = (Book
          .select(
              Book.id, Book.title, Book.publish_year,
              Publisher.name.alias("publisher"),
              ba.c.authors.alias("authors"),
-             fn.COALESCE(st.c.available_count, 0).alias("available_count"),
-             st.c.next_due.alias("next_due")
+             fn.COALESCE(BookReaderStats.available_count, 0).alias("available_count"),
+             BookReaderStats.next_due.alias("next_due")
          )
          .join(Publisher, JOIN.LEFT_OUTER)
          .switch(Book)
          .join(ba, JOIN.LEFT_OUTER, on=(ba.c.book_id == Book.id))
          .switch(Book)
-         .join(st, JOIN.LEFT_OUTER, on=(st.c.book_id == Book.id))
+         .join(BookReaderStats, JOIN.LEFT_OUTER, on=(BookReaderStats.book_id == Book.id))
          .order_by(Book.title.asc()))
+    if book_id is not None:
+        q = q.where(Book.id == book_id)
+
+    term = (search or "").strip()
+    if term:
+        pat = like_pattern(term)
+        q = q.where(Book.title.ilike(pat) | ba.c.authors.ilike(pat) | Publisher.name.ilike(pat))
+    if limit is not None:
+        q = q.limit(limit).offset(offset)
 
     return list(q.dicts())
 
@@ -161,9 +222,7 @@ def create_book(
         )
 
         # привязка авторов
-        for aid in author_ids:
-            if Author.get_or_none(Author.id == aid):
-                BookAuthor.get_or_create(book=book, author=aid)
+        _link_authors(book, author_ids)
 
     return True, "Книга добавлена."
 
@@ -200,41 +259,59 @@ def update_book(
 
         # перезаписать авторов
         BookAuthor.delete().where(BookAuthor.book == book).execute()
-        for aid in author_ids:
-            if Author.get_or_none(Author.id == aid):
-                BookAuthor.get_or_create(book=book, author=aid)
+        _link_authors(book, author_ids)
 
     return True, "Книга обновлена."
 
 
+# Книга без экземпляров удаляется вместе со связями с авторами одним запросом
+_DELETE_BOOK_SQL = """
+    WITH del_ba AS (
+        DELETE FROM book_authors
+        WHERE book_id = %s AND NOT EXISTS (SELECT 1 FROM copies WHERE book_id = %s)
+    )
+    DELETE FROM books
+    WHERE id = %s AND NOT EXISTS (SELECT 1 FROM copies WHERE book_id = %s)
+    RETURNING id
+"""
+
+
 def delete_book(book_id: int) -> Tuple[bool, str]:
-    book = Book.get_or_none(Book.id == book_id)
-    if not book:
-        return False, "Книга не найдена."
+    row = db.execute_sql(_DELETE_BOOK_SQL, (book_id,) * 4).fetchone()
+    if row:
+        return True, "Книга удалена."
 
-    copies_cnt = Copy.select(fn.COUNT(Copy.id)).where(Copy.book == book).scalar() or 0
+    # не удалилась — выясняем причину только на этом пути
+    copies_cnt = Copy.select(fn.COUNT(Copy.id)).where(Copy.book == book_id).scalar() or 0
     if copies_cnt > 0:
         return False, f"Нельзя удалить: у книги есть экземпляры ({copies_cnt}). Сначала удалите экземпляры."
-
-    with db.atomic():
-        BookAuthor.delete().where(BookAuthor.book == book).execute()
-        book.delete_instance()
-    return True, "Книга удалена."
+    return False, "Книга не найдена."
 
 
 # ---------- экземпляры ----------
-def list_copies_for_book(book_id: int) -> List[Dict[str, Any]]:
+def list_copies_for_books(book_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+    """Экземпляры нескольких книг одним запросом: {book_id: [строки по инв. коду]}."""
+    result: Dict[int, List[Dict[str, Any]]] = {bid: [] for bid in book_ids}
+    if not result:
+        return result
     q = (Copy
          .select(
-             Copy.id, Copy.inventory_code, Copy.status, Copy.price, Copy.condition_note,
+             Copy.id, Copy.book.alias("book_id"), Copy.inventory_code, Copy.status, Copy.price,
+             Copy.condition_note,
              Location.code.alias("location_code"),
              Branch.name.alias("branch_name")
          )
          .join(Location, join_type=JOIN.LEFT_OUTER)
          .join(Branch, join_type=JOIN.LEFT_OUTER)
-         .where(Copy.book_id == book_id)
-         .order_by(Copy.inventory_code.asc()))
-    return list(q.dicts())
+         .where(Copy.book_id.in_(list(result)))
+         .order_by(Copy.book_id, Copy.inventory_code.asc()))
+    for r in q.dicts():
+        result[r["book_id"]].append(r)
+    return result
+
+
+def list_copies_for_book(book_id: int) -> List[Dict[str, Any]]:
+    return list_copies_for_books([book_id])[book_id]
 
 
 def create_copy(book_id: int, inventory_code: str, status: str, price: Optional[float],
@@ -255,25 +332,23 @@ def create_copy(book_id: int, inventory_code: str, status: str, price: Optional[
         return False, "Такой инвентарный код уже существует."
 
     with db.atomic():
+        if inventory_code:
+            _reserve_manual_inventory_code(inventory_code)
+        # номер из последовательности уникален — повторные попытки не нужны
         code = inventory_code or _generate_next_inventory_code()
+        try:
+            Copy.create(
+                book=book,
+                inventory_code=code,
+                status=status,
+                price=price,
+                location=loc,
+                condition_note=condition_note
+            )
+        except IntegrityError:
+            return False, "Такой инвентарный код уже существует."
 
-        for _ in range(20):
-            try:
-                Copy.create(
-                    book=book,
-                    inventory_code=code,
-                    status=status,
-                    price=price,
-                    location=loc,
-                    condition_note=condition_note
-                )
-                return True, f"Экземпляр добавлен. Инв. код: {code}"
-            except IntegrityError:
-                if inventory_code:
-                    return False, "Такой инвентарный код уже существует."
-                code = _generate_next_inventory_code()
-
-    return False, "Не удалось сгенерировать уникальный инвентарный код."
+    return True, f"Экземпляр добавлен. Инв. код: {code}"
 
 
 def update_copy(copy_id: int, inventory_code: str, status: str, price: Optional[float],
@@ -289,22 +364,17 @@ def update_copy(copy_id: int, inventory_code: str, status: str, price: Optional[
     if status not in _ALLOWED_COPY_STATUSES:
         return False, "Неверный статус экземпляра."
 
-    exists = (Copy
-              .select(Copy.id)
-              .where((Copy.inventory_code == inventory_code) & (Copy.id != copy.id))
-              .limit(1)
-              .exists())
-    if exists:
-        return False, "Такой инвентарный код уже существует."
-
     loc = Location.get_or_none(Location.id == location_id) if location_id else None
 
     with db.atomic():
+        if inventory_code != copy.inventory_code:
+            _reserve_manual_inventory_code(inventory_code)
         copy.inventory_code = inventory_code
         copy.status = status
         copy.price = price
         copy.location = loc
         copy.condition_note = condition_note
+        # повтор кода ловит уникальный индекс copies.inventory_code, без отдельной проверки
         try:
             copy.save()
         except IntegrityError:
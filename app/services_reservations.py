@@ -1,12 +1,16 @@
 from __future__ import annotations
 
 from datetime import date, datetime, time, timedelta
+from time import monotonic
+from typing import Optional
 import json
 
-from peewee import fn, JOIN
+from peewee import fn, JOIN, IntegrityError
 
 from app.db import db
-from app.models import Reservation, Copy, Location, Branch, Book, Loan, User, Role, UserRole
+from app.search import like_pattern, status_codes_matching
+from app.services import RES_STATUS_RU
+from app.models import Reservation, ReservationDetails, Copy, Location, Branch, User, Role, UserRole
 
 
 def _user_is_admin(user: User) -> bool:
@@ -45,26 +49,39 @@ def _end_of_day(d: date) -> datetime:
     return datetime.combine(d, time(23, 59, 59))
 
 
-def expire_old_reservations() -> int:
-    """Снимает истёкшие резервы и возвращает копии в available"""
-    now = datetime.now()
-    with db.atomic():
-        q = (Reservation
-             .select(Reservation.id, Reservation.copy_id)
-             .where((Reservation.status == "active") & (Reservation.expires_at < now)))
+# Истёкшие резервы снимаются и экземпляры освобождаются одним запросом
+_EXPIRE_RESERVATIONS_SQL = """
+    WITH expired AS (
+        UPDATE reservations SET status = 'expired'
+        WHERE status = 'active' AND expires_at < %s
+        RETURNING copy_id
+    ), freed AS (
+        UPDATE copies SET status = 'available'
+        WHERE status = 'reserved' AND id IN (SELECT copy_id FROM expired)
+    )
+    SELECT COUNT(*) FROM expired
+"""
 
-        ids = []
-        copy_ids = []
-        for r in q:
-            ids.append(r.id)
-            copy_ids.append(r.copy_id)
 
-        if not ids:
-            return 0
+# Чаще раза в _EXPIRE_TTL_S секунд снимать резервы незачем: срок задан концом дня
+_EXPIRE_TTL_S = 30.0
+_last_expire_ts: Optional[float] = None
+
+
+def expire_old_reservations(force: bool = False) -> int:
+    """Снимает истёкшие резервы и возвращает копии в available"""
+    global _last_expire_ts
+    now = monotonic()
+    if not force and _last_expire_ts is not None and now - _last_expire_ts < _EXPIRE_TTL_S:
+        return 0
+    n = db.execute_sql(_EXPIRE_RESERVATIONS_SQL, (datetime.now(),)).fetchone()[0]
+    _last_expire_ts = now
+    return n
 
-        Reservation.update(status="expired").where(Reservation.id.in_(ids)).execute()
-        Copy.update(status="available").where((Copy.id.in_(copy_ids)) & (Copy.status == "reserved")).execute()
-        return len(ids)
+
+def _is_active(res: Reservation) -> bool:
+    # истёкший, но ещё не снятый резерв считается неактивным
+    return res.status == "active" and res.expires_at >= datetime.now()
 
 
 def list_available_branches_for_book(book_id: int):
@@ -84,6 +101,29 @@ def list_available_branches_for_book(book_id: int):
     return list(q.dicts())
 
 
+# Резерв одним запросом: первый свободный экземпляр книги в филиале помечается reserved
+# и сразу записывается в reservations; SKIP LOCKED — параллельные резервы берут разные экземпляры
+_CREATE_RESERVATION_SQL = """
+    WITH picked AS (
+        UPDATE copies SET status = 'reserved'
+        WHERE id = (
+            SELECT c.id FROM copies c
+            JOIN locations l ON l.id = c.location_id
+            WHERE c.book_id = %s AND c.status = 'available' AND l.branch_id = %s
+            ORDER BY c.id
+            LIMIT 1
+            FOR UPDATE OF c SKIP LOCKED
+        )
+        RETURNING id
+    )
+    INSERT INTO reservations
+        (reader_id, copy_id, branch_id, pickup_date, created_at, expires_at, status, extended_once)
+    SELECT %s, picked.id, %s, %s, %s, %s, 'active', FALSE
+    FROM picked
+    RETURNING id
+"""
+
+
 def create_reservation(reader: User, book_id: int, branch_id: int, pickup_date: date):
     today = date.today()
     if pickup_date < today or pickup_date > today + timedelta(days=3):
@@ -91,92 +131,83 @@ def create_reservation(reader: User, book_id: int, branch_id: int, pickup_date:
 
     expire_old_reservations()
 
-    with db.atomic():
-        copy_q = (Copy
-                  .select(Copy)
-                  .join(Location)
-                  .where(
-                      (Copy.book == book_id) &
-                      (Copy.status == "available") &
-                      (Location.branch == branch_id)
-                  )
-                  .order_by(Copy.id.asc())
-                  .for_update())
-
-        copy_obj = copy_q.first()
-        if not copy_obj:
-            return False, "В этом филиале уже нет свободных экземпляров.", None
-
-        copy_obj.status = "reserved"
-        copy_obj.save()
-
-        res = Reservation.create(
-            reader=reader,
-            copy=copy_obj,
-            branch=branch_id,
-            pickup_date=pickup_date,
-            expires_at=_end_of_day(pickup_date),
-            status="active",
-            extended_once=False,
-        )
-        return True, f"Резерв создан до конца дня {pickup_date}.", res.id
-
-
-def list_reservations_for_reader(reader: User):
-    expire_old_reservations()
-
-    q = (Reservation
-         .select(
-             Reservation.id,
-             Reservation.status,
-             Reservation.pickup_date,
-             Reservation.expires_at,
-             Reservation.extended_once,
-             Book.title.alias("book_title"),
-             Copy.inventory_code.alias("inv"),
-             Branch.name.alias("branch_name"),
-             Branch.address.alias("branch_address"),
-         )
-         .join(Copy)
-         .join(Book)
-         .switch(Reservation)
-         .join(Branch)
-         .where(Reservation.reader == reader)
-         .order_by(Reservation.created_at.desc()))
+    try:
+        row = db.execute_sql(
+            _CREATE_RESERVATION_SQL,
+            (book_id, branch_id, reader.id, branch_id, pickup_date, datetime.now(), _end_of_day(pickup_date)),
+        ).fetchone()
+    except IntegrityError as e:
+        return False, f"Ошибка БД: {e}", None
+
+    if not row:
+        return False, "В этом филиале уже нет свободных экземпляров.", None
+    return True, f"Резерв создан до конца дня {pickup_date}.", row[0]
+
+
+# Списки резервов читают представление v_reservation_details: соединения и "Филиал | адрес" —
+# в одном месте в SQL (migrations/013_reservation_details_view.py)
+_RD = ReservationDetails
+
+_RESERVATION_COLUMNS = (
+    _RD.id, _RD.status, _RD.pickup_date, _RD.expires_at, _RD.extended_once,
+    _RD.book_id, _RD.book_title, _RD.inv,
+    _RD.branch_name, _RD.branch_address, _RD.branch_display,
+)
+
+
+def _reservation_search(term: str):
+    pat = like_pattern(term)
+    cond = (_RD.book_title.ilike(pat) | _RD.inv.ilike(pat)
+            | _RD.branch_name.ilike(pat) | _RD.branch_address.ilike(pat))
+    statuses = status_codes_matching(term, RES_STATUS_RU)
+    if statuses:
+        cond |= _RD.status.in_(statuses)
+    return cond
+
+
+def _reservation_details(q, reservation_id: Optional[int], limit: Optional[int], offset: int):
+    q = q.order_by(_RD.created_at.desc())
+    if reservation_id is not None:
+        q = q.where(_RD.id == reservation_id)
+    if limit is not None:
+        q = q.limit(limit).offset(offset)
     return list(q.dicts())
 
 
-def list_reservations_for_librarian():
-    expire_old_reservations()
-
-    q = (Reservation
-         .select(
-             Reservation.id,
-             Reservation.status,
-             Reservation.pickup_date,
-             Reservation.expires_at,
-             Reservation.extended_once,
-             Book.title.alias("book_title"),
-             Copy.inventory_code.alias("inv"),
-             Branch.name.alias("branch_name"),
-             Branch.address.alias("branch_address"),
-             User.full_name.alias("reader_name"),
-             User.phone.alias("reader_phone"),
-             User.login.alias("reader_login"),
-         )
-         .join(Copy)
-         .join(Book)
-         .switch(Reservation)
-         .join(Branch)
-         .switch(Reservation)
-         .join(User, on=(Reservation.reader == User.id))
-         .order_by(Reservation.created_at.desc()))
-    return list(q.dicts())
+def list_reservations_for_reader(
+    reader: User,
+    reservation_id: Optional[int] = None,
+    search: Optional[str] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+):
+    q = _RD.select(*_RESERVATION_COLUMNS).where(_RD.reader_id == reader.id)
+
+    term = (search or "").strip()
+    if term:
+        q = q.where(_reservation_search(term))
+    return _reservation_details(q, reservation_id, limit, offset)
+
+
+def list_reservations_for_librarian(
+    reservation_id: Optional[int] = None,
+    search: Optional[str] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+):
+    q = _RD.select(*_RESERVATION_COLUMNS, _RD.reader_name, _RD.reader_phone, _RD.reader_login)
+
+    term = (search or "").strip()
+    if term:
+        pat = like_pattern(term)
+        q = q.where(
+            _reservation_search(term)
+            | _RD.reader_name.ilike(pat) | _RD.reader_login.ilike(pat) | _RD.reader_phone.ilike(pat)
+        )
+    return _reservation_details(q, reservation_id, limit, offset)
 
 
 def cancel_reservation(reader: User, reservation_id: int):
-    expire_old_reservations()
-
     with db.atomic():
         res = Reservation.get_or_none(Reservation.id == reservation_id)
         if not res:
@@ -184,7 +215,7 @@ def cancel_reservation(reader: User, reservation_id: int):
         # Владелец может отменять свой резерв; админ может отменять любой.
         if res.reader_id != reader.id and not _user_is_admin(reader):
             return False, "Это не ваш резерв."
-        if res.status != "active":
+        if not _is_active(res):
             return False, "Резерв уже не активен."
 
         res.status = "cancelled"
@@ -195,8 +226,6 @@ def cancel_reservation(reader: User, reservation_id: int):
 
 
 def extend_reservation(reader: User, reservation_id: int):
-    expire_old_reservations()
-
     with db.atomic():
         res = Reservation.get_or_none(Reservation.id == reservation_id)
         if not res:
@@ -204,7 +233,7 @@ def extend_reservation(reader: User, reservation_id: int):
         # Владелец может продлевать свой резерв; админ может продлевать любой.
         if res.reader_id != reader.id and not _user_is_admin(reader):
             return False, "Это не ваш резерв."
-        if res.status != "active":
+        if not _is_active(res):
             return False, "Резерв уже не активен."
         if res.extended_once:
             return False, "Продлить можно только один раз."
@@ -217,50 +246,53 @@ def extend_reservation(reader: User, reservation_id: int):
         return True, f"Продлено до {new_pick}."
 
 
-def fulfill_reservation(librarian: User, reservation_id: int, loan_days: int = 14):
-    expire_old_reservations()
+# Выдача по резерву, резерв и экземпляр — одним запросом после проверок под FOR UPDATE
+_FULFILL_RESERVATION_SQL = """
+    WITH new_loan AS (
+        INSERT INTO loans (copy_id, reader_id, librarian_id, status, start_date, due_date)
+        VALUES (%s, %s, %s, 'open', %s, %s)
+        RETURNING id
+    ), fulfilled AS (
+        UPDATE reservations SET status = 'fulfilled' WHERE id = %s
+    ), loaned AS (
+        UPDATE copies SET status = 'loaned' WHERE id = %s
+    )
+    SELECT id FROM new_loan
+"""
+
 
+def fulfill_reservation(librarian: User, reservation_id: int, loan_days: int = 14):
     with db.atomic():
+        # только поля для проверок и записи: без цены, примечания и прочих колонок
         res = (Reservation
-               .select(Reservation, Copy)
+               .select(Reservation.id, Reservation.status, Reservation.expires_at, Reservation.reader,
+                       Copy.id, Copy.status)
                .join(Copy)
                .where(Reservation.id == reservation_id)
                .for_update()
                .first())
 
         if not res:
-            return False, "Резерв не найден."
-        if res.status != "active":
-            return False, "Резерв не активен."
+            return False, "Резерв не найден.", None
+        if not _is_active(res):
+            return False, "Резерв не активен.", None
 
         copy_obj = res.copy
         if copy_obj.status != "reserved":
-            return False, "Экземпляр не зарезервирован."
-
-        exists_open = (Loan
-                       .select()
-                       .where((Loan.copy == copy_obj.id) & (Loan.status.in_(ACTIVE_LOAN_STATUSES)))
-                       .exists())
-        if exists_open:
-            return False, "На этот экземпляр уже есть активная выдача."
+            return False, "Экземпляр не зарезервирован.", None
 
         start = date.today()
         due = start + timedelta(days=loan_days)
 
-        Loan.create(
-            copy=copy_obj,
-            reader=res.reader,
-            librarian=librarian,
-            status="open",
-            start_date=start,
-            due_date=due,
-            return_date=None,
-        )
-
-        res.status = "fulfilled"
-        res.save()
-
-        copy_obj.status = "loaned"
-        copy_obj.save()
-
-        return True, f"Выдано до {due}."
+        # одну активную выдачу на экземпляр гарантирует uq_one_open_loan_per_copy;
+        # точка сохранения — чтобы после отказа индекса транзакция не осталась прерванной
+        try:
+            with db.atomic():
+                loan_id = db.execute_sql(
+                    _FULFILL_RESERVATION_SQL,
+                    (copy_obj.id, res.reader_id, librarian.id, start, due, res.id, copy_obj.id),
+                ).fetchone()[0]
+        except IntegrityError:
+            return False, "На этот экземпляр уже есть активная выдача.", None
+
+        return True, f"Выдано до {due}.", loan_id
@@ -0,0 +1,20 @@
+from peewee_migrate import Migrator
+
+
+def migrate(migrator: Migrator, database, fake=False, **kwargs):
+    # Наличие по книге: COUNT(*) FILTER (status = 'available') ... GROUP BY book_id
+    migrator.sql("""
+        CREATE INDEX IF NOT EXISTS ix_copies_book_status
+        ON copies(book_id, status);
+    """)
+
+    # Ближайший срок возврата: MIN(due_date) по активным выдачам экземпляра
+    migrator.sql("""
+        CREATE INDEX IF NOT EXISTS ix_loans_copy_status_due
+        ON loans(copy_id, status, due_date);
+    """)
+
+
+def rollback(migrator: Migrator, database, fake=False, **kwargs):
+    migrator.sql("DROP INDEX IF EXISTS ix_loans_copy_status_due;")
+    migrator.sql("DROP INDEX IF EXISTS ix_copies_book_status;")
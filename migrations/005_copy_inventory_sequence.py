@@ -0,0 +1,21 @@
+from peewee_migrate import Migrator
+
+
+def migrate(migrator: Migrator, database, fake=False, **kwargs):
+    # Номер для инвентарного кода INV-NNNN: nextval вместо MAX(...) с регуляркой по всей таблице
+    migrator.sql("CREATE SEQUENCE IF NOT EXISTS copy_inv_seq;")
+
+    # продолжаем с максимального уже выданного номера
+    migrator.sql("""
+        SELECT setval(
+            'copy_inv_seq',
+            COALESCE(MAX(CAST(SUBSTRING(inventory_code FROM '([0-9]+)$') AS INT)), 0) + 1,
+            false
+        )
+        FROM copies
+        WHERE inventory_code ~ '^INV\\-[0-9]+$';
+    """)
+
+
+def rollback(migrator: Migrator, database, fake=False, **kwargs):
+    migrator.sql("DROP SEQUENCE IF EXISTS copy_inv_seq;")
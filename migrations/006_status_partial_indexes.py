@@ -0,0 +1,22 @@
+from peewee_migrate import Migrator
+
+
+def migrate(migrator: Migrator, database, fake=False, **kwargs):
+    # Просрочки: UPDATE loans ... WHERE status = 'open' AND due_date < today
+    migrator.sql("""
+        CREATE INDEX IF NOT EXISTS ix_loans_open_due
+        ON loans(due_date)
+        WHERE status = 'open';
+    """)
+
+    # Снятие истёкших резервов раз в минуту: status = 'active' AND expires_at < now
+    migrator.sql("""
+        CREATE INDEX IF NOT EXISTS ix_reservations_active_expires
+        ON reservations(expires_at)
+        WHERE status = 'active';
+    """)
+
+
+def rollback(migrator: Migrator, database, fake=False, **kwargs):
+    migrator.sql("DROP INDEX IF EXISTS ix_reservations_active_expires;")
+    migrator.sql("DROP INDEX IF EXISTS ix_loans_open_due;")
@@ -0,0 +1,12 @@
+from peewee_migrate import Migrator
+
+
+def migrate(migrator: Migrator, database, fake=False, **kwargs):
+    # Поиск книг и авторов по точному названию/ФИО (сид, проверка существующих записей)
+    migrator.sql("CREATE INDEX IF NOT EXISTS books_title_idx ON books(title);")
+    migrator.sql("CREATE INDEX IF NOT EXISTS authors_full_name_idx ON authors(full_name);")
+
+
+def rollback(migrator: Migrator, database, fake=False, **kwargs):
+    migrator.sql("DROP INDEX IF EXISTS authors_full_name_idx;")
+    migrator.sql("DROP INDEX IF EXISTS books_title_idx;")
@@ -0,0 +1,102 @@
+from peewee_migrate import Migrator
+
+
+def migrate(migrator: Migrator, database, fake=False, **kwargs):
+    # Авторы книги одной строкой (отчёты, каталог) — хранятся, а не считаются STRING_AGG на каждый запрос.
+    # Не MATERIALIZED VIEW: REFRESH пересчитывает все книги, а триггеры ниже — только затронутые.
+    migrator.sql("""
+        CREATE TABLE IF NOT EXISTS book_authors_agg (
+            book_id     INTEGER PRIMARY KEY,
+            authors     TEXT NOT NULL,
+            author_ids  INTEGER[] NOT NULL
+        );
+    """)
+
+    # ON CONFLICT, а не DELETE + INSERT: авторов одной книги могут править из разных сессий одновременно
+    migrator.sql("""
+        CREATE OR REPLACE FUNCTION book_authors_agg_refresh(ids INTEGER[]) RETURNS void AS $$
+            INSERT INTO book_authors_agg (book_id, authors, author_ids)
+            SELECT ba.book_id,
+                   string_agg(a.full_name, ', ' ORDER BY a.full_name),
+                   array_agg(a.id ORDER BY a.full_name)
+            FROM book_authors ba
+            JOIN authors a ON a.id = ba.author_id
+            WHERE ba.book_id = ANY(ids)
+            GROUP BY ba.book_id
+            ON CONFLICT (book_id) DO UPDATE
+                SET authors = EXCLUDED.authors,
+                    author_ids = EXCLUDED.author_ids;
+
+            DELETE FROM book_authors_agg g
+            WHERE g.book_id = ANY(ids)
+              AND NOT EXISTS (SELECT 1 FROM book_authors ba WHERE ba.book_id = g.book_id);
+        $$ LANGUAGE sql;
+    """)
+
+    # триггеры уровня оператора: пачка вставок (сид, диалог книги) — один пересчёт
+    migrator.sql("""
+        CREATE OR REPLACE FUNCTION book_authors_agg_on_links() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM book_authors_agg_refresh(ARRAY(SELECT DISTINCT book_id FROM new_rows));
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM book_authors_agg_refresh(ARRAY(SELECT DISTINCT book_id FROM old_rows));
+            ELSE
+                PERFORM book_authors_agg_refresh(ARRAY(
+                    SELECT book_id FROM new_rows UNION SELECT book_id FROM old_rows
+                ));
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+    migrator.sql("""
+        CREATE OR REPLACE FUNCTION book_authors_agg_on_authors() RETURNS trigger AS $$
+        BEGIN
+            PERFORM book_authors_agg_refresh(ARRAY(
+                SELECT DISTINCT ba.book_id FROM book_authors ba JOIN new_rows n ON n.id = ba.author_id
+            ));
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+    # у триггера с переходной таблицей может быть только одно событие
+    migrator.sql("""
+        DROP TRIGGER IF EXISTS book_authors_agg_ins ON book_authors;
+        CREATE TRIGGER book_authors_agg_ins AFTER INSERT ON book_authors
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION book_authors_agg_on_links();
+
+        DROP TRIGGER IF EXISTS book_authors_agg_upd ON book_authors;
+        CREATE TRIGGER book_authors_agg_upd AFTER UPDATE ON book_authors
+            REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION book_authors_agg_on_links();
+
+        DROP TRIGGER IF EXISTS book_authors_agg_del ON book_authors;
+        CREATE TRIGGER book_authors_agg_del AFTER DELETE ON book_authors
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION book_authors_agg_on_links();
+
+        DROP TRIGGER IF EXISTS book_authors_agg_author_upd ON authors;
+        CREATE TRIGGER book_authors_agg_author_upd AFTER UPDATE ON authors
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION book_authors_agg_on_authors();
+    """)
+
+    # начальное заполнение по уже существующим связям
+    migrator.sql("""
+        SELECT book_authors_agg_refresh(ARRAY(SELECT DISTINCT book_id FROM book_authors));
+    """)
+
+
+def rollback(migrator: Migrator, database, fake=False, **kwargs):
+    migrator.sql("DROP TRIGGER IF EXISTS book_authors_agg_author_upd ON authors;")
+    migrator.sql("DROP TRIGGER IF EXISTS book_authors_agg_del ON book_authors;")
+    migrator.sql("DROP TRIGGER IF EXISTS book_authors_agg_upd ON book_authors;")
+    migrator.sql("DROP TRIGGER IF EXISTS book_authors_agg_ins ON book_authors;")
+    migrator.sql("DROP FUNCTION IF EXISTS book_authors_agg_on_authors();")
+    migrator.sql("DROP FUNCTION IF EXISTS book_authors_agg_on_links();")
+    migrator.sql("DROP FUNCTION IF EXISTS book_authors_agg_refresh(INTEGER[]);")
+    migrator.sql("DROP TABLE IF EXISTS book_authors_agg;")
@@ -0,0 +1,125 @@
+from peewee_migrate import Migrator
+
+
+def migrate(migrator: Migrator, database, fake=False, **kwargs):
+    # Свободные экземпляры и ближайший срок возврата по книге — для каталога читателя.
+    # Отдельная таблица, а не колонки books: save() книги не затрёт значения, которые ведут триггеры.
+    migrator.sql("""
+        CREATE TABLE IF NOT EXISTS book_reader_stats (
+            book_id          INTEGER PRIMARY KEY,
+            available_count  INTEGER NOT NULL DEFAULT 0,
+            next_due         DATE
+        );
+    """)
+
+    # ON CONFLICT, а не DELETE + INSERT: выдачи по одной книге идут из разных сессий одновременно
+    migrator.sql("""
+        CREATE OR REPLACE FUNCTION book_reader_stats_refresh(ids INTEGER[]) RETURNS void AS $$
+            INSERT INTO book_reader_stats (book_id, available_count, next_due)
+            SELECT c.book_id,
+                   COUNT(c.id) FILTER (WHERE c.status = 'available'),
+                   MIN(l.due_date)
+            FROM copies c
+            LEFT JOIN loans l ON l.copy_id = c.id AND l.status IN ('open', 'overdue')
+            WHERE c.book_id = ANY(ids)
+            GROUP BY c.book_id
+            ON CONFLICT (book_id) DO UPDATE
+                SET available_count = EXCLUDED.available_count,
+                    next_due = EXCLUDED.next_due;
+
+            DELETE FROM book_reader_stats s
+            WHERE s.book_id = ANY(ids)
+              AND NOT EXISTS (SELECT 1 FROM copies c WHERE c.book_id = s.book_id);
+        $$ LANGUAGE sql;
+    """)
+
+    migrator.sql("""
+        CREATE OR REPLACE FUNCTION book_reader_stats_on_copies() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM book_reader_stats_refresh(ARRAY(SELECT DISTINCT book_id FROM new_rows));
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM book_reader_stats_refresh(ARRAY(SELECT DISTINCT book_id FROM old_rows));
+            ELSE
+                PERFORM book_reader_stats_refresh(ARRAY(
+                    SELECT book_id FROM new_rows UNION SELECT book_id FROM old_rows
+                ));
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+    migrator.sql("""
+        CREATE OR REPLACE FUNCTION book_reader_stats_on_loans() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM book_reader_stats_refresh(ARRAY(
+                    SELECT DISTINCT c.book_id FROM copies c JOIN new_rows n ON n.copy_id = c.id
+                ));
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM book_reader_stats_refresh(ARRAY(
+                    SELECT DISTINCT c.book_id FROM copies c JOIN old_rows o ON o.copy_id = c.id
+                ));
+            ELSE
+                PERFORM book_reader_stats_refresh(ARRAY(
+                    SELECT c.book_id FROM copies c JOIN new_rows n ON n.copy_id = c.id
+                    UNION
+                    SELECT c.book_id FROM copies c JOIN old_rows o ON o.copy_id = c.id
+                ));
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+    # триггеры уровня оператора с переходными таблицами: по одному событию на триггер
+    migrator.sql("""
+        DROP TRIGGER IF EXISTS book_reader_stats_copies_ins ON copies;
+        CREATE TRIGGER book_reader_stats_copies_ins AFTER INSERT ON copies
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION book_reader_stats_on_copies();
+
+        DROP TRIGGER IF EXISTS book_reader_stats_copies_upd ON copies;
+        CREATE TRIGGER book_reader_stats_copies_upd AFTER UPDATE ON copies
+            REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION book_reader_stats_on_copies();
+
+        DROP TRIGGER IF EXISTS book_reader_stats_copies_del ON copies;
+        CREATE TRIGGER book_reader_stats_copies_del AFTER DELETE ON copies
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION book_reader_stats_on_copies();
+
+        DROP TRIGGER IF EXISTS book_reader_stats_loans_ins ON loans;
+        CREATE TRIGGER book_reader_stats_loans_ins AFTER INSERT ON loans
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION book_reader_stats_on_loans();
+
+        DROP TRIGGER IF EXISTS book_reader_stats_loans_upd ON loans;
+        CREATE TRIGGER book_reader_stats_loans_upd AFTER UPDATE ON loans
+            REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION book_reader_stats_on_loans();
+
+        DROP TRIGGER IF EXISTS book_reader_stats_loans_del ON loans;
+        CREATE TRIGGER book_reader_stats_loans_del AFTER DELETE ON loans
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION book_reader_stats_on_loans();
+    """)
+
+    # начальное заполнение по уже существующим экземплярам
+    migrator.sql("""
+        SELECT book_reader_stats_refresh(ARRAY(SELECT DISTINCT book_id FROM copies));
+    """)
+
+
+def rollback(migrator: Migrator, database, fake=False, **kwargs):
+    migrator.sql("DROP TRIGGER IF EXISTS book_reader_stats_loans_del ON loans;")
+    migrator.sql("DROP TRIGGER IF EXISTS book_reader_stats_loans_upd ON loans;")
+    migrator.sql("DROP TRIGGER IF EXISTS book_reader_stats_loans_ins ON loans;")
+    migrator.sql("DROP TRIGGER IF EXISTS book_reader_stats_copies_del ON copies;")
+    migrator.sql("DROP TRIGGER IF EXISTS book_reader_stats_copies_upd ON copies;")
+    migrator.sql("DROP TRIGGER IF EXISTS book_reader_stats_copies_ins ON copies;")
+    migrator.sql("DROP FUNCTION IF EXISTS book_reader_stats_on_loans();")
+    migrator.sql("DROP FUNCTION IF EXISTS book_reader_stats_on_copies();")
+    migrator.sql("DROP FUNCTION IF EXISTS book_reader_stats_refresh(INTEGER[]);")
+    migrator.sql("DROP TABLE IF EXISTS book_reader_stats;")
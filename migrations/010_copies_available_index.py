@@ -0,0 +1,15 @@
+from peewee_migrate import Migrator
+
+
+def migrate(migrator: Migrator, database, fake=False, **kwargs):
+    # Свободные экземпляры книги по филиалам (окно резерва, выбор экземпляра для резерва):
+    # book_id = ? AND status = 'available', дальше join по location_id
+    migrator.sql("""
+        CREATE INDEX IF NOT EXISTS ix_copies_book_avail
+        ON copies(book_id, location_id)
+        WHERE status = 'available';
+    """)
+
+
+def rollback(migrator: Migrator, database, fake=False, **kwargs):
+    migrator.sql("DROP INDEX IF EXISTS ix_copies_book_avail;")
@@ -0,0 +1,20 @@
+from peewee_migrate import Migrator
+
+
+def migrate(migrator: Migrator, database, fake=False, **kwargs):
+    # Резервы читателя: WHERE reader_id = ? ORDER BY created_at DESC
+    migrator.sql("""
+        CREATE INDEX IF NOT EXISTS ix_reservations_reader_created
+        ON reservations(reader_id, created_at DESC);
+    """)
+
+    # Все резервы для библиотекаря: ORDER BY created_at DESC LIMIT/OFFSET
+    migrator.sql("""
+        CREATE INDEX IF NOT EXISTS ix_reservations_created
+        ON reservations(created_at DESC);
+    """)
+
+
+def rollback(migrator: Migrator, database, fake=False, **kwargs):
+    migrator.sql("DROP INDEX IF EXISTS ix_reservations_created;")
+    migrator.sql("DROP INDEX IF EXISTS ix_reservations_reader_created;")
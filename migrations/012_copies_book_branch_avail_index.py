@@ -0,0 +1,22 @@
+from peewee_migrate import Migrator
+
+
+def migrate(migrator: Migrator, database, fake=False, **kwargs):
+    # Выбор экземпляра для резерва: book_id, location_id филиала, ORDER BY id LIMIT 1 FOR UPDATE.
+    # id в конце ключа — внутри локации экземпляры уже по порядку; индекс покрывает и
+    # ix_copies_book_avail (book_id, location_id), поэтому тот больше не нужен
+    migrator.sql("""
+        CREATE INDEX IF NOT EXISTS ix_copies_book_branch_avail
+        ON copies(book_id, location_id, id)
+        WHERE status = 'available';
+    """)
+    migrator.sql("DROP INDEX IF EXISTS ix_copies_book_avail;")
+
+
+def rollback(migrator: Migrator, database, fake=False, **kwargs):
+    migrator.sql("""
+        CREATE INDEX IF NOT EXISTS ix_copies_book_avail
+        ON copies(book_id, location_id)
+        WHERE status = 'available';
+    """)
+    migrator.sql("DROP INDEX IF EXISTS ix_copies_book_branch_avail;")
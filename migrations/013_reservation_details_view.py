@@ -0,0 +1,35 @@
+from peewee_migrate import Migrator
+
+
+def migrate(migrator: Migrator, database, fake=False, **kwargs):
+    # Резерв со всеми полями для списков читателя и библиотекаря — одна форма запроса на оба списка.
+    # users через LEFT JOIN по первичному ключу: если колонки читателя не выбраны (список читателя),
+    # планировщик выкидывает это соединение
+    migrator.sql("""
+        CREATE OR REPLACE VIEW v_reservation_details AS
+        SELECT r.id,
+               r.reader_id,
+               r.status,
+               r.pickup_date,
+               r.created_at,
+               r.expires_at,
+               r.extended_once,
+               b.id AS book_id,
+               b.title AS book_title,
+               c.inventory_code AS inv,
+               br.name AS branch_name,
+               br.address AS branch_address,
+               CONCAT(br.name, ' | ', br.address) AS branch_display,
+               u.full_name AS reader_name,
+               u.phone AS reader_phone,
+               u.login AS reader_login
+        FROM reservations r
+        JOIN copies c ON c.id = r.copy_id
+        JOIN books b ON b.id = c.book_id
+        JOIN branches br ON br.id = r.branch_id
+        LEFT JOIN users u ON u.id = r.reader_id;
+    """)
+
+
+def rollback(migrator: Migrator, database, fake=False, **kwargs):
+    migrator.sql("DROP VIEW IF EXISTS v_reservation_details;")
@@ -0,0 +1,13 @@
+from peewee_migrate import Migrator
+
+
+def migrate(migrator: Migrator, database, fake=False, **kwargs):
+    # Эти индексы 001_initial создавал из Meta.indexes моделей — ровно те же колонки,
+    # что у ix_copies_book_status и ix_loans_copy_status_due из 004; остаются только индексы 004
+    migrator.sql("DROP INDEX IF EXISTS copy_book_id_status;")
+    migrator.sql("DROP INDEX IF EXISTS loan_copy_id_status_due_date;")
+
+
+def rollback(migrator: Migrator, database, fake=False, **kwargs):
+    # дубликаты не восстанавливаем: индексы 004 покрывают те же запросы
+    pass
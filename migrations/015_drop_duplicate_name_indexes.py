@@ -0,0 +1,13 @@
+from peewee_migrate import Migrator
+
+
+def migrate(migrator: Migrator, database, fake=False, **kwargs):
+    # Эти индексы 001_initial создавал из Meta.indexes моделей — дубли books_title_idx и
+    # authors_full_name_idx из 007; остаются только индексы 007
+    migrator.sql("DROP INDEX IF EXISTS book_title;")
+    migrator.sql("DROP INDEX IF EXISTS author_full_name;")
+
+
+def rollback(migrator: Migrator, database, fake=False, **kwargs):
+    # дубликаты не восстанавливаем: индексы 007 покрывают те же запросы
+    pass
@@ -0,0 +1,30 @@
+from peewee_migrate import Migrator
+
+
+def migrate(migrator: Migrator, database, fake=False, **kwargs):
+    # Для баз, где 008 уже применена со старым телом (DELETE + INSERT): две сессии, правящие авторов
+    # одной книги, могли обе удалить строку и обе вставить — нарушение первичного ключа
+    migrator.sql("""
+        CREATE OR REPLACE FUNCTION book_authors_agg_refresh(ids INTEGER[]) RETURNS void AS $$
+            INSERT INTO book_authors_agg (book_id, authors, author_ids)
+            SELECT ba.book_id,
+                   string_agg(a.full_name, ', ' ORDER BY a.full_name),
+                   array_agg(a.id ORDER BY a.full_name)
+            FROM book_authors ba
+            JOIN authors a ON a.id = ba.author_id
+            WHERE ba.book_id = ANY(ids)
+            GROUP BY ba.book_id
+            ON CONFLICT (book_id) DO UPDATE
+                SET authors = EXCLUDED.authors,
+                    author_ids = EXCLUDED.author_ids;
+
+            DELETE FROM book_authors_agg g
+            WHERE g.book_id = ANY(ids)
+              AND NOT EXISTS (SELECT 1 FROM book_authors ba WHERE ba.book_id = g.book_id);
+        $$ LANGUAGE sql;
+    """)
+
+
+def rollback(migrator: Migrator, database, fake=False, **kwargs):
+    # тело функции откатывается вместе с 008; здесь оставляем безопасный вариант
+    pass